@@ -0,0 +1,140 @@
+"""
+CloudBase RAG — Answer cache
+
+In-memory cache of finished answers (with their sources) in front of the
+query engines. A lookup first tries the normalized query text, then the
+most similar cached query embedding above a threshold. Entries are scoped
+by prompt id and index version, expire after a TTL and are evicted in
+least-recently-used order; replacing a prompt purges its entries.
+
+Semantic hits are opt-in: questions that differ only in an entity ("price
+of Professional" vs "price of Starter") can score above 0.95 with small
+embedding models, and would silently get each other's answer.
+
+Settings:
+    RAG_ANSWER_CACHE_SIZE        max entries (0 disables the cache)
+    RAG_ANSWER_CACHE_TTL         seconds an answer stays valid
+    RAG_ANSWER_CACHE_SIMILARITY  cosine threshold for semantic hits (default 0 = exact only)
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+ANSWER_CACHE_SIZE = int(os.getenv("RAG_ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("RAG_ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("RAG_ANSWER_CACHE_SIMILARITY", "0"))
+
+
+def normalize_query(query: str) -> str:
+    text = re.sub(r"\s+", " ", query.strip().lower())
+    return text.rstrip("?!. ")
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_SIZE,
+        ttl_seconds: float = ANSWER_CACHE_TTL,
+        similarity_threshold: float = ANSWER_CACHE_SIMILARITY,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()  # (prompt, version, normalized) -> entry
+        self._matrices = {}  # (prompt, version) -> (keys, unit embedding matrix)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @property
+    def semantic(self) -> bool:
+        return self.enabled and self.similarity_threshold > 0
+
+    def _expired(self, entry: dict) -> bool:
+        return time.monotonic() - entry["stored_at"] > self.ttl_seconds
+
+    def get_exact(self, query: str, prompt_id: str, version: int) -> dict | None:
+        key = (prompt_id, version, normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry["payload"]
+
+    def get_similar(self, embedding: list, prompt_id: str, version: int) -> dict | None:
+        scope = (prompt_id, version)
+        with self._lock:
+            keys, matrix = self._scope_matrix(scope)
+            if not keys:
+                return None
+            query = np.asarray(embedding, dtype=np.float32)
+            scores = matrix @ (query / (np.linalg.norm(query) or 1.0))
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity_threshold:
+                return None
+            key = keys[best]
+            entry = self._entries[key]
+            if self._expired(entry):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry["payload"]
+
+    def put(self, query: str, prompt_id: str, version: int, embedding: list | None, payload: dict):
+        if not self.enabled:
+            return
+        key = (prompt_id, version, normalize_query(query))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                "payload": payload,
+                "embedding": None if embedding is None else np.asarray(embedding, dtype=np.float32),
+                "stored_at": time.monotonic(),
+            }
+            self._matrices.pop(key[:2], None)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def purge(self, prompt_id: str) -> int:
+        """Drop the entries of prompt_id (in every synthesis scope, "<id>|<mode>");
+        returns how many were dropped."""
+        with self._lock:
+            keys = [k for k in self._entries if k[0] == prompt_id or k[0].startswith(f"{prompt_id}|")]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: tuple):
+        del self._entries[key]
+        self._matrices.pop(key[:2], None)
+
+    def _scope_matrix(self, scope: tuple) -> tuple:
+        """Stacked unit-length embeddings of one scope, rebuilt after changes."""
+        cached = self._matrices.get(scope)
+        if cached is None:
+            keys = [
+                k for k, e in self._entries.items()
+                if k[:2] == scope and e["embedding"] is not None
+            ]
+            if keys:
+                matrix = np.stack([self._entries[k]["embedding"] for k in keys])
+                matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            else:
+                matrix = np.empty((0, 0), dtype=np.float32)
+            cached = self._matrices[scope] = (keys, matrix)
+        return cached
@@ -0,0 +1,120 @@
+"""
+CloudBase RAG — Vector store benchmark
+
+Recall@k vs query latency of the vector store backends on synthetic,
+clustered unit embeddings (bge-small dimensionality). The brute-force
+SimpleVectorStore is the baseline; recall is measured against the exact
+top k. Sweeps HNSW ef_search to show the recall/latency trade-off.
+
+Usage:
+    python bench_ann.py --vectors 100000 --queries 200 --top-k 5
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.simple import SimpleVectorStore
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from stats import percentile
+from vector_store import AnnVectorStore, hnswlib
+
+
+def make_vectors(num: int, dim: int, clusters: int, seed: int = 42) -> np.ndarray:
+    """Clustered points in a 32-dim subspace projected up to dim. Like real
+    text embeddings they have a low intrinsic dimension; uniform noise in
+    384 dims has no neighbourhood structure for any ANN index to exploit."""
+    rng = np.random.default_rng(seed)
+    latent_dim = 32
+    centres = rng.standard_normal((clusters, latent_dim))
+    latent = centres[rng.integers(0, clusters, num)] + 0.5 * rng.standard_normal((num, latent_dim))
+    vectors = (latent @ rng.standard_normal((latent_dim, dim))).astype(np.float32)
+    vectors += 0.5 * rng.standard_normal((num, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_nodes(vectors: np.ndarray) -> list:
+    return [
+        TextNode(id_=f"node-{i}", text="", embedding=v.tolist())
+        for i, v in enumerate(vectors)
+    ]
+
+
+def measure(store, queries: np.ndarray, truth: list, top_k: int) -> dict:
+    latencies, recalls = [], []
+    for q, expected in zip(queries, truth):
+        start = time.perf_counter()
+        result = store.query(VectorStoreQuery(query_embedding=q.tolist(), similarity_top_k=top_k))
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len(set(result.ids) & expected) / top_k)
+    return {
+        "recall": statistics.mean(recalls),
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--baseline-queries", type=int, default=20,
+                        help="queries for the (slow) SimpleVectorStore baseline")
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Generating {args.vectors} vectors (dim {args.dim}, {args.clusters} clusters)...")
+    vectors = make_vectors(args.vectors, args.dim, args.clusters)
+    rng = np.random.default_rng(7)
+    queries = vectors[rng.integers(0, args.vectors, args.queries)]
+    queries = queries + 0.2 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.top_k]
+    truth = [{f"node-{i}" for i in row} for row in exact]
+    nodes = make_nodes(vectors)
+
+    rows = []
+
+    def run(name: str, store, num_queries: int | None = None):
+        start = time.perf_counter()
+        store.add(nodes)
+        if isinstance(store, AnnVectorStore) and store.backend == "hnsw":
+            store.query(VectorStoreQuery(query_embedding=queries[0].tolist()))  # builds the graph
+        build = time.perf_counter() - start
+        n = num_queries or len(queries)
+        rows.append({"name": name, "build": build, **measure(store, queries[:n], truth[:n], args.top_k)})
+        print(f"  {name:<22} done")
+
+    print("Running backends...")
+    tmp = tempfile.TemporaryDirectory()
+    run("simple (brute force)", SimpleVectorStore(), args.baseline_queries)
+    run("flat float32", AnnVectorStore(persist_dir=f"{tmp.name}/f32", backend="flat", dtype="float32"))
+    run("flat float16", AnnVectorStore(persist_dir=f"{tmp.name}/f16", backend="flat", dtype="float16"))
+    if hnswlib is None:
+        print("  hnswlib not installed — skipping HNSW (pip install hnswlib)")
+    else:
+        hnsw = AnnVectorStore(persist_dir=f"{tmp.name}/hnsw", backend="hnsw")
+        run(f"hnsw M={hnsw.m}", hnsw)
+        for ef in (16, 32, 64, 128, 256):
+            hnsw.ef_search = ef
+            rows.append({"name": f"  ef_search={ef}", "build": None,
+                         **measure(hnsw, queries, truth, args.top_k)})
+
+    print(f"\n{'='*72}")
+    print(f"  VECTOR STORE BENCHMARK ({args.vectors} vectors, top {args.top_k})")
+    print(f"{'='*72}")
+    print(f"  {'backend':<22} {'build s':>8} {'recall@k':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for r in rows:
+        build = f"{r['build']:.1f}" if r["build"] is not None else ""
+        print(f"  {r['name']:<22} {build:>8} {r['recall']:>9.3f} {r['p50']:>9.2f} {r['p95']:>9.2f}")
+    print(f"{'='*72}")
+
+
+if __name__ == "__main__":
+    main()
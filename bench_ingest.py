@@ -0,0 +1,89 @@
+"""
+CloudBase RAG — Ingestion benchmark
+
+Generates a synthetic corpus of markdown files, runs a cold index build
+through the batched ingestion pipeline and reports nodes/sec per stage
+(parse, chunk, embed, insert). Use it to size hardware and to tune
+RAG_EMBED_BATCH_SIZE / RAG_EMBED_THREADS.
+
+Usage:
+    python bench_ingest.py --files 10000 --batch-size 256 --threads 2
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from llama_index.core import Settings, SimpleDirectoryReader, VectorStoreIndex
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+from ingestion import chunk_documents, configure_torch_threads, embed_nodes
+
+WORDS = (
+    "CloudBase Projekt Nutzer Team Abrechnung Rechnung Plan Starter Professional "
+    "Enterprise Speicher Integration Slack Jira Login Passwort Zwei-Faktor Admin "
+    "Berechtigung Export Import Frist Monat Jahr Kuendigung Support Ticket Vertrag "
+    "Daten Sicherheit Backup Version Dokument Freigabe Workflow Benachrichtigung"
+).split()
+
+
+def write_corpus(directory: str, num_files: int, seed: int = 42):
+    rng = random.Random(seed)
+    for i in range(num_files):
+        sections = []
+        for s in range(rng.randint(2, 5)):
+            sentences = [
+                " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))) + "."
+                for _ in range(rng.randint(4, 12))
+            ]
+            sections.append(f"## Abschnitt {s + 1}\n\n" + " ".join(sentences))
+        with open(os.path.join(directory, f"artikel-{i:05d}.md"), "w", encoding="utf-8") as f:
+            f.write(f"# Artikel {i}\n\n" + "\n\n".join(sections) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--threads", type=int, default=2)
+    args = parser.parse_args()
+
+    Settings.embed_model = HuggingFaceEmbedding(
+        model_name="BAAI/bge-small-en-v1.5", embed_batch_size=args.batch_size
+    )
+    Settings.chunk_size = 512
+    Settings.chunk_overlap = 50
+    configure_torch_threads(args.threads)
+
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        print(f"Generating {args.files} markdown files...")
+        write_corpus(corpus_dir, args.files)
+
+        t0 = time.perf_counter()
+        documents = SimpleDirectoryReader(corpus_dir).load_data()
+        t1 = time.perf_counter()
+        nodes = chunk_documents(documents)
+        t2 = time.perf_counter()
+        embed_nodes(nodes, batch_size=args.batch_size, num_threads=args.threads)
+        t3 = time.perf_counter()
+        VectorStoreIndex(nodes=nodes)
+        t4 = time.perf_counter()
+
+    n = len(nodes)
+    total = t4 - t0
+    print(f"\n{'='*60}")
+    print(f"  COLD BUILD ({args.files} files, {n} nodes)")
+    print(f"  batch size {args.batch_size}, {args.threads} threads, {os.cpu_count()} CPUs")
+    print(f"{'='*60}")
+    print(f"  Parse   : {t1-t0:8.2f} s")
+    print(f"  Chunk   : {t2-t1:8.2f} s  ({n/(t2-t1):,.0f} nodes/s)")
+    print(f"  Embed   : {t3-t2:8.2f} s  ({n/(t3-t2):,.0f} nodes/s)")
+    print(f"  Insert  : {t4-t3:8.2f} s  ({n/(t4-t3):,.0f} nodes/s)")
+    print(f"  Total   : {total:8.2f} s  ({n/total:,.0f} nodes/s end-to-end)")
+    print(f"{'='*60}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+CloudBase RAG — Load benchmark
+
+Fires concurrent /query_with_context requests at the RAG server and
+reports latency percentiles (p50/p95/p99) and throughput (QPS).
+
+The golden questions are cycled with a request number appended, so every
+request is a distinct question and goes through retrieval and synthesis
+instead of being an exact answer cache hit. Answers the server still
+serves from its cache (semantic hits, see RAG_ANSWER_CACHE_SIMILARITY) are
+counted and timed separately from the percentiles.
+
+To measure our own overhead without paying for (or waiting on) OpenAI,
+start the bundled stub LLM and point the server at it:
+
+Usage:
+    python bench_load.py stub-llm --port 8001 --latency-ms 800
+    OPENAI_API_BASE=http://127.0.0.1:8001/v1 uvicorn main:app --port 8000
+    python bench_load.py run --requests 200 --concurrency 32
+
+The stub keeps the OpenAI client in the measurement. To leave out the
+provider entirely (no API key, no network, no torch), use the in-process
+stand-ins of providers.py instead:
+    RAG_LLM_PROVIDER=mock RAG_EMBED_PROVIDER=hashing uvicorn main:app --port 8000
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from stats import percentile
+
+BASE_URL = "http://127.0.0.1:8000"
+INPUT_CSV = "cloudbase-testfragen.csv"
+
+STUB_ANSWER = (
+    "Laut Kontext kostet der Professional Plan 49 Euro pro Monat und Nutzer "
+    "bei monatlicher Abrechnung."
+)
+
+
+# ---------------------------------------------------------------------------
+# Stub LLM — minimal OpenAI-compatible chat completions endpoint
+# ---------------------------------------------------------------------------
+
+def create_stub_app(latency_ms: float, jitter_ms: float, token_ms: float = 20):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import StreamingResponse
+
+    stub = FastAPI()
+
+    def stream_chunks(model: str, delay: float):
+        async def gen():
+            await asyncio.sleep(delay)
+            chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+            for word in STUB_ANSWER.split():
+                chunk = {
+                    "id": chunk_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(token_ms / 1000)
+            yield "data: [DONE]\n\n"
+        return gen()
+
+    @stub.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        delay = max(0.0, random.gauss(latency_ms, jitter_ms)) / 1000
+        if body.get("stream"):
+            return StreamingResponse(
+                stream_chunks(body.get("model", "stub"), delay), media_type="text/event-stream"
+            )
+        await asyncio.sleep(delay)
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+        completion_tokens = len(STUB_ANSWER.split())
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": STUB_ANSWER},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    return stub
+
+
+def run_stub_llm(args):
+    import uvicorn
+
+    print(f"Stub LLM on http://127.0.0.1:{args.port}/v1 "
+          f"(latency {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms, {args.token_ms:.0f} ms/token streamed)")
+    uvicorn.run(create_stub_app(args.latency_ms, args.jitter_ms, args.token_ms),
+                host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# ---------------------------------------------------------------------------
+# Load generator
+# ---------------------------------------------------------------------------
+
+def load_questions() -> list:
+    with open(INPUT_CSV, encoding="utf-8") as f:
+        reader = csv.DictReader(f, delimiter=";")
+        return [row["frage"].strip() for row in reader if row.get("frage", "").strip()]
+
+
+def run_load(args):
+    try:
+        requests.get(f"{args.base_url}/", timeout=5)
+    except requests.exceptions.RequestException:
+        print("ERROR: RAG server is not running!")
+        print("Start it with: uvicorn main:app --host 127.0.0.1 --port 8000")
+        sys.exit(1)
+
+    questions = load_questions()
+    latencies = []
+    cache_hits = []
+    errors = []
+    lock = threading.Lock()
+
+    def fire(i: int):
+        # Unique per request: the answer cache would otherwise serve every repeat
+        question = f"{questions[i % len(questions)]} (Anfrage {i + 1})"
+        start = time.perf_counter()
+        try:
+            resp = requests.get(f"{args.base_url}/query_with_context",
+                                params={"query": question}, timeout=args.timeout)
+            resp.raise_for_status()
+            cached = resp.json().get("cache", "miss") != "miss"
+        except (requests.exceptions.RequestException, ValueError) as e:
+            with lock:
+                errors.append(str(e))
+            return
+        with lock:
+            (cache_hits if cached else latencies).append(time.perf_counter() - start)
+
+    print(f"Sending {args.requests} requests with concurrency {args.concurrency}...")
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(fire, range(args.requests)))
+    wall = time.perf_counter() - wall_start
+
+    print(f"\n{'='*60}")
+    print(f"  LOAD SUMMARY ({args.requests} requests, concurrency {args.concurrency})")
+    print(f"{'='*60}")
+    print(f"  Succeeded  : {len(latencies) + len(cache_hits)}")
+    print(f"  Failed     : {len(errors)}")
+    if cache_hits:
+        print(f"  Cache hits : {len(cache_hits)} (p50 {percentile(cache_hits, 50)*1000:.0f} ms, "
+              f"not in the percentiles below)")
+    if latencies:
+        print(f"  p50        : {percentile(latencies, 50)*1000:.0f} ms")
+        print(f"  p95        : {percentile(latencies, 95)*1000:.0f} ms")
+        print(f"  p99        : {percentile(latencies, 99)*1000:.0f} ms")
+        print(f"  mean       : {statistics.mean(latencies)*1000:.0f} ms")
+    print(f"  Wall time  : {wall:.2f} s")
+    print(f"  Throughput : {(len(latencies) + len(cache_hits))/wall:.2f} QPS")
+    print(f"{'='*60}")
+    if errors:
+        print(f"  First error: {errors[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    stub = sub.add_parser("stub-llm", help="Run an OpenAI-compatible stub LLM")
+    stub.add_argument("--port", type=int, default=8001)
+    stub.add_argument("--latency-ms", type=float, default=800)
+    stub.add_argument("--jitter-ms", type=float, default=100)
+    stub.add_argument("--token-ms", type=float, default=20, help="delay between streamed tokens")
+    stub.set_defaults(func=run_stub_llm)
+
+    run = sub.add_parser("run", help="Fire concurrent requests at the RAG server")
+    run.add_argument("--base-url", default=BASE_URL)
+    run.add_argument("--requests", type=int, default=100)
+    run.add_argument("--concurrency", type=int, default=16)
+    run.add_argument("--timeout", type=float, default=120)
+    run.set_defaults(func=run_load)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
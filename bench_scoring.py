@@ -0,0 +1,132 @@
+"""
+CloudBase RAG — Scoring benchmark
+
+Rows/sec of the batched scoring in scoring.py against the row-by-row
+check_retrieval / check_keywords it replaced, on a synthetic results table:
+answers assembled from sentences of the documents in data/, and the expected
+documents and keywords of the golden dataset, cycled to --rows rows.
+Both must produce identical results.
+
+Usage:
+    python bench_scoring.py --rows 50000
+"""
+
+import argparse
+import glob
+import os
+import random
+import re
+import time
+
+import pandas as pd
+
+from scoring import score_table
+
+INPUT_CSV = "cloudbase-testfragen.csv"
+DATA_DIR = "data"
+
+
+# The row-by-row scoring of run_evaluation.py before scoring.py (baseline)
+def check_retrieval(expected_doc: str, retrieved_filenames: list) -> bool:
+    expected_doc = expected_doc.strip()
+    if expected_doc.upper() == "KEINE":
+        return True
+    expected_docs = [d.strip() for d in expected_doc.split("|")]
+    return any(doc in retrieved_filenames for doc in expected_docs)
+
+
+def check_keywords(expected_keywords: str, answer: str) -> tuple:
+    if not expected_keywords.strip():
+        return [], [], 1.0
+    keywords = [kw.strip() for kw in expected_keywords.split(",") if kw.strip()]
+    answer_lower = answer.lower()
+    found = [kw for kw in keywords if kw.lower() in answer_lower]
+    missing = [kw for kw in keywords if kw.lower() not in answer_lower]
+    ratio = len(found) / len(keywords) if keywords else 1.0
+    return found, missing, ratio
+
+
+def score_rows(df: pd.DataFrame) -> pd.DataFrame:
+    results = []
+    for _, row in df.iterrows():
+        retrieved = [f.strip() for f in row["retrieved_files"].split(",") if f.strip()]
+        hit = check_retrieval(row["erwartetes_dokument"], retrieved)
+        found, missing, ratio = check_keywords(row["erwartete_keywords"], row["rag_answer"])
+        results.append({
+            **row,
+            "retrieval_hit": "TRUE" if hit else "FALSE",
+            "keyword_found": ", ".join(found),
+            "keyword_missing": ", ".join(missing),
+            "keyword_score": f"{ratio:.2f}",
+        })
+    return pd.DataFrame(results)
+
+
+def make_table(rows: int, seed: int = 42) -> pd.DataFrame:
+    """rows synthetic results: each answer is 2-6 document sentences, with the
+    question's expected keywords mixed in about half the time."""
+    rng = random.Random(seed)
+    golden = pd.read_csv(INPUT_CSV, sep=";", dtype=str, keep_default_na=False)
+    documents = {}
+    for path in sorted(glob.glob(os.path.join(DATA_DIR, "**", "*.md"), recursive=True)):
+        with open(path, encoding="utf-8") as f:
+            sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+|\n+", f.read()) if len(s.strip()) > 20]
+        if sentences:
+            documents[os.path.basename(path)] = sentences
+    filenames = list(documents)
+
+    records = []
+    for i in range(rows):
+        question = golden.iloc[i % len(golden)]
+        retrieved = rng.sample(filenames, min(3, len(filenames)))
+        answer = [s for doc in retrieved for s in rng.sample(documents[doc], min(2, len(documents[doc])))]
+        keywords = [kw.strip() for kw in question["erwartete_keywords"].split(",") if kw.strip()]
+        answer += [kw for kw in keywords if rng.random() < 0.5]
+        rng.shuffle(answer)
+        records.append({
+            "frage": question["frage"],
+            "erwartetes_dokument": question["erwartetes_dokument"],
+            "erwartete_keywords": question["erwartete_keywords"],
+            "rag_answer": " ".join(answer),
+            "retrieved_files": ", ".join(retrieved),
+        })
+    return pd.DataFrame(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per method (best counts)")
+    args = parser.parse_args()
+
+    print(f"Generating {args.rows} result rows...")
+    df = make_table(args.rows)
+    columns = ["retrieval_hit", "keyword_found", "keyword_missing", "keyword_score"]
+
+    timings = {}
+    outputs = {}
+    for name, score in (("row by row (iterrows)", score_rows), ("batched (scoring.py)", score_table)):
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            outputs[name] = score(df)
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best
+        print(f"  {name:<24} done")
+
+    baseline, batched = (outputs[name][columns].reset_index(drop=True) for name in outputs)
+    mismatches = int((baseline != batched).any(axis=1).sum())
+
+    base_time = timings["row by row (iterrows)"]
+    print(f"\n{'='*60}")
+    print(f"  SCORING BENCHMARK ({args.rows} rows, best of {args.repeat})")
+    print(f"{'='*60}")
+    print(f"  {'method':<24} {'seconds':>9} {'rows/s':>11} {'speedup':>8}")
+    for name, seconds in timings.items():
+        print(f"  {name:<24} {seconds:>9.3f} {args.rows / seconds:>11,.0f} {base_time / seconds:>7.1f}x")
+    print(f"  Identical results : {'yes' if not mismatches else f'NO ({mismatches} rows differ)'}")
+    print(f"{'='*60}")
+
+
+if __name__ == "__main__":
+    main()
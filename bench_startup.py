@@ -0,0 +1,151 @@
+"""
+CloudBase RAG — Startup benchmark
+
+Builds a synthetic index of N chunks in the JSON format (SimpleVectorStore
++ docstore.json), converts a copy to the binary format of vector_store.py
+and measures, each in a fresh process, how long loading the index takes,
+the resident memory it costs and the latency of the first query.
+
+Usage:
+    python bench_startup.py --chunks 100000
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+WORDS = (
+    "CloudBase Projekt Nutzer Team Abrechnung Rechnung Plan Starter Professional "
+    "Enterprise Speicher Integration Slack Jira Login Passwort Zwei-Faktor Admin "
+    "Berechtigung Export Import Frist Monat Jahr Kuendigung Support Ticket Vertrag"
+).split()
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def build_json_index(persist_dir: str, num_chunks: int, dim: int, words: int):
+    import numpy as np
+    from llama_index.core import Settings, VectorStoreIndex
+    from llama_index.core.embeddings import MockEmbedding
+    from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+
+    Settings.embed_model = MockEmbedding(embed_dim=dim)
+    rng = random.Random(42)
+    vectors = np.random.default_rng(42).standard_normal((num_chunks, dim)).astype(np.float32)
+    nodes = []
+    for i in range(num_chunks):
+        doc_id = f"artikel-{i // 20:05d}.md"
+        node = TextNode(
+            id_=f"chunk-{i}",
+            text=" ".join(rng.choice(WORDS) for _ in range(words)),
+            metadata={"filename": doc_id},
+            embedding=vectors[i].tolist(),
+        )
+        node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=doc_id)
+        nodes.append(node)
+    index = VectorStoreIndex(nodes=nodes)
+    for doc_id in {n.ref_doc_id for n in nodes}:
+        index.docstore.set_document_hash(doc_id, doc_id)
+    index.storage_context.persist(persist_dir=persist_dir)
+
+
+def measure_load(args):
+    """Runs in a child process: load the index once and report JSON on stdout."""
+    import numpy as np
+    from llama_index.core import QueryBundle, Settings, StorageContext, load_index_from_storage
+    from llama_index.core.embeddings import MockEmbedding
+
+    from vector_store import load_vector_store
+
+    Settings.embed_model = MockEmbedding(embed_dim=args.dim)
+    baseline = rss_mb()
+    start = time.perf_counter()
+    storage_context = StorageContext.from_defaults(
+        persist_dir=args.dir, vector_store=load_vector_store(args.dir, args.backend)
+    )
+    index = load_index_from_storage(storage_context)
+    load = time.perf_counter() - start
+    rss = rss_mb() - baseline
+
+    query = np.random.default_rng(7).standard_normal(args.dim).tolist()
+    retriever = index.as_retriever(similarity_top_k=5)
+    start = time.perf_counter()
+    retriever.retrieve(QueryBundle("frage", embedding=query))
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    retriever.retrieve(QueryBundle("frage", embedding=query))
+    second = time.perf_counter() - start
+    print(json.dumps({"load": load, "rss": rss, "first": first, "second": second, "rss_after_query": rss_mb() - baseline}))
+
+
+def dir_size_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--words", type=int, default=60, help="words per chunk")
+    parser.add_argument("--load", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load:
+        measure_load(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_dir, binary_dir = os.path.join(tmp, "json"), os.path.join(tmp, "binary")
+        print(f"Building a JSON index with {args.chunks} chunks (dim {args.dim})...")
+        start = time.perf_counter()
+        build_json_index(json_dir, args.chunks, args.dim, args.words)
+        print(f"  built in {time.perf_counter() - start:.1f} s")
+
+        shutil.copytree(json_dir, binary_dir)
+        print("Converting a copy to the binary format...")
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, __file__, "--load", "--dir", binary_dir, "--backend", "flat", "--dim", str(args.dim)],
+            check=True, capture_output=True,
+        )
+        print(f"  converted (and loaded once) in {time.perf_counter() - start:.1f} s")
+
+        results = []
+        for name, directory, backend in (
+            ("json (simple)", json_dir, "simple"),
+            ("binary flat", binary_dir, "flat"),
+            ("binary hnsw", binary_dir, "hnsw"),  # builds and saves the graph
+            ("  saved graph", binary_dir, "hnsw"),
+        ):
+            out = subprocess.run(
+                [sys.executable, __file__, "--load", "--dir", directory, "--backend", backend, "--dim", str(args.dim)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            results.append((name, dir_size_mb(directory), json.loads(out.strip().splitlines()[-1])))
+
+    print(f"\n{'='*78}")
+    print(f"  STARTUP BENCHMARK ({args.chunks} chunks, dim {args.dim})")
+    print(f"{'='*78}")
+    print(f"  {'format':<15} {'disk MB':>8} {'load s':>8} {'RSS MB':>8} {'1st query ms':>13} {'2nd ms':>8} {'RSS after':>10}")
+    for name, disk, r in results:
+        print(f"  {name:<15} {disk:>8.0f} {r['load']:>8.2f} {r['rss']:>8.0f} {r['first']*1000:>13.1f} "
+              f"{r['second']*1000:>8.1f} {r['rss_after_query']:>10.0f}")
+    print(f"{'='*78}")
+
+
+if __name__ == "__main__":
+    main()
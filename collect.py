@@ -2,30 +2,46 @@
 CloudBase RAG — Collect answers
 
 Queries the RAG backend for every question in the golden dataset
-and saves answers with retrieved chunks for manual inspection.
+and saves answers with retrieved chunks for manual inspection, with the
+retrieval hit and keyword coverage of each (scored as in run_evaluation.py).
+
+Responses are also stored in cached_outputs.json, so a following
+run_evaluation.py / run_evaluation_llm.py run scores them without
+querying the RAG system again (see output_cache.py).
 
 Usage:
-    python collect.py
+    python collect.py [--concurrency 8] [--batch-size 16] [--prompt improved] [--refresh]
 
 Prerequisites:
     uvicorn main:app --host 127.0.0.1 --port 8000
 """
 
+import argparse
 import os
 import sys
 import pandas as pd
-import requests
 from tqdm import tqdm
 
-API_URL = "http://127.0.0.1:8000/query_with_context"
+from output_cache import OutputCache
+from rag_client import BASE_URL, RagClient, fetch_answers, resolve_cache_scope
+from scoring import score_table
+
 INPUT_CSV = "cloudbase-testfragen.csv"
 OUTPUT_CSV = "collected_answers.csv"
+PROMPT_ID = os.getenv("RAG_PROMPT", "")  # empty = server default
+SYNTHESIS = os.getenv("RAG_SYNTHESIS", "")  # empty = server default
 
 
-def query_rag(query: str) -> dict:
-    response = requests.get(API_URL, params={"query": query}, timeout=60)
-    response.raise_for_status()
-    return response.json()
+def parse_args():
+    parser = argparse.ArgumentParser(description="CloudBase RAG — Collect answers")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel RAG requests")
+    parser.add_argument("--prompt", default=PROMPT_ID, help="prompt id (default: server default)")
+    parser.add_argument("--synthesis", default=SYNTHESIS,
+                        help="synthesis mode, e.g. compact (default: server default)")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="questions per POST /query_batch request (0 = one request each)")
+    parser.add_argument("--refresh", action="store_true", help="ignore cached outputs and re-query")
+    return parser.parse_args()
 
 
 def format_chunks(sources: list) -> str:
@@ -40,45 +56,48 @@ def format_chunks(sources: list) -> str:
 
 
 def main():
+    args = parse_args()
+    client = RagClient(BASE_URL, prompt_id=args.prompt, synthesis=args.synthesis, concurrency=args.concurrency)
+
     # Pre-flight: check server is running
-    try:
-        requests.get("http://127.0.0.1:8000/query?query=ping", timeout=5)
-    except requests.exceptions.RequestException:
+    if not client.is_up():
         print("ERROR: RAG server is not running!")
         print("Start it with: uvicorn main:app --host 127.0.0.1 --port 8000")
         sys.exit(1)
+    outputs = OutputCache()
+    client.prompt_id, client.synthesis, fingerprint = resolve_cache_scope(client, outputs, offline=False)
 
     df = pd.read_csv(INPUT_CSV, sep=";")
     print(f"{len(df)} questions loaded from {INPUT_CSV}\n")
 
-    results = []
-    for _, row in tqdm(df.iterrows(), total=len(df), desc="Collecting answers"):
-        frage = row["frage"]
-        try:
-            response = query_rag(frage)
-        except (requests.exceptions.RequestException, ValueError) as e:
-            print(f"  ERROR querying '{frage[:60]}': {e}")
-            response = {"answer": f"ERROR: {e}", "sources": []}
-
-        sources = response.get("sources", [])
-        retrieved_files = [
-            os.path.basename(s.get("filename", "")) for s in sources if s.get("filename")
-        ]
-
-        results.append({
-            "frage": frage,
-            "warum": row.get("warum", ""),
-            "erwartete_antwort": row["erwartete_antwort"],
-            "erwartetes_dokument": row["erwartetes_dokument"],
-            "erwartete_keywords": row.get("erwartete_keywords", ""),
-            "rag_answer": response.get("answer", ""),
-            "retrieved_files": ", ".join(retrieved_files),
-            "retrieved_chunks": format_chunks(sources),
-        })
-
-    out = pd.DataFrame(results)
+    with tqdm(total=len(df), desc="Collecting answers") as bar:
+        responses = fetch_answers(
+            client,
+            df["frage"].tolist(),
+            args.concurrency,
+            cache=outputs,
+            fingerprint=fingerprint,
+            refresh=args.refresh,
+            batch_size=args.batch_size,
+            on_done=lambda i, data: bar.update(1),
+        )
+
+    for frage, response in zip(df["frage"], responses):
+        if response.get("answer", "").startswith("ERROR:"):
+            print(f"  ERROR querying '{frage[:60]}': {response['answer']}")
+
+    sources = [response.get("sources", []) for response in responses]
+    columns = ["frage", "warum", "erwartete_antwort", "erwartetes_dokument", "erwartete_keywords"]
+    out = df.reindex(columns=columns).fillna("")
+    out["rag_answer"] = [response.get("answer", "") for response in responses]
+    out["retrieved_files"] = [
+        ", ".join(os.path.basename(s["filename"]) for s in srcs if s.get("filename")) for srcs in sources
+    ]
+    out["retrieved_chunks"] = [format_chunks(srcs) for srcs in sources]
+    # Retrieval hit and keyword coverage, scored for the whole table at once
+    out = score_table(out)
     out.to_csv(OUTPUT_CSV, index=False, sep=";")
-    print(f"\nAnswers saved to {OUTPUT_CSV}")
+    print(f"\nAnswers saved to {OUTPUT_CSV} ({outputs.hits} served from {outputs.path})")
     print(f"You can review them in eval_review.html or open the CSV directly.")
 
 
@@ -0,0 +1,121 @@
+"""
+CloudBase RAG — Persistent embedding cache
+
+SQLite-backed cache of chunk embeddings keyed by
+(embed model, chunk_size, chunk_overlap, sha256 of the chunk text), so
+rebuilding the index after `make reset` only embeds chunks whose text
+actually changed. The cache lives outside ./storage and survives resets.
+Lookups (cold build, /ingest) are counted by result in
+rag_embedding_cache_lookups_total on /metrics.
+
+Settings:
+    RAG_EMBED_CACHE              path of the SQLite file ("" disables the cache)
+    RAG_EMBED_CACHE_MAX_ENTRIES  least-recently-used entries beyond this are evicted
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+import metrics
+
+EMBED_CACHE_PATH = os.getenv("RAG_EMBED_CACHE", "./cache/embeddings.sqlite")
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("RAG_EMBED_CACHE_MAX_ENTRIES", "500000"))
+
+EMBED_CACHE_LOOKUPS = metrics.counter(
+    "rag_embedding_cache_lookups_total",
+    "Chunk embedding cache lookups by result (hit, miss)",
+    labelnames=("result",),
+)
+
+
+class EmbeddingCache:
+    def __init__(self, path: str = EMBED_CACHE_PATH, max_entries: int = EMBED_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " embedding BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name: str, chunk_size: int, chunk_overlap: int, text: str) -> str:
+        text_hash = hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+        return f"{model_name}|{chunk_size}|{chunk_overlap}|{text_hash}"
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        """Return cached embeddings for the given keys; missing keys are absent."""
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, embedding FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+            misses = len(set(keys)) - len(found)
+            self.hits += len(found)
+            self.misses += misses
+        EMBED_CACHE_LOOKUPS.inc(len(found), result="hit")
+        EMBED_CACHE_LOOKUPS.inc(misses, result="miss")
+        return found
+
+    def put_many(self, items: dict[str, list[float]]):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, embedding, last_used) VALUES (?, ?, ?)",
+                [
+                    (key, np.asarray(emb, dtype=np.float32).tobytes(), now)
+                    for key, emb in items.items()
+                ],
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                " SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
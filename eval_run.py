@@ -0,0 +1,185 @@
+"""
+CloudBase RAG — Checkpointed evaluation runs
+
+run_evaluation.py and run_evaluation_llm.py append every scored question to
+their results CSV as soon as it is done, flushed right away, so a crash,
+timeout or Ctrl-C keeps everything written so far. Next to the CSV, a run
+manifest (<results>.run.json) records the run id, script, settings, index
+fingerprint, progress and status (running, interrupted, finished).
+
+--resume continues the run of the manifest: questions already in the CSV are
+skipped and the summary is recomputed from the CSV, so an interrupted run
+only costs the missing rows. A row cut off by the crash is dropped from the
+CSV and its question asked again. It refuses to resume if the prompt, synthesis
+mode, index fingerprint or dataset changed, since the rows would no longer
+be comparable.
+
+Questions are processed in chunks of --checkpoint-every: the answers of a
+chunk are fetched (and stored in the output cache) together, and memory use
+stays the same however large the dataset is.
+
+Usage (from a script):
+    run = EvalRun(OUTPUT_CSV, "run_evaluation.py", settings, resume=args.resume)
+    for chunk in run.chunks(rows, args.checkpoint_every):
+        ...
+        run.append(result_row)
+        run.checkpoint()
+    run.finish()
+    summary = summarize(run.rows())
+"""
+
+import csv
+import json
+import os
+import secrets
+import time
+from collections import Counter
+from datetime import datetime
+
+CHECKPOINT_EVERY = int(os.getenv("RAG_EVAL_CHECKPOINT_EVERY", "32"))
+
+# Settings a resumed run must share with the original one
+RESUME_KEYS = ("script", "input", "prompt", "synthesis", "fingerprint")
+
+
+def manifest_path(output_csv: str) -> str:
+    return os.path.splitext(output_csv)[0] + ".run.json"
+
+
+def drop_partial_row(output_csv: str) -> bool:
+    """Cut the CSV back to its last complete record; True if a partially
+    written one was removed. Answers can contain line breaks, so the records
+    are found by parsing the file rather than by its last line break."""
+    consumed = complete = 0
+    at_end = terminated = False
+    with open(output_csv, "rb") as f:
+        def lines():
+            nonlocal consumed, at_end, terminated
+            for line in f:
+                consumed += len(line)
+                terminated = line.endswith(b"\n")
+                yield line.decode("utf-8", errors="replace")
+            at_end = True
+
+        # csv.reader yields a record at the end of its last line. The record
+        # is partial if that line has no line break, or if it was only
+        # yielded at the end of the file (cut off inside a quoted field)
+        for _ in csv.reader(lines(), delimiter=";"):
+            if terminated and not at_end:
+                complete = consumed
+    if complete == consumed:
+        return False
+    os.truncate(output_csv, complete)
+    return True
+
+
+class EvalRun:
+    def __init__(self, output_csv: str, script: str, settings: dict, resume: bool = False):
+        """Start a run writing to output_csv, or continue the one recorded in
+        its manifest (resume). Raises ValueError if that is not possible."""
+        self.output_csv = output_csv
+        self.manifest_path = manifest_path(output_csv)
+        self._file = None
+        self._writer = None
+        self._done = Counter()
+        settings = {"script": script, **settings}
+
+        if resume:
+            if not os.path.exists(self.manifest_path):
+                raise ValueError(f"No run to resume ({self.manifest_path} not found).")
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+            changed = [
+                f"{key}: {self.manifest['settings'].get(key)!r} → {settings.get(key)!r}"
+                for key in RESUME_KEYS
+                if self.manifest["settings"].get(key) != settings.get(key)
+            ]
+            if changed:
+                raise ValueError(f"Cannot resume run {self.manifest['run_id']}, settings changed: {'; '.join(changed)}")
+            self.fieldnames = None
+            if os.path.exists(output_csv):
+                drop_partial_row(output_csv)
+                with open(output_csv, encoding="utf-8", newline="") as f:
+                    reader = csv.DictReader(f, delimiter=";")
+                    self.fieldnames = reader.fieldnames
+                    self._done.update(row["frage"].strip() for row in reader)
+            self.manifest["completed"] = sum(self._done.values())
+            self.manifest["resumed"] = self.manifest.get("resumed", 0) + 1
+        else:
+            self.fieldnames = None
+            if os.path.exists(output_csv):
+                os.remove(output_csv)
+            self.manifest = {
+                "run_id": datetime.now().strftime("%Y%m%d-%H%M%S-") + secrets.token_hex(3),
+                "output": output_csv,
+                "settings": settings,
+                "created_at": time.time(),
+                "completed": 0,
+                "resumed": 0,
+            }
+        self.manifest.update({"status": "running", "finished_at": None})
+        self.checkpoint()
+
+    @property
+    def run_id(self) -> str:
+        return self.manifest["run_id"]
+
+    @property
+    def completed(self) -> int:
+        return self.manifest["completed"]
+
+    def pending(self, rows: list) -> list[tuple[int, dict]]:
+        """(1-based position, row) of the questions this run has not finished yet."""
+        done = Counter(self._done)
+        pending = []
+        for i, row in enumerate(rows, 1):
+            question = row["frage"].strip()
+            if done[question] > 0:
+                done[question] -= 1
+            else:
+                pending.append((i, row))
+        return pending
+
+    def chunks(self, rows: list, size: int = CHECKPOINT_EVERY):
+        """The pending (position, row) pairs in chunks of size, in input order."""
+        self.manifest["questions"] = len(rows)
+        pending = self.pending(rows)
+        for start in range(0, len(pending), max(1, size)):
+            yield pending[start:start + max(1, size)]
+
+    def append(self, row: dict):
+        """Write one result row and flush it to disk."""
+        if self._writer is None:
+            is_new = self.fieldnames is None
+            self.fieldnames = self.fieldnames or list(row.keys())
+            self._file = open(self.output_csv, "a", encoding="utf-8", newline="")
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, delimiter=";", restval="")
+            if is_new:
+                self._writer.writeheader()
+        self._writer.writerow(row)
+        self._file.flush()
+        self.manifest["completed"] += 1
+
+    def checkpoint(self):
+        """Write the manifest (atomically, so it is never half-written)."""
+        self.manifest["updated_at"] = time.time()
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def finish(self, status: str = "finished"):
+        if self._file is not None:
+            self._file.close()
+            self._file = self._writer = None
+        self.manifest["status"] = status
+        if status == "finished":
+            self.manifest["finished_at"] = time.time()
+        self.checkpoint()
+
+    def rows(self):
+        """The result rows written so far, read back from the CSV one at a time."""
+        if not os.path.exists(self.output_csv):
+            return
+        with open(self.output_csv, encoding="utf-8", newline="") as f:
+            yield from csv.DictReader(f, delimiter=";")
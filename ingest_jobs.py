@@ -0,0 +1,179 @@
+"""
+CloudBase RAG — Ingestion jobs
+
+Status of the background jobs behind POST /ingest. Every job has a
+directory under uploads/ with the uploaded files (until they are indexed)
+and job.json, its status. GET /ingest/{job_id} reads that file, so any
+worker process can report on a job another one runs.
+
+A job goes queued → running (files parsed and embedded) → indexing
+(committed together with the other jobs that are ready) → done or failed.
+Each file has its own status: queued, parsing, embedding, embedded,
+indexing, then indexed, unchanged, superseded (a later upload of the same
+file won) or failed.
+
+job.json records the pid of the worker running the job. A job that worker
+can no longer finish — it crashed or was restarted — is marked failed by
+the next prune (at startup and on every upload): when the pid is gone, or
+was reused by a worker that doesn't run the job, or when the job has not
+been updated for RAG_INGEST_JOB_TIMEOUT seconds. Pruning then removes it
+like any other finished job.
+
+Settings:
+    RAG_INGEST_DIR          uploads and job status (default ./uploads)
+    RAG_INGEST_CONCURRENCY  files parsed and embedded at the same time (default 2)
+    RAG_INGEST_BATCH_FILES  max files committed with one persist (default 200)
+    RAG_INGEST_JOB_TTL      seconds finished jobs are kept (default 86400)
+    RAG_INGEST_JOB_TIMEOUT  seconds without progress before an unfinished job fails (default 3600)
+"""
+
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+INGEST_DIR = os.getenv("RAG_INGEST_DIR", "./uploads")
+INGEST_CONCURRENCY = int(os.getenv("RAG_INGEST_CONCURRENCY", "2"))
+INGEST_BATCH_FILES = int(os.getenv("RAG_INGEST_BATCH_FILES", "200"))
+INGEST_JOB_TTL = float(os.getenv("RAG_INGEST_JOB_TTL", "86400"))
+INGEST_JOB_TIMEOUT = float(os.getenv("RAG_INGEST_JOB_TIMEOUT", "3600"))
+
+JOB_FNAME = "job.json"
+FINISHED = ("done", "failed")
+PENDING_FILE_STATUSES = ("queued", "parsing", "embedding", "embedded", "indexing")
+_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class IngestJob:
+    def __init__(self):
+        self.job_id = uuid.uuid4().hex
+        self.status = "queued"
+        self.files = {}  # filename -> status dict
+        self.timings = {}
+        self.message = ""
+        self.index_version = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.pid = os.getpid()
+        self.prepared = {}  # filename -> (documents, embedded nodes), in memory only
+        os.makedirs(self.dir, exist_ok=True)
+
+    @property
+    def dir(self) -> str:
+        return os.path.join(INGEST_DIR, self.job_id)
+
+    def add_file(self, filename: str, status: str = "queued", **fields):
+        self.files[filename] = {"filename": filename, "status": status, **fields}
+
+    def update_file(self, filename: str, **fields):
+        self.files[filename].update(fields)
+
+    def add_timing(self, stage: str, seconds: float):
+        self.timings[stage] = round(self.timings.get(stage, 0.0) + seconds, 3)
+
+    def pending_files(self) -> list[str]:
+        return [name for name, f in self.files.items() if f["status"] == "queued"]
+
+    def to_dict(self) -> dict:
+        done = sum(1 for f in self.files.values() if f["status"] not in PENDING_FILE_STATUSES)
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "progress": {"files_done": done, "files_total": len(self.files)},
+            "files": list(self.files.values()),
+            "timings": self.timings,
+            "message": self.message,
+            "index_version": self.index_version,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "pid": self.pid,
+            "updated_at": time.time(),
+        }
+
+    def save(self):
+        path = os.path.join(self.dir, JOB_FNAME)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+
+    def remove_uploads(self):
+        for name in os.listdir(self.dir):
+            if name != JOB_FNAME:
+                os.remove(os.path.join(self.dir, name))
+        self.prepared = {}
+
+
+def load_job(job_id: str) -> dict | None:
+    """Status of a job from its job.json (whichever worker runs it)."""
+    if not _JOB_ID.match(job_id):
+        return None
+    try:
+        with open(os.path.join(INGEST_DIR, job_id, JOB_FNAME), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by another user
+    return True
+
+
+def is_orphaned(job: dict, running: set, timeout_seconds: float = INGEST_JOB_TIMEOUT) -> bool:
+    """Whether an unfinished job has no worker left to finish it. running
+    holds the ids of the jobs this process runs."""
+    if job["status"] in FINISHED or job["job_id"] in running:
+        return False
+    pid = job.get("pid")
+    if pid == os.getpid() or (pid is not None and not _pid_alive(pid)):
+        return True
+    updated_at = job.get("updated_at") or job.get("started_at") or job["created_at"]
+    return time.time() - updated_at > timeout_seconds
+
+
+def fail_job(job: dict, reason: str):
+    """Mark an orphaned job (and its unfinished files) failed and drop its uploads."""
+    now = time.time()
+    for f in job["files"]:
+        if f["status"] in PENDING_FILE_STATUSES:
+            f.update(status="failed", error=reason)
+    done = sum(1 for f in job["files"] if f["status"] not in PENDING_FILE_STATUSES)
+    job.update(
+        status="failed", message=f"Failed: {reason}", finished_at=now, updated_at=now,
+        progress={"files_done": done, "files_total": len(job["files"])},
+    )
+    job_dir = os.path.join(INGEST_DIR, job["job_id"])
+    path = os.path.join(job_dir, JOB_FNAME)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(job, f, ensure_ascii=False)
+    os.replace(f"{path}.tmp", path)
+    for name in os.listdir(job_dir):
+        if name != JOB_FNAME:
+            os.remove(os.path.join(job_dir, name))
+
+
+def prune_jobs(ttl_seconds: float = INGEST_JOB_TTL, running=()):
+    """Fail the jobs no worker will finish (see is_orphaned; running are the
+    ids of this process's jobs), then remove the directories of jobs that
+    finished more than ttl_seconds ago."""
+    if not os.path.isdir(INGEST_DIR):
+        return
+    running = set(running)
+    cutoff = time.time() - ttl_seconds
+    for job_id in os.listdir(INGEST_DIR):
+        job = load_job(job_id)
+        if job is None:
+            continue
+        if is_orphaned(job, running):
+            fail_job(job, f"interrupted, worker (pid {job.get('pid', '?')}) stopped before the job finished")
+        if job["status"] in FINISHED and (job["finished_at"] or 0) < cutoff:
+            shutil.rmtree(os.path.join(INGEST_DIR, job_id), ignore_errors=True)
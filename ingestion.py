@@ -0,0 +1,182 @@
+"""
+CloudBase RAG — Ingestion pipeline
+
+Chunks all documents first, embeds the resulting nodes in large batches
+(several batches in parallel on CPU) and hands them to the index in one
+bulk insert, and to the BM25 keyword index in the same pass. Used by
+main.py for the cold index build and for /ingest.
+
+Tuning:
+    RAG_EMBED_BATCH_SIZE  nodes per embedding call (default 256)
+    RAG_EMBED_THREADS     batches embedded in parallel (default 2)
+"""
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from llama_index.core import Settings, StorageContext, VectorStoreIndex
+from llama_index.core.schema import MetadataMode
+
+from embedding_cache import EmbeddingCache
+from keyword_index import KeywordIndex
+
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "256"))
+EMBED_THREADS = int(os.getenv("RAG_EMBED_THREADS", "2"))
+
+
+def configure_torch_threads(num_threads: int = EMBED_THREADS):
+    """Split the CPU cores between our worker threads so parallel batches
+    don't each spin up a full set of torch intra-op threads."""
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // max(1, num_threads)))
+
+
+def chunk_documents(documents: list, node_parser=None) -> list:
+    """Split documents into nodes with node_parser (default: the globally configured one)."""
+    return (node_parser or Settings.node_parser).get_nodes_from_documents(documents)
+
+
+def embed_nodes(
+    nodes: list,
+    batch_size: int = EMBED_BATCH_SIZE,
+    num_threads: int = EMBED_THREADS,
+    cache: EmbeddingCache | None = None,
+    chunk_size: int | None = None,
+    chunk_overlap: int | None = None,
+) -> list:
+    """Fill in node.embedding for every node that doesn't have one yet.
+    With a cache, only chunks whose text isn't cached go to the embed model;
+    chunk_size and chunk_overlap of the cache keys default to Settings'.
+    """
+    pending = [n for n in nodes if n.embedding is None]
+    if not pending:
+        return nodes
+
+    embed_model = Settings.embed_model
+    texts = {id(n): n.get_content(metadata_mode=MetadataMode.EMBED) for n in pending}
+
+    if cache is not None:
+        chunk_size = Settings.chunk_size if chunk_size is None else chunk_size
+        chunk_overlap = Settings.chunk_overlap if chunk_overlap is None else chunk_overlap
+        keys = {
+            id(n): cache.make_key(embed_model.model_name, chunk_size, chunk_overlap, texts[id(n)])
+            for n in pending
+        }
+        cached = cache.get_many(list(set(keys.values())))
+        for node in pending:
+            node.embedding = cached.get(keys[id(node)])
+        pending = [n for n in pending if n.embedding is None]
+
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+
+    def embed_batch(batch: list) -> list:
+        return embed_model.get_text_embedding_batch([texts[id(n)] for n in batch])
+
+    with ThreadPoolExecutor(max_workers=max(1, num_threads)) as pool:
+        for batch, embeddings in zip(batches, pool.map(embed_batch, batches)):
+            for node, embedding in zip(batch, embeddings):
+                node.embedding = embedding
+
+    if cache is not None:
+        cache.put_many({keys[id(n)]: n.embedding for n in pending})
+    return nodes
+
+
+def build_index(
+    documents: list,
+    cache: EmbeddingCache | None = None,
+    vector_store=None,
+    keywords: KeywordIndex | None = None,
+) -> VectorStoreIndex:
+    """Cold build: chunk everything, embed in batches, create the index in one go.
+    vector_store=None keeps LlamaIndex's default SimpleVectorStore.
+    """
+    nodes = embed_nodes(chunk_documents(documents), cache=cache)
+    storage_context = StorageContext.from_defaults(vector_store=vector_store)
+    index = VectorStoreIndex(nodes=nodes, storage_context=storage_context)
+    if keywords is not None:
+        keywords.add(nodes)
+    for doc in documents:
+        index.docstore.set_document_hash(doc.id_, doc.hash)
+    return index
+
+
+def stale_parts(docstore, documents: list) -> dict[str, list[str]]:
+    """Indexed documents of the uploaded files that their new version no
+    longer has, by filename. Files loaded in several parts (PDF pages) have
+    the ids "<filename>_part_0".."_part_N-1", single-part files the plain
+    filename (main.load_documents()); a re-upload with fewer parts, or going
+    from one to several parts or back, leaves the other ids behind."""
+    new_ids = {}
+    for doc in documents:
+        new_ids.setdefault(doc.metadata.get("filename", doc.id_), set()).add(doc.id_)
+    stale = {}
+    for filename, ids in new_ids.items():
+        candidates = [filename]
+        part = 0
+        while docstore.get_document_hash(f"{filename}_part_{part}") is not None:
+            candidates.append(f"{filename}_part_{part}")
+            part += 1
+        old = [doc_id for doc_id in candidates if doc_id not in ids and docstore.get_document_hash(doc_id) is not None]
+        if old:
+            stale[filename] = old
+    return stale
+
+
+def refresh_documents(
+    index: VectorStoreIndex,
+    documents: list,
+    cache: EmbeddingCache | None = None,
+    nodes: list | None = None,
+    keywords: KeywordIndex | None = None,
+) -> list[bool]:
+    """Batched equivalent of index.refresh_ref_docs().
+
+    New documents are inserted, changed ones have their old nodes removed
+    first, unchanged ones are skipped. Parts of an earlier version of a file
+    that the new one doesn't have are deleted (see stale_parts()), and the
+    file's documents count as reindexed. All new nodes are embedded together
+    and inserted with a single insert_nodes() call. nodes may hold already
+    embedded chunks of some of the documents; the others are chunked and
+    embedded here.
+    Returns one flag per document telling whether it was (re)indexed.
+    """
+    docstore = index.docstore
+    stale = stale_parts(docstore, documents)
+    for doc_id in (doc_id for ids in stale.values() for doc_id in ids):
+        index.delete_ref_doc(doc_id, delete_from_docstore=True)
+        docstore.delete_document(doc_id, raise_error=False)  # its hash, if the vector store holds the nodes
+        if keywords is not None:
+            keywords.delete(doc_id)
+
+    changed = []
+    for doc in documents:
+        existing_hash = docstore.get_document_hash(doc.id_)
+        if existing_hash == doc.hash:
+            continue
+        if existing_hash is not None:
+            index.delete_ref_doc(doc.id_, delete_from_docstore=True)
+            if keywords is not None:
+                keywords.delete(doc.id_)
+        changed.append(doc)
+
+    if changed:
+        ready = {}
+        for node in nodes or []:
+            ready.setdefault(node.ref_doc_id, []).append(node)
+        new_nodes = [node for doc in changed for node in ready.get(doc.id_, [])]
+        missing = [doc for doc in changed if doc.id_ not in ready]
+        if missing:
+            new_nodes += embed_nodes(chunk_documents(missing), cache=cache)
+        index.insert_nodes(new_nodes)
+        if keywords is not None:
+            keywords.add(new_nodes)
+        for doc in changed:
+            docstore.set_document_hash(doc.id_, doc.hash)
+
+    changed_ids = {doc.id_ for doc in changed}
+    return [doc.id_ in changed_ids or doc.metadata.get("filename", doc.id_) in stale for doc in documents]
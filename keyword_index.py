@@ -0,0 +1,314 @@
+"""
+CloudBase RAG — Keyword index
+
+BM25 inverted index over the chunks of the vector index, for questions a
+small embedding model answers poorly: exact strings (the login URL
+app.cloudbase.de/login), names ("Sabine Meier"), plan and feature names.
+It is filled in the same ingestion pass as the vector index, updated by
+/ingest (new chunks are added, replaced documents tombstoned and
+compacted away once they outnumber the live chunks) and persisted next to
+it as storage/keyword_index.npz.
+
+RAG_RETRIEVER picks the retriever behind the query engines: the dense
+vector retriever, BM25 alone, or both fused with reciprocal rank fusion
+(each list contributes 1 / (RAG_RRF_K + rank) per chunk). Every retriever
+reports its latency in rag_retriever_seconds.
+
+Settings:
+    RAG_RETRIEVER      vector (default), bm25 or hybrid
+    RAG_DENSE_TOP_K    dense candidates fused in hybrid mode (default: top-k)
+    RAG_BM25_TOP_K     keyword candidates fused in hybrid mode (default: top-k)
+    RAG_RRF_K          rank constant of reciprocal rank fusion (default 60)
+"""
+
+import asyncio
+import math
+import os
+import re
+import time
+
+import numpy as np
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+
+import metrics
+
+RETRIEVER = os.getenv("RAG_RETRIEVER", "vector")
+# 0 = as many candidates per retriever as the fused list returns
+DENSE_TOP_K = int(os.getenv("RAG_DENSE_TOP_K", "0"))
+BM25_TOP_K = int(os.getenv("RAG_BM25_TOP_K", "0"))
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+
+RETRIEVERS = ("vector", "bm25", "hybrid")
+KEYWORD_FNAME = "keyword_index.npz"
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+RETRIEVER_SECONDS = metrics.histogram(
+    "rag_retriever_seconds", "Retrieval latency by retriever", labelnames=("retriever",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+
+_WORD = re.compile(r"\w+")
+# URLs, e-mail addresses, hyphenated compounds: also indexed as a whole
+_COMPOUND = re.compile(r"\w+(?:[.\-/@:]\w+)+")
+
+
+def tokenize(text: str) -> list[str]:
+    text = text.casefold()
+    return _WORD.findall(text) + _COMPOUND.findall(text)
+
+
+class KeywordIndex:
+    """BM25 postings (chunk number and term frequency per term) over chunks."""
+
+    def __init__(self):
+        self.node_ids = []
+        self.ref_doc_ids = []
+        self.lengths = np.empty(0, dtype=np.int32)
+        self.deleted = set()
+        self.postings = {}  # term -> (chunk numbers, term frequencies)
+        self._ref_chunks = None
+        self._live = None
+
+    def __len__(self) -> int:
+        return len(self.node_ids) - len(self.deleted)
+
+    # -- updates --------------------------------------------------------------
+
+    def add(self, nodes: list):
+        start = len(self.node_ids)
+        new_postings, lengths = {}, []
+        for i, node in enumerate(nodes, start):
+            tokens = tokenize(node.get_content(metadata_mode=MetadataMode.EMBED))
+            lengths.append(len(tokens))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for term, tf in counts.items():
+                new_postings.setdefault(term, []).append((i, tf))
+            self.node_ids.append(node.node_id)
+            self.ref_doc_ids.append(node.ref_doc_id)
+            if self._ref_chunks is not None:
+                self._ref_chunks.setdefault(node.ref_doc_id, []).append(i)
+        for term, entries in new_postings.items():
+            chunks, tfs = np.array(entries, dtype=np.int32).T
+            if term in self.postings:
+                old_chunks, old_tfs = self.postings[term]
+                chunks, tfs = np.concatenate([old_chunks, chunks]), np.concatenate([old_tfs, tfs])
+            self.postings[term] = (chunks, tfs)
+        self.lengths = np.concatenate([self.lengths, np.array(lengths, dtype=np.int32)])
+        self._live = None
+
+    def delete(self, ref_doc_id: str):
+        if self._ref_chunks is None:
+            self._ref_chunks = {}
+            for i, doc_id in enumerate(self.ref_doc_ids):
+                self._ref_chunks.setdefault(doc_id, []).append(i)
+        self.deleted.update(self._ref_chunks.pop(ref_doc_id, []))
+        self._live = None
+
+    def _compact(self):
+        keep = np.array([i not in self.deleted for i in range(len(self.node_ids))], dtype=bool)
+        renumber = np.cumsum(keep, dtype=np.int32) - 1
+        postings = {}
+        for term, (chunks, tfs) in self.postings.items():
+            mask = keep[chunks]
+            if mask.any():
+                postings[term] = (renumber[chunks[mask]], tfs[mask])
+        self.postings = postings
+        self.node_ids = [n for n, k in zip(self.node_ids, keep) if k]
+        self.ref_doc_ids = [d for d, k in zip(self.ref_doc_ids, keep) if k]
+        self.lengths = self.lengths[keep]
+        self.deleted, self._ref_chunks, self._live = set(), None, None
+
+    # -- search ---------------------------------------------------------------
+
+    def search(self, query: str, top_k: int) -> list[tuple[str, float]]:
+        """(node id, BM25 score) of the best top_k chunks sharing a term with the query."""
+        if self._live is None:
+            live = np.ones(len(self.node_ids), dtype=bool)
+            if self.deleted:
+                live[list(self.deleted)] = False
+            self._live = (live, int(live.sum()), float(self.lengths[live].mean()) if live.any() else 0.0)
+        live, n, avgdl = self._live
+        if n == 0:
+            return []
+
+        scores = np.zeros(len(self.node_ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            chunks, tfs = self.postings[term]
+            mask = live[chunks]
+            chunks, tfs = chunks[mask], tfs[mask]
+            if not len(chunks):
+                continue
+            idf = math.log(1 + (n - len(chunks) + 0.5) / (len(chunks) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[chunks] / avgdl)
+            scores[chunks] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        k = min(top_k, len(hits))
+        top = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(self.node_ids[i], float(scores[i])) for i in top]
+
+    # -- persistence ----------------------------------------------------------
+
+    def persist(self, persist_dir: str):
+        if self.deleted and len(self.deleted) * 2 > len(self.node_ids):
+            self._compact()
+        terms = sorted(self.postings)
+        sizes = [len(self.postings[t][0]) for t in terms]
+        offsets = np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)])
+        empty = np.empty(0, dtype=np.int32)
+        path = os.path.join(persist_dir, KEYWORD_FNAME)
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez(
+                f,
+                node_ids=np.array(self.node_ids, dtype=str),
+                ref_doc_ids=np.array(self.ref_doc_ids, dtype=str),
+                lengths=self.lengths,
+                deleted=np.array(sorted(self.deleted), dtype=np.int64),
+                terms=np.array(terms, dtype=str),
+                offsets=offsets,
+                chunks=np.concatenate([self.postings[t][0] for t in terms]) if terms else empty,
+                tfs=np.concatenate([self.postings[t][1] for t in terms]) if terms else empty,
+            )
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, persist_dir: str) -> "KeywordIndex | None":
+        path = os.path.join(persist_dir, KEYWORD_FNAME)
+        if not os.path.exists(path):
+            return None
+        keywords = cls()
+        with np.load(path) as data:
+            keywords.node_ids = data["node_ids"].tolist()
+            keywords.ref_doc_ids = data["ref_doc_ids"].tolist()
+            keywords.lengths = data["lengths"]
+            keywords.deleted = set(data["deleted"].tolist())
+            offsets, chunks, tfs = data["offsets"], data["chunks"], data["tfs"]
+            for i, term in enumerate(data["terms"].tolist()):
+                keywords.postings[term] = (chunks[offsets[i]:offsets[i + 1]], tfs[offsets[i]:offsets[i + 1]])
+        return keywords
+
+    @classmethod
+    def from_nodes(cls, nodes) -> "KeywordIndex":
+        keywords, batch = cls(), []
+        for node in nodes:
+            batch.append(node)
+            if len(batch) == 4096:
+                keywords.add(batch)
+                batch = []
+        keywords.add(batch)
+        return keywords
+
+
+# ---------------------------------------------------------------------------
+# Retrievers
+# ---------------------------------------------------------------------------
+
+def fetch_nodes(index, node_ids: list[str]) -> list:
+    """Nodes by id from wherever the index keeps the chunk texts."""
+    vector_store = index.storage_context.vector_store
+    if vector_store.stores_text:
+        return vector_store.get_nodes(node_ids=node_ids)
+    return index.docstore.get_nodes(node_ids, raise_error=False)
+
+
+def index_nodes(index):
+    """Every chunk of the index (to build a keyword index for an existing storage/)."""
+    vector_store = index.storage_context.vector_store
+    if vector_store.stores_text:
+        return vector_store.get_nodes()
+    return list(index.docstore.docs.values())
+
+
+class BM25Retriever(BaseRetriever):
+    def __init__(self, index, keywords: KeywordIndex, similarity_top_k: int):
+        super().__init__()
+        self._index = index
+        self._keywords = keywords
+        self._top_k = similarity_top_k
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        hits = self._keywords.search(query_bundle.query_str, self._top_k)
+        scores = dict(hits)
+        nodes = fetch_nodes(self._index, [node_id for node_id, _ in hits])
+        return [NodeWithScore(node=node, score=scores[node.node_id]) for node in nodes]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        # Plain numpy scoring; in a thread so it runs side by side with the dense retriever
+        return await asyncio.to_thread(self._retrieve, query_bundle)
+
+
+class TimedRetriever(BaseRetriever):
+    """Records the latency of the wrapped retriever in rag_retriever_seconds."""
+
+    def __init__(self, retriever: BaseRetriever, name: str):
+        super().__init__()
+        self._retriever = retriever
+        self._name = name
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        start = time.perf_counter()
+        nodes = self._retriever.retrieve(query_bundle)
+        RETRIEVER_SECONDS.observe(time.perf_counter() - start, retriever=self._name)
+        return nodes
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        start = time.perf_counter()
+        nodes = await self._retriever.aretrieve(query_bundle)
+        RETRIEVER_SECONDS.observe(time.perf_counter() - start, retriever=self._name)
+        return nodes
+
+
+class HybridRetriever(BaseRetriever):
+    """Reciprocal rank fusion of several retrievers' rankings."""
+
+    def __init__(self, retrievers: list[BaseRetriever], similarity_top_k: int, rrf_k: int = RRF_K):
+        super().__init__()
+        self._retrievers = retrievers
+        self._top_k = similarity_top_k
+        self._rrf_k = rrf_k
+
+    def _fuse(self, rankings: list[list[NodeWithScore]]) -> list[NodeWithScore]:
+        scores, nodes = {}, {}
+        for ranking in rankings:
+            for rank, result in enumerate(ranking, 1):
+                node_id = result.node.node_id
+                scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (self._rrf_k + rank)
+                nodes.setdefault(node_id, result.node)
+        best = sorted(scores, key=scores.get, reverse=True)[:self._top_k]
+        return [NodeWithScore(node=nodes[node_id], score=scores[node_id]) for node_id in best]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        return self._fuse([r.retrieve(query_bundle) for r in self._retrievers])
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        rankings = await asyncio.gather(*(r.aretrieve(query_bundle) for r in self._retrievers))
+        return self._fuse(rankings)
+
+
+def make_retriever(index, keywords: KeywordIndex | None, similarity_top_k: int, mode: str = RETRIEVER) -> BaseRetriever:
+    """Retriever over index for RAG_RETRIEVER, returning similarity_top_k chunks."""
+    if mode not in RETRIEVERS:
+        raise ValueError(f"Unknown RAG_RETRIEVER '{mode}' (expected one of {', '.join(RETRIEVERS)})")
+    if mode == "vector" or keywords is None:
+        return TimedRetriever(index.as_retriever(similarity_top_k=similarity_top_k), "vector")
+    if mode == "bm25":
+        return TimedRetriever(BM25Retriever(index, keywords, similarity_top_k), "bm25")
+    return TimedRetriever(
+        HybridRetriever(
+            [
+                TimedRetriever(index.as_retriever(similarity_top_k=DENSE_TOP_K or similarity_top_k), "vector"),
+                TimedRetriever(BM25Retriever(index, keywords, BM25_TOP_K or similarity_top_k), "bm25"),
+            ],
+            similarity_top_k,
+        ),
+        "hybrid",
+    )
@@ -1,33 +1,100 @@
+import time
+
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager, contextmanager
 from typing import Annotated
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import Body, Depends, FastAPI, File, Header, Request, UploadFile
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from llama_index.core import (
-    VectorStoreIndex,
+    QueryBundle,
     SimpleDirectoryReader,
     StorageContext,
     load_index_from_storage,
     PromptTemplate,
     Settings,
 )
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.llms.openai import OpenAI
+from llama_index.core.constants import DEFAULT_SIMILARITY_TOP_K
+from llama_index.core.query_engine import RetrieverQueryEngine
 from dotenv import load_dotenv
+from answer_cache import AnswerCache
+from embedding_cache import EMBED_CACHE_PATH, EmbeddingCache
+import metrics
+from ingest_jobs import INGEST_BATCH_FILES, INGEST_CONCURRENCY, IngestJob, load_job, prune_jobs
+from ingestion import (
+    EMBED_BATCH_SIZE,
+    build_index,
+    chunk_documents,
+    configure_torch_threads,
+    embed_nodes,
+    refresh_documents,
+)
+from providers import EMBED_PROVIDER, LLM_PROVIDER, create_embed_model, create_llm, query_instruction
+from rerank import (
+    RERANK,
+    RERANK_CANDIDATES,
+    RERANK_MODEL,
+    RERANK_THRESHOLD,
+    RERANK_TOP_N,
+    MMR_LAMBDA,
+    Reranker,
+    load_cross_encoder,
+)
+from keyword_index import BM25_TOP_K, DENSE_TOP_K, RETRIEVER, RRF_K, KeywordIndex, index_nodes, make_retriever
+from shared_index import IndexLock, bump_version, read_version
+from synthesis import CONTEXT_TOKENS, SYNTHESIS, SYNTHESIS_MODES, ContextBudget, pack_nodes, track_llm_usage
+from vector_store import VECTOR_STORE, AnnVectorStore, convert_storage, create_vector_store, load_vector_store
+import asyncio
+import hashlib
+import json
 import os
-import sys
+import shutil
 
-# Load API key from external file
+# Load API key from external file; it is checked when the LLM is created,
+# and not needed at all with RAG_LLM_PROVIDER=mock (providers.py)
 config_path = "./openai_key.env"
 load_dotenv(dotenv_path=config_path)
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key or api_key == "your_api_key_here":
-    print("ERROR: OPENAI_API_KEY is not set or still the placeholder.")
-    print("Please set your key in openai_key.env")
-    sys.exit(1)
-os.environ["OPENAI_API_KEY"] = api_key
 
-# Models
-Settings.llm = OpenAI(model="gpt-4o-mini")
-Settings.embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
+# Startup — importing this module is cheap; the models and the index are
+# created by warm_up(), which the lifespan hook below starts in the
+# background (RAG_WARMUP=background), runs before serving (blocking) or
+# leaves to the first request that needs them (lazy). GET /ready reports
+# when the server is warm, and startup_timings how long each stage took.
+WARMUP_MODE = os.getenv("RAG_WARMUP", "background")
+startup_timings = {}
+
+
+class timed:
+    """Context manager recording the duration of a startup stage in startup_timings."""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        startup_timings[self.stage] = round(time.perf_counter() - self.start, 3)
+
+
+def init_models():
+    Settings.embed_model = create_embed_model(EMBED_BATCH_SIZE)
+    if EMBED_PROVIDER == "huggingface":
+        configure_torch_threads()
+    init_answer_models()
+
+
+def init_answer_models():
+    """The models that answer from already embedded questions and chunks:
+    the LLM and, with RAG_RERANK=cross-encoder, the reranker."""
+    Settings.llm = create_llm("gpt-4o-mini")
+    if RERANK == "cross-encoder":
+        load_cross_encoder()
+
+
+# Embedding cache — survives `make reset`, so rebuilding after a prompt
+# change only embeds chunks whose text changed
+embedding_cache = EmbeddingCache() if EMBED_CACHE_PATH else None
 
 # Chunking (512 tokens, 50 overlap — LlamaIndex defaults)
 Settings.chunk_size = 512
@@ -35,19 +102,116 @@ Settings.chunk_overlap = 50
 
 # Data directory
 directory_path = "./data"
-file_metadata = lambda x: {"filename": x}
+file_metadata = lambda x: {"filename": os.path.basename(x)}
 os.makedirs("data", exist_ok=True)
 
-# Build or load the vector index
-PERSIST_DIR = "./storage"
-if not os.path.exists(PERSIST_DIR):
-    reader = SimpleDirectoryReader(directory_path, file_metadata=file_metadata)
+
+def load_documents(input_files: list[str] | None = None) -> list:
+    """Load documents keyed by filename instead of a random UUID.
+
+    Together with the content hash LlamaIndex keeps per document in the
+    docstore, this lets /ingest skip unchanged uploads and replace the
+    nodes of changed ones instead of inserting duplicates. Multi-part files
+    (e.g. PDF pages) get a "_part_N" suffix.
+    """
+    if input_files is None:
+        reader = SimpleDirectoryReader(directory_path, file_metadata=file_metadata)
+    else:
+        reader = SimpleDirectoryReader(input_files=input_files, file_metadata=file_metadata)
     documents = reader.load_data()
-    index = VectorStoreIndex.from_documents(documents)
-    index.storage_context.persist()
-else:
-    storage_context = StorageContext.from_defaults(persist_dir=PERSIST_DIR)
-    index = load_index_from_storage(storage_context)
+
+    parts = {}
+    for doc in documents:
+        parts.setdefault(doc.metadata["filename"], []).append(doc)
+    for filename, docs in parts.items():
+        for i, doc in enumerate(docs):
+            doc.id_ = filename if len(docs) == 1 else f"{filename}_part_{i}"
+    return documents
+
+
+# Vector index, built or loaded by init_index(). RAG_VECTOR_STORE picks
+# the backend (simple, flat or hnsw — see vector_store.py); an existing
+# storage/ is migrated to it on startup.
+#
+# storage/ can be shared by several worker processes (see shared_index.py):
+# writes happen under an exclusive file lock on a fresh copy of the index
+# and bump the on-disk version; every worker serves a read-only copy and
+# swaps to the new version on its next request.
+PERSIST_DIR = "./storage"
+index_lock = IndexLock(PERSIST_DIR)
+index = None
+keyword_index = None  # BM25 over the same chunks (keyword_index.py), swapped together with index
+
+
+def load_index(read_only: bool = True):
+    storage_context = StorageContext.from_defaults(
+        persist_dir=PERSIST_DIR, vector_store=load_vector_store(PERSIST_DIR, read_only=read_only)
+    )
+    return load_index_from_storage(storage_context)
+
+
+def close_index(index):
+    vector_store = index.storage_context.vector_store
+    if isinstance(vector_store, AnnVectorStore):
+        vector_store.close()
+
+
+def load_current_index() -> tuple:
+    """(version, read-only index, keyword index) of what is on disk now."""
+    with index_lock.shared():
+        return read_version(PERSIST_DIR), load_index(), KeywordIndex.load(PERSIST_DIR)
+
+
+def init_index():
+    # The first worker to get the lock builds or converts storage/; the others wait and load it
+    with index_lock.exclusive():
+        if not os.path.exists(PERSIST_DIR):
+            documents = load_documents()
+            keywords = KeywordIndex()
+            built = build_index(
+                documents, cache=embedding_cache, vector_store=create_vector_store(PERSIST_DIR), keywords=keywords
+            )
+            if embedding_cache is not None:
+                stats = embedding_cache.stats()
+                print(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses")
+            built.storage_context.persist()
+            keywords.persist(PERSIST_DIR)
+            close_index(built)
+            bump_version(PERSIST_DIR)
+        else:
+            convert_storage(PERSIST_DIR)
+            if KeywordIndex.load(PERSIST_DIR) is None:
+                print("Building the keyword index...")
+                existing = load_index()
+                KeywordIndex.from_nodes(index_nodes(existing)).persist(PERSIST_DIR)
+                close_index(existing)
+                bump_version(PERSIST_DIR)
+    swap_index(*load_current_index())
+    print(f"Vector store: {VECTOR_STORE} (index version {index_version})")
+
+
+def write_documents(documents: list, nodes: list | None = None, timings: dict | None = None) -> list[bool]:
+    """Single writer: apply documents (with already embedded nodes, if any)
+    to a fresh copy of the index on disk, persist it and bump the version.
+    Returns refresh_documents()' flags; the persist time (seconds) goes to
+    timings["persist"], if given."""
+    with index_lock.exclusive():
+        writer = load_index(read_only=False)
+        keywords = KeywordIndex.load(PERSIST_DIR) or KeywordIndex.from_nodes(index_nodes(writer))
+        try:
+            refreshed = refresh_documents(writer, documents, cache=embedding_cache, nodes=nodes, keywords=keywords)
+            if any(refreshed):
+                start = time.perf_counter()
+                writer.storage_context.persist()
+                keywords.persist(PERSIST_DIR)
+                bump_version(PERSIST_DIR)
+                seconds = time.perf_counter() - start
+                INGEST_SECONDS.observe(seconds, stage="persist")
+                if timings is not None:
+                    timings["persist"] = seconds
+        finally:
+            close_index(writer)
+    return refreshed
 
 
 # ---------------------------------------------------------------------------
@@ -87,26 +251,482 @@ PROMPT_IMPROVED = PromptTemplate(
     "Antwort: "
 )
 
-# >>> Change this line to switch prompts <<<
-SYSTEM_PROMPT = PROMPT_BASELINE
+PROMPTS_DIR = "./prompts"
 
 
-# Query engine
-query_engine = index.as_query_engine(
-    response_mode="tree_summarize",
-    summary_template=SYSTEM_PROMPT,
-)
+def is_valid_template(template: str) -> bool:
+    return "{context_str}" in template and "{query_str}" in template
+
+
+def load_custom_prompts() -> dict:
+    """Load user-added templates from prompts/<id>.txt.
+    Each file must contain the {context_str} and {query_str} placeholders.
+    """
+    prompts = {}
+    if not os.path.isdir(PROMPTS_DIR):
+        return prompts
+    for name in sorted(os.listdir(PROMPTS_DIR)):
+        if not name.endswith(".txt"):
+            continue
+        with open(os.path.join(PROMPTS_DIR, name), encoding="utf-8") as f:
+            template = f.read()
+        if not is_valid_template(template):
+            print(f"Skipping prompt {name}: missing {{context_str}} or {{query_str}}")
+            continue
+        prompts[name[:-4]] = PromptTemplate(template)
+    return prompts
+
+
+# Prompt registry — every prompt can be picked per request with ?prompt=<id>
+# or the X-Prompt header, so A/B runs need neither a restart nor a rebuild.
+PROMPTS = {
+    "baseline": PROMPT_BASELINE,
+    "improved": PROMPT_IMPROVED,
+    **load_custom_prompts(),
+}
+
+# >>> Change this line to switch the default prompt <<<
+DEFAULT_PROMPT = os.getenv("RAG_DEFAULT_PROMPT", "baseline")
+
+
+# Query engines — one per prompt and synthesis strategy, built lazily over
+# the same loaded index with the retriever RAG_RETRIEVER selects (vector,
+# bm25 or hybrid). tree_summarize may call the LLM several times per
+# question; compact makes one call over a token-budgeted context (synthesis.py).
+# With RAG_RERANK set, the retriever over-fetches RAG_RERANK_CANDIDATES
+# chunks and the reranker passes the best RAG_RERANK_TOP_N on (rerank.py).
+query_engines = {}
+RETRIEVE_TOP_K = RERANK_CANDIDATES if RERANK != "off" else DEFAULT_SIMILARITY_TOP_K
 
 
-def update_query_engine(index):
-    global query_engine
-    query_engine = index.as_query_engine(
+def get_retriever(top_k: int = RETRIEVE_TOP_K):
+    return make_retriever(index, keyword_index, top_k)
+
+
+def get_reranker(top_n: int = RERANK_TOP_N) -> Reranker:
+    return Reranker(index=index, top_n=top_n)
+
+
+def create_query_engine(
+    retriever, prompt_id: str, synthesis: str = SYNTHESIS, streaming: bool = False, postprocessors: list = ()
+) -> RetrieverQueryEngine:
+    """Query engine over retriever answering with a prompt and synthesis mode
+    (also used by sweep.py for its variant indexes)."""
+    if synthesis == "compact":
+        return RetrieverQueryEngine.from_args(
+            retriever,
+            response_mode="compact",
+            text_qa_template=PROMPTS[prompt_id],
+            node_postprocessors=[*postprocessors, ContextBudget(budget=CONTEXT_TOKENS)],
+            streaming=streaming,
+        )
+    return RetrieverQueryEngine.from_args(
+        retriever,
         response_mode="tree_summarize",
-        summary_template=SYSTEM_PROMPT,
+        summary_template=PROMPTS[prompt_id],
+        node_postprocessors=list(postprocessors),
+        streaming=streaming,
+    )
+
+
+def get_query_engine(prompt_id: str, synthesis: str = SYNTHESIS, streaming: bool = False):
+    engine = query_engines.get((prompt_id, synthesis, streaming))
+    if engine is None:
+        postprocessors = [get_reranker()] if RERANK != "off" else []
+        engine = create_query_engine(get_retriever(), prompt_id, synthesis, streaming, postprocessors)
+        query_engines[(prompt_id, synthesis, streaming)] = engine
+    return engine
+
+
+_index_fingerprint = None
+
+
+def index_fingerprint() -> str:
+    """Short hash of the indexed content, chunking, embed model, vector store
+    and prompt templates.
+
+    Clients use it (with the question and prompt id) as the key for cached
+    answers, so anything /ingest or POST /prompts changes invalidates them.
+    """
+    global _index_fingerprint
+    if _index_fingerprint is None:
+        content_hashes = sorted(index.docstore.get_all_document_hashes())
+        payload = json.dumps([
+            Settings.embed_model.model_name,
+            Settings.chunk_size,
+            Settings.chunk_overlap,
+            VECTOR_STORE,
+            [RETRIEVER, DENSE_TOP_K, BM25_TOP_K, RRF_K] if RETRIEVER == "hybrid" else RETRIEVER,
+            *([[RERANK, RERANK_CANDIDATES, RERANK_TOP_N, RERANK_THRESHOLD,
+                RERANK_MODEL if RERANK == "cross-encoder" else MMR_LAMBDA if RERANK == "mmr" else None]]
+              if RERANK != "off" else []),
+            content_hashes,
+            # Cached outputs are keyed by prompt id; a replaced template must invalidate them
+            sorted((prompt_id, prompt.template) for prompt_id, prompt in PROMPTS.items()),
+            # Answers of a stand-in LLM must not be mistaken for real ones in cached outputs
+            *([Settings.llm.metadata.model_name] if LLM_PROVIDER != "openai" else []),
+        ])
+        _index_fingerprint = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+    return _index_fingerprint
+
+
+# On-disk version of the served index; scopes the answer cache
+index_version = 0
+INDEX_RELOADS = metrics.counter("rag_index_reloads_total", "Index versions loaded after a write")
+
+
+def swap_index(version: int, new_index, new_keyword_index):
+    """Serve new_index from now on. Requests in flight keep the index and
+    engines they already hold; the cached engines are rebuilt on next use."""
+    global index, keyword_index, index_version, _index_fingerprint
+    index, keyword_index = new_index, new_keyword_index
+    query_engines.clear()
+    _index_fingerprint = None
+    index_version = version
+
+
+_reload_task = None
+
+
+async def _reload_index():
+    version, new_index, new_keyword_index = await asyncio.to_thread(load_current_index)
+    if version != index_version:
+        swap_index(version, new_index, new_keyword_index)
+        INDEX_RELOADS.inc()
+
+
+async def refresh_index():
+    """Swap in the index on disk if a writer (in any worker) committed a new version."""
+    global _reload_task
+    if read_version(PERSIST_DIR) == index_version:
+        return
+    if _reload_task is None or _reload_task.done():
+        _reload_task = asyncio.create_task(_reload_index())
+    try:
+        await asyncio.shield(_reload_task)
+    except Exception as e:
+        print(f"Failed to load index version {read_version(PERSIST_DIR)}, serving {index_version}: {e}")
+
+
+def resolve_prompt(prompt: str | None, x_prompt: str | None) -> str | None:
+    """Pick the prompt id from the query parameter, then the header, then the default.
+    Returns None for unknown ids.
+    """
+    prompt_id = prompt or x_prompt or DEFAULT_PROMPT
+    return prompt_id if prompt_id in PROMPTS else None
+
+
+def unknown_prompt_response(prompt: str | None, x_prompt: str | None) -> JSONResponse:
+    return JSONResponse(
+        status_code=400,
+        content={
+            "message": f"Unknown prompt '{prompt or x_prompt}'. "
+            f"Available: {', '.join(PROMPTS)}"
+        },
+    )
+
+
+def unknown_synthesis_response(synthesis: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=400,
+        content={
+            "message": f"Unknown synthesis '{synthesis}'. "
+            f"Available: {', '.join(SYNTHESIS_MODES)}"
+        },
+    )
+
+
+# Query concurrency — queries run on the async engine API so the event loop
+# stays free while the LLM works; the semaphore caps in-flight LLM calls.
+MAX_CONCURRENT_QUERIES = int(os.getenv("RAG_MAX_CONCURRENT_QUERIES", "8"))
+QUERY_TIMEOUT_SECONDS = float(os.getenv("RAG_QUERY_TIMEOUT", "60"))
+query_semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
+
+
+# Query stages — every answer is embed → retrieve → rerank → synthesize;
+# StageTimings records how long each took for rag_stage_seconds and, with
+# ?debug=timings, for the response ("timings", ms). The LLM calls and tokens
+# of each answer go to rag_query_llm_calls and rag_query_tokens.
+STAGE_SECONDS = metrics.histogram(
+    "rag_stage_seconds",
+    "Query latency by stage (embed, retrieve, rerank, synthesize)",
+    labelnames=("stage",),
+)
+QUERY_LLM_CALLS = metrics.histogram(
+    "rag_query_llm_calls", "LLM calls per answered query", buckets=(0, 1, 2, 3, 5, 8, 13, 21)
+)
+QUERY_TOKENS = metrics.histogram(
+    "rag_query_tokens",
+    "LLM tokens per answered query by kind (prompt, completion)",
+    labelnames=("kind",),
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000),
+)
+
+
+class StageTimings(dict):
+    """Milliseconds per query stage."""
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            STAGE_SECONDS.observe(seconds, stage=name)
+            self[name] = round(self.get(name, 0) + seconds * 1000, 1)
+
+
+def observe_usage(usage):
+    QUERY_LLM_CALLS.observe(usage.llm_calls)
+    QUERY_TOKENS.observe(usage.prompt_tokens, kind="prompt")
+    QUERY_TOKENS.observe(usage.completion_tokens, kind="completion")
+
+
+def wants_timings(debug: str | None) -> bool:
+    """Whether ?debug= (comma-separated) asks for the stage timings."""
+    return "timings" in (debug or "").split(",")
+
+
+def needs_query_embedding() -> bool:
+    """Whether answering embeds the question (BM25 alone doesn't)."""
+    return answer_cache.semantic or RETRIEVER != "bm25" or RERANK == "mmr"
+
+
+async def rerank(bundle: QueryBundle, nodes: list, top_n: int = RERANK_TOP_N) -> list:
+    if RERANK == "off":
+        return nodes
+    # In a thread: the cross-encoder and MMR are CPU-bound
+    return await asyncio.to_thread(get_reranker(top_n).postprocess_nodes, nodes, bundle)
+
+
+async def embed_query(query: str, timings: StageTimings) -> QueryBundle:
+    embedding = None
+    if needs_query_embedding():
+        # Computed once, for the semantic cache, retrieval and MMR
+        with timings.stage("embed"):
+            embedding = await asyncio.to_thread(Settings.embed_model.get_query_embedding, query)
+    return QueryBundle(query, embedding=embedding)
+
+
+async def retrieve(bundle: QueryBundle, prompt_id: str, synthesis: str, timings: StageTimings) -> list:
+    with timings.stage("retrieve"):
+        nodes = await get_query_engine(prompt_id, synthesis).retriever.aretrieve(bundle)
+    if RERANK != "off":
+        with timings.stage("rerank"):
+            nodes = await rerank(bundle, nodes)
+    return nodes
+
+
+async def synthesize(
+    bundle: QueryBundle, nodes: list, prompt_id: str, synthesis: str = SYNTHESIS, streaming: bool = False
+):
+    if synthesis == "compact":
+        # asynthesize() skips the engine's node postprocessors
+        nodes = pack_nodes(nodes, CONTEXT_TOKENS)
+    return await get_query_engine(prompt_id, synthesis, streaming).asynthesize(bundle, nodes)
+
+
+async def _run_query(bundle: QueryBundle, prompt_id: str, synthesis: str, timings: StageTimings):
+    async with query_semaphore:
+        nodes = await retrieve(bundle, prompt_id, synthesis, timings)
+        with timings.stage("synthesize"):
+            return await synthesize(bundle, nodes, prompt_id, synthesis)
+
+
+async def run_query(
+    query: str | QueryBundle,
+    prompt_id: str = DEFAULT_PROMPT,
+    synthesis: str = SYNTHESIS,
+    timings: StageTimings | None = None,
+):
+    """Run a query stage by stage on the async engine API, bounded by the
+    concurrency limit. The timeout covers both waiting for a free slot and
+    the query itself.
+    """
+    bundle = QueryBundle(query) if isinstance(query, str) else query
+    timings = StageTimings() if timings is None else timings
+    return await asyncio.wait_for(
+        _run_query(bundle, prompt_id, synthesis, timings), timeout=QUERY_TIMEOUT_SECONDS
+    )
+
+
+# Answer cache — repeated or near-identical questions skip retrieval and synthesis
+answer_cache = AnswerCache()
+ANSWER_CACHE_LOOKUPS = metrics.counter(
+    "rag_answer_cache_lookups_total",
+    "Answer cache lookups by result (exact, semantic, miss)",
+    labelnames=("result",),
+)
+
+
+async def answer_query(query: str, prompt_id: str, synthesis: str = SYNTHESIS, semantic: bool = True) -> dict:
+    """Answer with sources, served from the answer cache when possible
+    (semantic=False allows exact hits only, e.g. for evaluation).
+    The "cache" field tells whether it was an exact hit, a semantic hit or a miss;
+    "usage" counts the LLM calls and tokens this request cost (none on a hit)
+    and "timings" the milliseconds spent per stage (see wants_timings()).
+    """
+    usage = track_llm_usage()
+    timings = StageTimings()
+    scope = prompt_id if synthesis == SYNTHESIS else f"{prompt_id}|{synthesis}"
+    version = index_version
+    cached = answer_cache.get_exact(query, scope, version) if answer_cache.enabled else None
+    if cached is not None:
+        ANSWER_CACHE_LOOKUPS.inc(result="exact")
+        return {**cached, "synthesis": synthesis, "usage": usage.to_dict(), "timings": timings, "cache": "exact"}
+
+    bundle = await embed_query(query, timings)
+    if semantic and answer_cache.semantic:
+        cached = answer_cache.get_similar(bundle.embedding, scope, version)
+        if cached is not None:
+            ANSWER_CACHE_LOOKUPS.inc(result="semantic")
+            return {**cached, "synthesis": synthesis, "usage": usage.to_dict(), "timings": timings,
+                    "cache": "semantic"}
+    if answer_cache.enabled:
+        ANSWER_CACHE_LOOKUPS.inc(result="miss")
+
+    response = await run_query(bundle, prompt_id, synthesis, timings)
+    observe_usage(usage)
+    payload = {
+        "answer": str(response),
+        "sources": format_sources(getattr(response, "source_nodes", [])),
+    }
+    if version == index_version:
+        answer_cache.put(query, scope, version, bundle.embedding, payload)
+    return {**payload, "synthesis": synthesis, "usage": usage.to_dict(), "timings": timings, "cache": "miss"}
+
+
+# Batch queries — batched embedding and bulk retrieval for many questions
+MAX_BATCH_QUERIES = int(os.getenv("RAG_MAX_BATCH_QUERIES", "64"))
+MAX_RETRIEVE_QUERIES = int(os.getenv("RAG_MAX_RETRIEVE_QUERIES", "512"))  # /retrieve makes no LLM calls
+
+
+def embed_queries(queries: list[str]) -> list[list[float]]:
+    """Embed all queries, in batches of embed_batch_size where the model's
+    query embedding is a text embedding with an instruction prefix."""
+    embed_model = Settings.embed_model
+    instruction = query_instruction(embed_model)
+    if instruction is None:
+        return [embed_model.get_query_embedding(q) for q in queries]
+    return embed_model.get_text_embedding_batch([instruction + q for q in queries])
+
+
+def retrieve_batch(queries: list[str], top_k: int, timings: StageTimings) -> tuple[list, list]:
+    with timings.stage("embed"):
+        embeddings = embed_queries(queries)
+    bundles = [QueryBundle(q, embedding=e) for q, e in zip(queries, embeddings)]
+    retriever = get_retriever(top_k)
+    with timings.stage("retrieve"):
+        return bundles, [retriever.retrieve(b) for b in bundles]
+
+
+async def _synthesize(bundle: QueryBundle, nodes: list, prompt_id: str, synthesis: str, top_k: int,
+                      timings: StageTimings):
+    if RERANK != "off":
+        with timings.stage("rerank"):
+            nodes = await rerank(bundle, nodes, top_k)
+    async with query_semaphore:
+        with timings.stage("synthesize"):
+            return await synthesize(bundle, nodes, prompt_id, synthesis)
+
+
+def format_sources(source_nodes: list) -> list:
+    sources = []
+    for node in source_nodes:
+        metadata = getattr(node.node, "metadata", {}) or {}
+        source_info = {
+            "text": getattr(node.node, "text", ""),
+            "score": getattr(node, "score", None),
+            "filename": metadata.get("filename", ""),
+            "metadata": metadata,
+        }
+        sources.append(source_info)
+    return sources
+
+
+def timeout_response() -> JSONResponse:
+    return JSONResponse(
+        status_code=504,
+        content={"message": f"Query timed out after {QUERY_TIMEOUT_SECONDS:.0f}s."},
     )
 
 
-app = FastAPI()
+def warm_up():
+    """Create the models, the index and the default query engine, then run
+    one embedding and one retrieval so the first real request doesn't pay
+    for lazy initialisation (torch kernels, HNSW graph, page cache)."""
+    with timed("models"):
+        init_models()
+    with timed("index"):
+        init_index()
+    with timed("query_engine"):
+        get_query_engine(DEFAULT_PROMPT)
+    with timed("first_retrieval"):
+        embedding = Settings.embed_model.get_query_embedding("warmup")
+        get_retriever().retrieve(QueryBundle("warmup", embedding=embedding))
+    startup_timings["ready_after"] = round(time.perf_counter() - _import_started, 3)
+    print("Startup: " + ", ".join(f"{stage} {sec:.2f}s" for stage, sec in startup_timings.items()))
+
+
+_warmup_task = None
+
+
+def start_warmup() -> asyncio.Task:
+    """Start warm_up() in a worker thread (once) and return its task."""
+    global _warmup_task
+    if _warmup_task is None:
+        _warmup_task = asyncio.create_task(asyncio.to_thread(warm_up))
+    return _warmup_task
+
+
+class NotReadyError(Exception):
+    pass
+
+
+async def ensure_ready():
+    """Dependency of every endpoint that needs the models or the index:
+    waits for the warm-up (starting it if nobody has yet), then for the
+    latest index version."""
+    try:
+        await asyncio.shield(start_warmup())
+    except Exception as e:
+        raise NotReadyError(f"Startup failed: {e}") from e
+    await refresh_index()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Jobs a crashed or restarted worker left unfinished are failed, not "running" forever
+    prune_jobs(running=ingest_jobs)
+    if WARMUP_MODE == "blocking":
+        await start_warmup()
+    elif WARMUP_MODE == "background":
+        start_warmup()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.exception_handler(NotReadyError)
+async def not_ready_handler(request: Request, exc: NotReadyError):
+    return JSONResponse(status_code=503, content={"message": str(exc)})
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once warm, 503 while warming up or after a failed startup."""
+    if _warmup_task is None or not _warmup_task.done():
+        state = "warming" if _warmup_task is not None else "idle"
+        return JSONResponse(status_code=503, content={"status": state, "timings": startup_timings})
+    if _warmup_task.exception() is not None:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "failed", "message": str(_warmup_task.exception()), "timings": startup_timings},
+        )
+    return {"status": "ready", "timings": startup_timings}
+
 
 SUPPORTED_EXTENSIONS = (".txt", ".pdf", ".md")
 
@@ -117,12 +737,175 @@ def filter_file_format(files: list[UploadFile]) -> tuple:
     return removed, filtered
 
 
+# Ingestion jobs — /ingest only streams the upload to disk and returns a
+# job id. Files are parsed and embedded in worker threads (at most
+# RAG_INGEST_CONCURRENCY at a time, across all jobs); a single writer task
+# commits every job that is ready with one write_documents() call, i.e.
+# one persist and one version bump. See ingest_jobs.py.
+ingest_semaphore = asyncio.Semaphore(INGEST_CONCURRENCY)
+ingest_jobs = {}  # running jobs of this worker; finished and other workers' jobs are read from disk
+_job_tasks = set()
+INGEST_JOBS = metrics.counter("rag_ingest_jobs_total", "Finished ingestion jobs by status", labelnames=("status",))
+INGEST_SECONDS = metrics.histogram(
+    "rag_ingest_stage_seconds",
+    "Ingestion time by stage (parse and embed per file; write, and the persist within it, per batch)",
+    labelnames=("stage",),
+)
+_write_queue = None
+_writer_task = None
+
+
+def embed_new_documents(documents: list) -> list:
+    """Chunk and embed the documents whose content the served index doesn't
+    have yet; the writer skips unchanged ones anyway."""
+    pending = [d for d in documents if index.docstore.get_document_hash(d.id_) != d.hash]
+    return embed_nodes(chunk_documents(pending), cache=embedding_cache) if pending else []
+
+
+async def prepare_upload(job: IngestJob, filename: str):
+    path = os.path.join(job.dir, filename)
+    async with ingest_semaphore:
+        if job.started_at is None:
+            job.status, job.started_at = "running", time.time()
+            job.add_timing("queued", job.started_at - job.created_at)
+        job.update_file(filename, status="parsing")
+        job.save()
+        try:
+            start = time.perf_counter()
+            documents = await asyncio.to_thread(load_documents, [path])
+            parsed = time.perf_counter()
+            job.update_file(filename, status="embedding")
+            job.save()
+            nodes = await asyncio.to_thread(embed_new_documents, documents)
+            embedded = time.perf_counter()
+        except Exception as e:
+            job.update_file(filename, status="failed", error=str(e))
+            job.save()
+            return
+    job.prepared[filename] = (documents, nodes)
+    job.update_file(
+        filename, status="embedded", chunks=len(nodes),
+        timings={"parse": round(parsed - start, 3), "embed": round(embedded - parsed, 3)},
+    )
+    job.add_timing("parse", parsed - start)
+    job.add_timing("embed", embedded - parsed)
+    INGEST_SECONDS.observe(parsed - start, stage="parse")
+    INGEST_SECONDS.observe(embedded - parsed, stage="embed")
+    job.save()
+
+
+async def run_ingest_job(job: IngestJob):
+    try:
+        await ensure_ready()
+    except NotReadyError as e:
+        for filename in job.pending_files():
+            job.update_file(filename, status="failed", error=str(e))
+        finish_job(job, "failed")
+        return
+    await asyncio.gather(*(prepare_upload(job, filename) for filename in job.pending_files()))
+    if job.prepared:
+        await _write_queue.put(job)
+    else:
+        finish_job(job, "failed")
+
+
+async def index_writer():
+    """Commit ready jobs in batches: whatever queued up during the last
+    write goes into the next one."""
+    while True:
+        batch = [await _write_queue.get()]
+        files = len(batch[0].prepared)
+        while not _write_queue.empty() and files < INGEST_BATCH_FILES:
+            batch.append(_write_queue.get_nowait())
+            files += len(batch[-1].prepared)
+        try:
+            await commit_jobs(batch)
+        except Exception as e:
+            print(f"Ingestion batch failed: {e}")
+
+
+async def commit_jobs(batch: list[IngestJob]):
+    latest = {}  # filename -> job; a later upload of a file replaces an earlier one
+    for job in batch:
+        for filename in job.prepared:
+            if filename in latest:
+                latest[filename].update_file(filename, status="superseded", superseded_by=job.job_id)
+            latest[filename] = job
+    documents, nodes, owners = [], [], []
+    for filename, job in latest.items():
+        file_documents, file_nodes = job.prepared[filename]
+        documents += file_documents
+        nodes += file_nodes
+        owners += [(job, filename)] * len(file_documents)
+        job.update_file(filename, status="indexing")
+    for job in batch:
+        job.status = "indexing"
+        job.save()
+
+    start = time.perf_counter()
+    write_timings = {}
+    try:
+        refreshed = await asyncio.to_thread(write_documents, documents, nodes, write_timings)
+        await refresh_index()
+    except Exception as e:
+        for filename, job in latest.items():
+            job.update_file(filename, status="failed", error=f"Failed to store file in index: {e}")
+        for job in batch:
+            finish_job(job, "failed")
+        return
+    seconds = time.perf_counter() - start
+    INGEST_SECONDS.observe(seconds, stage="write")
+
+    changed = {owner for owner, r in zip(owners, refreshed) if r}
+    for filename, job in latest.items():
+        job.update_file(filename, status="indexed" if (job, filename) in changed else "unchanged")
+    for job in batch:
+        job.add_timing("write", seconds)
+        if "persist" in write_timings:
+            job.add_timing("persist", write_timings["persist"])
+        job.index_version = index_version
+        finish_job(job, "done")
+
+
+def finish_job(job: IngestJob, status: str):
+    job.status, job.finished_at = status, time.time()
+    job.timings["total"] = round(job.finished_at - job.created_at, 3)
+    lines = []
+    for label, file_status in (
+        ("Removed (unsupported format)", "unsupported"),
+        ("Uploaded", "indexed"),
+        ("Unchanged (skipped)", "unchanged"),
+        ("Replaced by a later upload", "superseded"),
+        ("Failed", "failed"),
+    ):
+        names = sorted(f["filename"] for f in job.files.values() if f["status"] == file_status)
+        if names:
+            lines.append(f"{label}: " + ", ".join(names))
+    job.message = "\n".join(lines) or "No files processed."
+    job.save()
+    job.remove_uploads()
+    ingest_jobs.pop(job.job_id, None)
+    INGEST_JOBS.inc(status=status)
+
+
+def submit_job(job: IngestJob):
+    global _write_queue, _writer_task
+    if _writer_task is None:
+        _write_queue = asyncio.Queue()
+        _writer_task = asyncio.create_task(index_writer())
+    ingest_jobs[job.job_id] = job
+    task = asyncio.create_task(run_ingest_job(job))
+    _job_tasks.add(task)
+    task.add_done_callback(_job_tasks.discard)
+
+
 @app.post("/ingest")
 async def ingest(
     files: Annotated[
         list[UploadFile], File(description="Multiple files as UploadFile")
     ],
 ):
+    """Store the upload and queue it for indexing; poll GET /ingest/{job_id}."""
     if len(files) == 1 and files[0].filename == "":
         return JSONResponse(
             status_code=400,
@@ -130,72 +913,125 @@ async def ingest(
         )
 
     removed_documents, files = filter_file_format(files)
-    new_documents = []
-
-    if files:
-        for file in files:
-            out_file_path = os.path.join("data", file.filename)
-            try:
-                with open(out_file_path, "wb") as out_file:
-                    while True:
-                        chunk = await file.read(1024 * 1024)
-                        if not chunk:
-                            break
-                        out_file.write(chunk)
-                new_documents.append(out_file_path)
-            except Exception as e:
-                return JSONResponse(
-                    status_code=500,
-                    content={"message": f"Failed to process file {file.filename}: {e}"},
-                )
+    if not files:
+        return {"message": "Removed (unsupported format): " + ", ".join(removed_documents)}
 
-        try:
-            reader = SimpleDirectoryReader(directory_path, file_metadata=file_metadata)
-            documents = reader.load_data()
-            for d in documents:
-                index.insert(document=d)
-        except Exception as e:
-            return JSONResponse(
-                status_code=500,
-                content={"message": f"Failed to store file in index: {e}"},
-            )
+    names = [os.path.basename(f.filename) for f in files]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        # They would overwrite each other in the job directory
+        return JSONResponse(
+            status_code=400,
+            content={"message": "Duplicate file names in one upload: " + ", ".join(duplicates)},
+        )
 
+    prune_jobs(running=ingest_jobs)
+    job = IngestJob()
+    start = time.perf_counter()
+    for file in files:
+        filename = os.path.basename(file.filename)
+        size = 0
         try:
-            index.storage_context.persist()
-            update_query_engine(index)
+            with open(os.path.join(job.dir, filename), "wb") as out_file:
+                while True:
+                    chunk = await file.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    out_file.write(chunk)
+                    size += len(chunk)
         except Exception as e:
+            shutil.rmtree(job.dir, ignore_errors=True)
             return JSONResponse(
                 status_code=500,
-                content={"message": f"Failed to update index and query engine: {e}"},
+                content={"message": f"Failed to process file {file.filename}: {e}"},
             )
+        job.add_file(filename, bytes=size)
+    for filename in removed_documents:
+        job.add_file(filename, status="unsupported")
+    job.add_timing("upload", time.perf_counter() - start)
+    job.message = f"Queued {len(files)} file(s) for indexing."
+    job.save()
+    submit_job(job)
+    return JSONResponse(status_code=202, content=job.to_dict())
 
-        try:
-            for temp_file_path in new_documents:
-                os.unlink(temp_file_path)
-        except Exception as e:
-            return JSONResponse(
-                status_code=500,
-                content={"message": f"Failed to clean up temp files: {e}"},
-            )
 
-    lines = []
-    if removed_documents:
-        lines.append("Removed (unsupported format): " + ", ".join(removed_documents))
-    if new_documents:
-        lines.append("Uploaded: " + ", ".join(os.path.basename(d) for d in new_documents))
-    return {"message": "\n".join(lines) or "No files processed."}
+@app.get("/ingest/{job_id}")
+async def ingest_status(job_id: str):
+    job = ingest_jobs.get(job_id)
+    status = job.to_dict() if job is not None else load_job(job_id)
+    if status is None:
+        return JSONResponse(status_code=404, content={"message": f"Unknown ingestion job '{job_id}'."})
+    return status
+
 
+@app.get("/prompts")
+async def list_prompts():
+    return {"default": DEFAULT_PROMPT, "prompts": list(PROMPTS)}
 
-@app.get("/query")
-async def search_query(query: str):
+
+@app.get("/index_info", dependencies=[Depends(ensure_ready)])
+async def index_info():
+    return {
+        "fingerprint": index_fingerprint(),
+        "default_prompt": DEFAULT_PROMPT,
+        "prompts": list(PROMPTS),
+        "vector_store": VECTOR_STORE,
+        "llm_provider": LLM_PROVIDER,
+        "embed_provider": EMBED_PROVIDER,
+        "retriever": RETRIEVER,
+        "synthesis": SYNTHESIS,
+        "synthesis_modes": list(SYNTHESIS_MODES),
+        "context_tokens": CONTEXT_TOKENS,
+        "rerank": RERANK,
+        "rerank_candidates": RERANK_CANDIDATES if RERANK != "off" else None,
+        "rerank_top_n": RERANK_TOP_N if RERANK != "off" else None,
+        "version": index_version,
+    }
+
+
+@app.post("/prompts")
+async def add_prompt(prompt_id: Annotated[str, Body()], template: Annotated[str, Body()]):
+    """Register (or replace) a prompt template at runtime."""
+    if not is_valid_template(template):
+        return JSONResponse(
+            status_code=400,
+            content={"message": "Template must contain {context_str} and {query_str}."},
+        )
+    global _index_fingerprint
+    PROMPTS[prompt_id] = PromptTemplate(template)
+    for key in [key for key in query_engines if key[0] == prompt_id]:
+        del query_engines[key]
+    # Answers built with the replaced template must not be served again
+    answer_cache.purge(prompt_id)
+    _index_fingerprint = None
+    return {"message": f"Prompt '{prompt_id}' registered.", "prompts": list(PROMPTS)}
+
+
+@app.get("/query", dependencies=[Depends(ensure_ready)])
+async def search_query(
+    query: str,
+    prompt: str | None = None,
+    synthesis: str = SYNTHESIS,
+    debug: str | None = None,
+    x_prompt: Annotated[str | None, Header()] = None,
+):
     if not query.strip():
         return JSONResponse(
             status_code=400,
             content={"message": "No query text detected."},
         )
+    prompt_id = resolve_prompt(prompt, x_prompt)
+    if prompt_id is None:
+        return unknown_prompt_response(prompt, x_prompt)
+    if synthesis not in SYNTHESIS_MODES:
+        return unknown_synthesis_response(synthesis)
     try:
-        response = query_engine.query(query)
-        return {"query": query, "results": str(response)}
+        result = await answer_query(query, prompt_id, synthesis)
+        if wants_timings(debug):
+            return {"query": query, "prompt": prompt_id, "results": result["answer"], "timings": result["timings"]}
+        return {"query": query, "prompt": prompt_id, "results": result["answer"]}
+    except TimeoutError:
+        return timeout_response()
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -203,39 +1039,263 @@ async def search_query(query: str):
         )
 
 
-@app.get("/query_with_context")
-async def query_with_context(query: str):
-    """Query endpoint that returns both the answer and source documents for evaluation."""
+TTFT_SECONDS = metrics.histogram(
+    "rag_time_to_first_token_seconds",
+    "Time from receiving a /query_stream request to sending the first answer token",
+    labelnames=("prompt",),
+)
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_answer(query: str, prompt_id: str, synthesis: str = SYNTHESIS, debug: str | None = None):
+    """Yield SSE events: the retrieved sources first, then answer tokens as
+    the LLM produces them, then a final "done" (or "error") event."""
+    start = time.perf_counter()
+    ttft = None
+    usage = track_llm_usage()
+    timings = StageTimings()
+    try:
+        async with asyncio.timeout(QUERY_TIMEOUT_SECONDS):
+            bundle = await embed_query(query, timings)
+            async with query_semaphore:
+                nodes = await retrieve(bundle, prompt_id, synthesis, timings)
+                # synthesize covers the whole answer stream, until the last token is sent
+                with timings.stage("synthesize"):
+                    response = await synthesize(bundle, nodes, prompt_id, synthesis, streaming=True)
+                    yield sse_event("sources", {
+                        "query": query,
+                        "prompt": prompt_id,
+                        "sources": format_sources(response.source_nodes),
+                    })
+                    async for token in response.async_response_gen():
+                        if ttft is None:
+                            ttft = time.perf_counter() - start
+                            TTFT_SECONDS.observe(ttft, prompt=prompt_id)
+                        yield sse_event("token", {"text": token})
+        observe_usage(usage)
+    except TimeoutError:
+        yield sse_event("error", {"message": f"Query timed out after {QUERY_TIMEOUT_SECONDS:.0f}s."})
+        return
+    except Exception as e:
+        yield sse_event("error", {"message": f"Failed to process query: {e}"})
+        return
+    yield sse_event("done", {
+        "ttft_ms": round(ttft * 1000) if ttft is not None else None,
+        "total_ms": round((time.perf_counter() - start) * 1000),
+        "usage": usage.to_dict(),
+        **({"timings": timings} if wants_timings(debug) else {}),
+    })
+
+
+@app.get("/query_stream", dependencies=[Depends(ensure_ready)])
+async def query_stream(
+    query: str,
+    prompt: str | None = None,
+    synthesis: str = SYNTHESIS,
+    debug: str | None = None,
+    x_prompt: Annotated[str | None, Header()] = None,
+):
+    """Server-Sent Events variant of /query for the chat UI."""
+    if not query.strip():
+        return JSONResponse(
+            status_code=400,
+            content={"message": "No query text detected."},
+        )
+    prompt_id = resolve_prompt(prompt, x_prompt)
+    if prompt_id is None:
+        return unknown_prompt_response(prompt, x_prompt)
+    if synthesis not in SYNTHESIS_MODES:
+        return unknown_synthesis_response(synthesis)
+    return StreamingResponse(
+        stream_answer(query, prompt_id, synthesis, debug),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/query_with_context", dependencies=[Depends(ensure_ready)])
+async def query_with_context(
+    query: str,
+    prompt: str | None = None,
+    synthesis: str = SYNTHESIS,
+    debug: str | None = None,
+    x_prompt: Annotated[str | None, Header()] = None,
+):
+    """Query endpoint that returns the answer, the source documents and the
+    LLM calls and tokens it took ("usage"), for evaluation. With
+    ?debug=timings it adds the milliseconds spent per stage ("timings")."""
     if not query.strip():
         return JSONResponse(
             status_code=400,
             content={"message": "No query text detected."},
         )
+    prompt_id = resolve_prompt(prompt, x_prompt)
+    if prompt_id is None:
+        return unknown_prompt_response(prompt, x_prompt)
+    if synthesis not in SYNTHESIS_MODES:
+        return unknown_synthesis_response(synthesis)
     try:
-        response = query_engine.query(query)
-
-        sources = []
-        for node in getattr(response, "source_nodes", []):
-            metadata = getattr(node.node, "metadata", {}) or {}
-            source_info = {
-                "text": getattr(node.node, "text", ""),
-                "score": getattr(node, "score", None),
-                "filename": metadata.get("filename", ""),
-                "metadata": metadata,
-            }
-            sources.append(source_info)
+        # Exact hits only: a similar question's answer would be scored as this one's
+        result = await answer_query(query, prompt_id, synthesis, semantic=False)
+        if not wants_timings(debug):
+            del result["timings"]
+        return {"query": query, "prompt": prompt_id, **result}
+    except TimeoutError:
+        return timeout_response()
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"Failed to process query: {e}"},
+        )
+
+
+@app.post("/query_batch", dependencies=[Depends(ensure_ready)])
+async def query_batch(
+    queries: Annotated[list[str], Body()],
+    prompt: Annotated[str | None, Body()] = None,
+    top_k: Annotated[int | None, Body()] = None,
+    synthesis: Annotated[str, Body()] = SYNTHESIS,
+    debug: Annotated[str | None, Body()] = None,
+    x_prompt: Annotated[str | None, Header()] = None,
+):
+    """Answer several questions in one request.
 
+    Query embeddings are computed in one batch and retrieval runs in bulk;
+    reranking and synthesis fan out concurrently under the usual concurrency
+    limit. top_k is the number of chunks each answer is built from (with
+    reranking, the best top_k of at least RAG_RERANK_CANDIDATES). Each result
+    has the same schema as /query_with_context; failed queries carry a
+    "message" instead of an answer. With "debug": "timings", the top-level
+    "timings" are those of the shared embed and retrieve stages, each
+    result's those of its own rerank and synthesize stages.
+    """
+    if not queries or any(not q.strip() for q in queries):
+        return JSONResponse(
+            status_code=400,
+            content={"message": "Every query must contain text."},
+        )
+    if len(queries) > MAX_BATCH_QUERIES:
+        return JSONResponse(
+            status_code=400,
+            content={"message": f"At most {MAX_BATCH_QUERIES} queries per batch."},
+        )
+    if top_k is not None and top_k < 1:
+        return JSONResponse(
+            status_code=400,
+            content={"message": "top_k must be at least 1."},
+        )
+    prompt_id = resolve_prompt(prompt, x_prompt)
+    if prompt_id is None:
+        return unknown_prompt_response(prompt, x_prompt)
+    if synthesis not in SYNTHESIS_MODES:
+        return unknown_synthesis_response(synthesis)
+
+    top_k = top_k or (RERANK_TOP_N if RERANK != "off" else DEFAULT_SIMILARITY_TOP_K)
+    batch_timings = StageTimings()
+    try:
+        bundles, retrieved = await asyncio.to_thread(
+            retrieve_batch, queries, max(top_k, RERANK_CANDIDATES) if RERANK != "off" else top_k, batch_timings
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"Failed to retrieve context: {e}"},
+        )
+
+    async def answer(bundle: QueryBundle, nodes: list) -> dict:
+        usage = track_llm_usage()
+        timings = StageTimings()
+        try:
+            response = await asyncio.wait_for(
+                _synthesize(bundle, nodes, prompt_id, synthesis, top_k, timings), timeout=QUERY_TIMEOUT_SECONDS
+            )
+        except TimeoutError:
+            return {"query": bundle.query_str, "prompt": prompt_id,
+                    "message": f"Query timed out after {QUERY_TIMEOUT_SECONDS:.0f}s."}
+        except Exception as e:
+            return {"query": bundle.query_str, "prompt": prompt_id,
+                    "message": f"Failed to process query: {e}"}
+        observe_usage(usage)
         return {
-            "query": query,
+            "query": bundle.query_str,
+            "prompt": prompt_id,
             "answer": str(response),
-            "sources": sources,
+            "sources": format_sources(response.source_nodes),
+            "synthesis": synthesis,
+            "usage": usage.to_dict(),
+            **({"timings": timings} if wants_timings(debug) else {}),
         }
+
+    results = await asyncio.gather(*(answer(b, n) for b, n in zip(bundles, retrieved)))
+    if wants_timings(debug):
+        return {"prompt": prompt_id, "results": results, "timings": batch_timings}
+    return {"prompt": prompt_id, "results": results}
+
+
+@app.post("/retrieve", dependencies=[Depends(ensure_ready)])
+async def retrieve_only(
+    queries: Annotated[list[str], Body()],
+    top_k: Annotated[int | None, Body()] = None,
+    text: Annotated[bool, Body()] = False,
+    debug: Annotated[str | None, Body()] = None,
+):
+    """Retrieval without synthesis, for evaluating retrievers at no LLM cost.
+
+    Embeds all questions in one batch and returns, per question, the top_k
+    chunks an answer would be built from (after reranking, if enabled) with
+    their scores, best first. Chunk texts are left out unless "text" is true,
+    so large batches stay small.
+    """
+    if not queries or any(not q.strip() for q in queries):
+        return JSONResponse(
+            status_code=400,
+            content={"message": "Every query must contain text."},
+        )
+    if len(queries) > MAX_RETRIEVE_QUERIES:
+        return JSONResponse(
+            status_code=400,
+            content={"message": f"At most {MAX_RETRIEVE_QUERIES} queries per request."},
+        )
+    if top_k is not None and top_k < 1:
+        return JSONResponse(
+            status_code=400,
+            content={"message": "top_k must be at least 1."},
+        )
+
+    top_k = top_k or (RERANK_TOP_N if RERANK != "off" else DEFAULT_SIMILARITY_TOP_K)
+    timings = StageTimings()
+    try:
+        bundles, retrieved = await asyncio.to_thread(
+            retrieve_batch, queries, max(top_k, RERANK_CANDIDATES) if RERANK != "off" else top_k, timings
+        )
+        if RERANK != "off":
+            with timings.stage("rerank"):
+                retrieved = await asyncio.gather(*(rerank(b, n, top_k) for b, n in zip(bundles, retrieved)))
     except Exception as e:
         return JSONResponse(
             status_code=500,
-            content={"message": f"Failed to process query: {e}"},
+            content={"message": f"Failed to retrieve context: {e}"},
         )
 
+    results = []
+    for query, nodes in zip(queries, retrieved):
+        sources = format_sources(nodes)
+        if not text:
+            for source in sources:
+                del source["text"]
+        results.append({"query": query, "sources": sources})
+    if wants_timings(debug):
+        return {"top_k": top_k, "results": results, "timings": timings}
+    return {"top_k": top_k, "results": results}
+
 
 def load_content():
     try:
@@ -246,6 +1306,9 @@ def load_content():
         return "<html><body><h1>Error: chat_interface.html not found</h1></body></html>"
 
 
+startup_timings["import"] = round(time.perf_counter() - _import_started, 3)
+
+
 @app.get("/")
 async def main():
     content = load_content()
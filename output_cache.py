@@ -0,0 +1,67 @@
+"""
+CloudBase RAG — Shared cache of RAG outputs
+
+collect.py, run_evaluation.py and run_evaluation_llm.py all need the same
+answers and sources for every golden question. The first script to ask
+stores each /query_with_context response in cached_outputs.json, keyed by
+(question, prompt id, synthesis mode, index fingerprint); the others read from it, so
+scoring runs don't re-query the RAG system and work offline. Re-ingesting
+documents changes the fingerprint (served at GET /index_info) and thus
+invalidates the cached answers.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+CACHE_PATH = "cached_outputs.json"
+
+
+class OutputCache:
+    def __init__(self, path: str = CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._data = {"latest": {}, "entries": {}}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._data = json.load(f)
+
+    @staticmethod
+    def make_key(question: str, prompt_id: str, synthesis: str, fingerprint: str) -> str:
+        payload = "\x00".join([question.strip(), prompt_id, synthesis, fingerprint])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @property
+    def latest(self) -> dict:
+        """Fingerprint, prompt and synthesis of the last collection run, used in offline mode."""
+        return self._data.get("latest", {})
+
+    def get(self, question: str, prompt_id: str, synthesis: str, fingerprint: str) -> dict | None:
+        with self._lock:
+            entry = self._data["entries"].get(self.make_key(question, prompt_id, synthesis, fingerprint))
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry["response"]
+
+    def put(self, question: str, prompt_id: str, synthesis: str, fingerprint: str, response: dict):
+        with self._lock:
+            self._data["entries"][self.make_key(question, prompt_id, synthesis, fingerprint)] = {
+                "question": question,
+                "prompt": prompt_id,
+                "synthesis": synthesis,
+                "fingerprint": fingerprint,
+                "response": response,
+            }
+            self._data["latest"] = {"fingerprint": fingerprint, "prompt": prompt_id, "synthesis": synthesis}
+
+    def save(self):
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,108 @@
+"""
+CloudBase RAG — Startup profiler
+
+Measures how long the server takes to become useful, in two fresh
+processes:
+
+  1. `python -X importtime -c "import main"` (RAG_WARMUP=lazy) — the
+     modules that dominate import time, by cumulative microseconds.
+  2. main.warm_up() — the duration of each warm-up stage (models, index,
+     query engine, first retrieval) as recorded in main.startup_timings.
+
+With --max-import-ms / --max-ready-s it exits with status 1 when a
+threshold is exceeded, so a slow new top-level import shows up in CI.
+
+Usage:
+    python profile_startup.py
+    python profile_startup.py --top 30 --max-import-ms 1500 --max-ready-s 30
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+def profile_imports() -> tuple[int, list]:
+    """Return (total µs for `import main`, [(cumulative µs, module), ...])."""
+    env = {**os.environ, "RAG_WARMUP": "lazy"}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        print(proc.stdout + proc.stderr)
+        sys.exit(f"Importing main failed (exit {proc.returncode})")
+
+    modules, total = [], 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        modules.append((int(cumulative), name))
+        if name.strip() == "main":
+            total = int(cumulative)
+    return total, modules
+
+
+def profile_warmup() -> dict:
+    """Run main.warm_up() in a child process and return its stage timings."""
+    code = (
+        "import json, main\n"
+        "main.warm_up()\n"
+        "print(json.dumps(main.startup_timings))\n"
+    )
+    env = {**os.environ, "RAG_WARMUP": "lazy"}
+    proc = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(proc.stdout + proc.stderr)
+        sys.exit(f"Warm-up failed (exit {proc.returncode})")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=20, help="number of slowest imports to list")
+    parser.add_argument("--max-import-ms", type=float, help="fail if `import main` takes longer")
+    parser.add_argument("--max-ready-s", type=float, help="fail if warm-up finishes later")
+    args = parser.parse_args()
+
+    total_us, modules = profile_imports()
+    timings = profile_warmup()
+
+    print(f"\n{'='*70}")
+    print("  STARTUP PROFILE")
+    print(f"{'='*70}")
+    print(f"  import main: {total_us / 1000:.0f} ms")
+    print("\n  Slowest imports (cumulative):")
+    seen = set()
+    shown = 0
+    for cumulative, name in sorted(modules, reverse=True):
+        module = name.strip()
+        if module == "main" or module in seen:
+            continue
+        seen.add(module)
+        print(f"    {cumulative / 1000:>8.1f} ms  {module}")
+        shown += 1
+        if shown >= args.top:
+            break
+    print("\n  Warm-up stages:")
+    for stage, seconds in timings.items():
+        if stage not in ("import", "ready_after"):
+            print(f"    {stage:<16} {seconds:>8.2f} s")
+    print(f"    {'ready after':<16} {timings['ready_after']:>8.2f} s (from start of import)")
+    print(f"{'='*70}")
+
+    failures = []
+    if args.max_import_ms is not None and total_us / 1000 > args.max_import_ms:
+        failures.append(f"import main took {total_us / 1000:.0f} ms (limit {args.max_import_ms:.0f} ms)")
+    if args.max_ready_s is not None and timings["ready_after"] > args.max_ready_s:
+        failures.append(f"warm-up finished after {timings['ready_after']:.2f} s (limit {args.max_ready_s:.2f} s)")
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
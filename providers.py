@@ -0,0 +1,256 @@
+"""
+CloudBase RAG — Model providers
+
+Creates the LLM and the embedding model for the server (main.py) and the
+LLM judge (run_evaluation_llm.py). Besides the real backends there are two
+local stand-ins that need no API key, network or torch, so the server can
+be load-tested and profiled offline with reproducible results:
+
+  mock     an LLM that answers with the prompt sentences sharing the most
+           words with its last lines (the question), after a latency drawn
+           from a normal or lognormal distribution and at a fixed token
+           rate. Answer and latency are seeded by the prompt, so the same
+           prompt always gets the same answer after the same time.
+  hashing  an embedding model that hashes words and word bigrams into a
+           fixed number of dimensions (feature hashing), L2-normalized.
+
+Settings:
+    RAG_LLM_PROVIDER        openai (default) or mock
+    RAG_EMBED_PROVIDER      huggingface (default) or hashing
+    RAG_MOCK_LATENCY_MS     mock time to first token, median (default 300)
+    RAG_MOCK_JITTER_MS      its standard deviation (default 50)
+    RAG_MOCK_LATENCY_DIST   normal (default) or lognormal (long tail)
+    RAG_MOCK_TOKENS_PER_S   mock completion speed (default 50)
+    RAG_MOCK_ANSWER_TOKENS  mock answer length in words (default 40)
+    RAG_MOCK_SEED           changes all mock answers and latencies (default 0)
+    RAG_HASH_EMBED_DIM      hashing dimensions (default 384, as bge-small)
+"""
+
+import asyncio
+import hashlib
+import math
+import os
+import random
+import re
+import time
+from typing import Any, Callable
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.types import CompletionResponse, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+from pydantic import Field
+
+LLM_PROVIDER = os.getenv("RAG_LLM_PROVIDER", "openai")
+EMBED_PROVIDER = os.getenv("RAG_EMBED_PROVIDER", "huggingface")
+LLM_PROVIDERS = ("openai", "mock")
+EMBED_PROVIDERS = ("huggingface", "hashing")
+
+MOCK_LATENCY_MS = float(os.getenv("RAG_MOCK_LATENCY_MS", "300"))
+MOCK_JITTER_MS = float(os.getenv("RAG_MOCK_JITTER_MS", "50"))
+MOCK_LATENCY_DIST = os.getenv("RAG_MOCK_LATENCY_DIST", "normal")
+MOCK_TOKENS_PER_S = float(os.getenv("RAG_MOCK_TOKENS_PER_S", "50"))
+MOCK_ANSWER_TOKENS = int(os.getenv("RAG_MOCK_ANSWER_TOKENS", "40"))
+MOCK_SEED = int(os.getenv("RAG_MOCK_SEED", "0"))
+HASH_EMBED_DIM = int(os.getenv("RAG_HASH_EMBED_DIM", "384"))
+
+EMBED_MODEL = "BAAI/bge-small-en-v1.5"
+
+_WORD = re.compile(r"\w+")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def create_llm(model: str = "gpt-4o-mini", mock_response: Callable[[str], str] | None = None, **kwargs):
+    """The LLM of RAG_LLM_PROVIDER. mock_response(prompt) replaces the mock's
+    extractive answer, for callers that expect a particular format."""
+    if LLM_PROVIDER == "mock":
+        return MockLLM(model_name=f"mock:{model}", response_fn=mock_response)
+    if LLM_PROVIDER != "openai":
+        raise ValueError(f"Unknown RAG_LLM_PROVIDER '{LLM_PROVIDER}' (expected one of {', '.join(LLM_PROVIDERS)})")
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key or api_key == "your_api_key_here":
+        raise RuntimeError(
+            "OPENAI_API_KEY is not set or still the placeholder. Set your key in "
+            "openai_key.env, or run without one with RAG_LLM_PROVIDER=mock."
+        )
+    from llama_index.llms.openai import OpenAI
+
+    return OpenAI(model=model, **kwargs)
+
+
+def create_embed_model(embed_batch_size: int = 10):
+    """The embedding model of RAG_EMBED_PROVIDER."""
+    if EMBED_PROVIDER == "hashing":
+        return HashingEmbedding(dim=HASH_EMBED_DIM, embed_batch_size=embed_batch_size)
+    if EMBED_PROVIDER != "huggingface":
+        raise ValueError(
+            f"Unknown RAG_EMBED_PROVIDER '{EMBED_PROVIDER}' (expected one of {', '.join(EMBED_PROVIDERS)})"
+        )
+    # Imported here: the HuggingFace import alone pulls in torch and transformers
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    return HuggingFaceEmbedding(model_name=EMBED_MODEL, embed_batch_size=embed_batch_size)
+
+
+def query_instruction(embed_model: BaseEmbedding) -> str | None:
+    """The prefix that makes a text embedding of embed_model its query
+    embedding, so many questions can go through get_text_embedding_batch;
+    None if the model embeds queries differently."""
+    if isinstance(embed_model, HashingEmbedding):
+        return ""
+    if embed_model.class_name() == "HuggingFaceEmbedding":
+        from llama_index.embeddings.huggingface.utils import (
+            get_query_instruct_for_model_name,
+            get_text_instruct_for_model_name,
+        )
+
+        # The instructions the model was created with (see HuggingFaceEmbedding.__init__)
+        model_name = embed_model.model_name
+        if not (embed_model.text_instruction or get_text_instruct_for_model_name(model_name)):
+            return embed_model.query_instruction or get_query_instruct_for_model_name(model_name)
+    return None
+
+
+def _seed(*parts: str) -> int:
+    payload = "\x00".join([str(MOCK_SEED), *parts]).encode("utf-8")
+    return int.from_bytes(hashlib.sha256(payload).digest()[:8], "big")
+
+
+# ---------------------------------------------------------------------------
+# Mock LLM
+# ---------------------------------------------------------------------------
+
+def extractive_answer(prompt: str, max_words: int = MOCK_ANSWER_TOKENS) -> str:
+    """The sentences of prompt sharing the most words with its last two
+    lines (where the prompt templates put the question), best first."""
+    lines = [line for line in prompt.strip().splitlines() if line.strip()]
+    question = set(_WORD.findall(" ".join(lines[-2:]).casefold()))
+    sentences = [s.strip() for s in _SENTENCE.split("\n".join(lines[:-2])) if s.strip()]
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: (-len(question & set(_WORD.findall(sentences[i].casefold()))), i),
+    )
+    words = []
+    for i in ranked:
+        words += sentences[i].split()
+        if len(words) >= max_words:
+            break
+    return " ".join(words[:max_words]) or "Keine Antwort."
+
+
+class MockLLM(CustomLLM):
+    """Deterministic local stand-in for the OpenAI LLM (see module docstring)."""
+
+    model_name: str = "mock"
+    latency_ms: float = MOCK_LATENCY_MS
+    jitter_ms: float = MOCK_JITTER_MS
+    latency_dist: str = MOCK_LATENCY_DIST
+    tokens_per_s: float = MOCK_TOKENS_PER_S
+    response_fn: Callable[[str], str] | None = Field(default=None, exclude=True)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MockLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=128000, num_output=256, model_name=self.model_name)
+
+    def _plan(self, prompt: str) -> tuple[str, float, float]:
+        """(answer, seconds to first token, seconds per token) for prompt."""
+        rng = random.Random(_seed(self.model_name, prompt))
+        if self.latency_dist == "lognormal" and self.latency_ms > 0:
+            sigma = math.sqrt(math.log(1 + (self.jitter_ms / self.latency_ms) ** 2))
+            latency_ms = rng.lognormvariate(math.log(self.latency_ms), sigma)
+        else:
+            latency_ms = rng.gauss(self.latency_ms, self.jitter_ms)
+        answer = self.response_fn(prompt) if self.response_fn else extractive_answer(prompt)
+        per_token = 1 / self.tokens_per_s if self.tokens_per_s > 0 else 0.0
+        return answer, max(0.0, latency_ms) / 1000, per_token
+
+    @staticmethod
+    def _tokens(answer: str) -> list[str]:
+        words = answer.split(" ")
+        return [word + " " for word in words[:-1]] + words[-1:]
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        answer, first_token, per_token = self._plan(prompt)
+        time.sleep(first_token + per_token * len(self._tokens(answer)))
+        return CompletionResponse(text=answer)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        answer, first_token, per_token = self._plan(prompt)
+
+        def gen():
+            time.sleep(first_token)
+            text = ""
+            for token in self._tokens(answer):
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+                time.sleep(per_token)
+
+        return gen()
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        answer, first_token, per_token = self._plan(prompt)
+        await asyncio.sleep(first_token + per_token * len(self._tokens(answer)))
+        return CompletionResponse(text=answer)
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        answer, first_token, per_token = self._plan(prompt)
+
+        async def gen():
+            await asyncio.sleep(first_token)
+            text = ""
+            for token in self._tokens(answer):
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+                await asyncio.sleep(per_token)
+
+        return gen()
+
+
+# ---------------------------------------------------------------------------
+# Hashing embedder
+# ---------------------------------------------------------------------------
+
+class HashingEmbedding(BaseEmbedding):
+    """Feature hashing of words and word bigrams (see module docstring)."""
+
+    dim: int = HASH_EMBED_DIM
+
+    def __init__(self, dim: int = HASH_EMBED_DIM, **kwargs: Any):
+        super().__init__(dim=dim, model_name=f"hashing-{dim}", **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashingEmbedding"
+
+    def _embed(self, text: str) -> list[float]:
+        words = _WORD.findall(text.casefold())
+        counts = {}
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            counts[feature] = counts.get(feature, 0) + 1
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, count in counts.items():
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+            vector[h % self.dim] += (1.0 + math.log(count)) * (1 if h >> 63 else -1)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return self._embed(query)
@@ -0,0 +1,306 @@
+"""
+CloudBase RAG — Shared client for the evaluation scripts
+
+One pooled HTTP session for all worker threads, a token bucket instead of
+fixed sleeps between requests, retries with exponential backoff, and a
+concurrent map that returns results in the original row order.
+fetch_answers() adds the shared output cache on top (see output_cache.py)
+and records each request's latency; the server reports where the time went
+(debug=timings). usage_columns() turns both, and the LLM token cost, into
+CSV columns, and usage_summary() condenses them for a run, so synthesis
+modes can be compared on cost.
+"""
+
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from output_cache import OutputCache
+
+BASE_URL = "http://localhost:8000"
+RETRY_STATUS = {429, 500, 502, 503, 504}
+STAGES = ("embed", "retrieve", "rerank", "synthesize")
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` requests per second, bursts up to `capacity`.
+    A rate of 0 disables limiting.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RagClient:
+    def __init__(
+        self,
+        base_url: str = BASE_URL,
+        prompt_id: str = "",
+        synthesis: str = "",
+        concurrency: int = 4,
+        rate: float = 0,
+        retries: int = 3,
+        timeout: float = 60,
+    ):
+        self.base_url = base_url
+        self.prompt_id = prompt_id
+        self.synthesis = synthesis
+        self.retries = retries
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, concurrency))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def is_up(self) -> bool:
+        try:
+            self.session.get(f"{self.base_url}/prompts", timeout=5)
+        except requests.exceptions.RequestException:
+            return False
+        return True
+
+    def get(self, path: str, params: dict) -> dict:
+        return self.request("GET", path, params=params)
+
+    def post(self, path: str, payload: dict) -> dict:
+        return self.request("POST", path, json=payload)
+
+    def request(self, method: str, path: str, **kwargs) -> dict:
+        """Rate-limited request; retries connection errors, timeouts and
+        429/5xx responses with exponential backoff plus jitter."""
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            try:
+                resp = self.session.request(
+                    method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs
+                )
+                if resp.status_code not in RETRY_STATUS or attempt == self.retries:
+                    resp.raise_for_status()
+                    return resp.json()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == self.retries:
+                    raise
+            time.sleep(min(30, 2 ** attempt) + random.uniform(0, 0.5))
+
+    def index_info(self) -> dict:
+        return self.get("/index_info", {})
+
+    def query_with_context(self, question: str) -> dict:
+        params = {"query": question, "debug": "timings"}
+        if self.prompt_id:
+            params["prompt"] = self.prompt_id
+        if self.synthesis:
+            params["synthesis"] = self.synthesis
+        return self.get("/query_with_context", params)
+
+    def query_batch(self, questions: list) -> list:
+        """Answer several questions with one POST /query_batch request.
+        The batch's shared embed and retrieve time is split evenly across
+        the answers' timings."""
+        payload = {"queries": questions, "debug": "timings"}
+        if self.prompt_id:
+            payload["prompt"] = self.prompt_id
+        if self.synthesis:
+            payload["synthesis"] = self.synthesis
+        data = self.post("/query_batch", payload)
+        shared = {stage: ms / len(questions) for stage, ms in data.get("timings", {}).items()}
+        for result in data["results"]:
+            if "timings" in result:
+                result["timings"] = {**shared, **result["timings"]}
+        return data["results"]
+
+    def retrieve(self, questions: list, top_k: int) -> list:
+        """The top_k retrieved sources of each question (POST /retrieve, no LLM calls)."""
+        return self.post("/retrieve", {"queries": questions, "top_k": top_k})["results"]
+
+
+def run_ordered(fn, items: list, concurrency: int, on_done=None) -> list:
+    """Apply fn to every item on a thread pool and return results in input order.
+    on_done(index, result) is called as each item finishes, e.g. for progress output.
+    """
+    results = [None] * len(items)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {pool.submit(fn, item): i for i, item in enumerate(items)}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            if on_done:
+                on_done(i, results[i])
+    return results
+
+
+def resolve_cache_scope(client: RagClient, cache: OutputCache, offline: bool) -> tuple[str, str, str]:
+    """Return (prompt id, synthesis mode, index fingerprint) that cached answers
+    are keyed by. Offline, all three come from the last collection run
+    recorded in the cache.
+    """
+    if offline:
+        latest = cache.latest
+        return (
+            client.prompt_id or latest.get("prompt", ""),
+            client.synthesis or latest.get("synthesis", ""),
+            latest.get("fingerprint", ""),
+        )
+    info = client.index_info()
+    return client.prompt_id or info["default_prompt"], client.synthesis or info["synthesis"], info["fingerprint"]
+
+
+def fetch_answers(
+    client: RagClient,
+    questions: list,
+    concurrency: int,
+    cache: OutputCache | None = None,
+    fingerprint: str = "",
+    refresh: bool = False,
+    offline: bool = False,
+    batch_size: int = 0,
+    on_done=None,
+) -> list:
+    """Answer all questions concurrently; failures become ERROR answers.
+
+    With a cache, responses for (question, client.prompt_id, client.synthesis,
+    fingerprint) are read from it unless refresh is set, and fresh responses
+    are written back. Offline, questions missing from the cache are not sent
+    to the server. With batch_size > 0, missing questions go to /query_batch
+    in groups of that size instead of one /query_with_context request each.
+    Single requests get their round-trip time as "latency_ms".
+    """
+    if on_done is None:
+        done = 0
+
+        def on_done(i: int, data: dict):
+            nonlocal done
+            done += 1
+            print(f"[{done}/{len(questions)}] {questions[i][:80]}...")
+
+    answers = [None] * len(questions)
+    if cache is not None and not refresh:
+        for i, question in enumerate(questions):
+            answers[i] = cache.get(question, client.prompt_id, client.synthesis, fingerprint)
+            if answers[i] is not None:
+                on_done(i, answers[i])
+    missing = [i for i, answer in enumerate(answers) if answer is None]
+
+    def store(i: int, data: dict):
+        answers[i] = data
+        if cache is not None and not data.get("answer", "").startswith("ERROR:"):
+            cache.put(questions[i], client.prompt_id, client.synthesis, fingerprint, data)
+        on_done(i, data)
+
+    if offline:
+        for i in missing:
+            store(i, {"answer": "ERROR: not in cached outputs (run without --offline)", "sources": []})
+        return answers
+
+    if batch_size > 0:
+        groups = [missing[j:j + batch_size] for j in range(0, len(missing), batch_size)]
+
+        def fetch_group(group: list) -> list:
+            try:
+                results = client.query_batch([questions[i] for i in group])
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                return [{"answer": f"ERROR: {e}", "sources": []}] * len(group)
+            return [
+                r if "answer" in r else {"answer": f"ERROR: {r.get('message', '')}", "sources": []}
+                for r in results
+            ]
+
+        def group_done(g: int, results: list):
+            for i, data in zip(groups[g], results):
+                store(i, data)
+
+        run_ordered(fetch_group, groups, concurrency, on_done=group_done)
+    else:
+        def fetch(i: int) -> dict:
+            start = time.perf_counter()
+            try:
+                data = client.query_with_context(questions[i])
+            except (requests.exceptions.RequestException, ValueError) as e:
+                return {"answer": f"ERROR: {e}", "sources": []}
+            data["latency_ms"] = round((time.perf_counter() - start) * 1000)
+            return data
+
+        run_ordered(fetch, missing, concurrency, on_done=lambda j, data: store(missing[j], data))
+
+    if cache is not None:
+        cache.save()
+    return answers
+
+
+def usage_columns(data: dict) -> dict:
+    """CSV columns on the synthesis mode, latency, per-stage time and LLM cost of one answer."""
+    usage = data.get("usage", {})
+    timings = data.get("timings", {})
+    return {
+        "synthesis": data.get("synthesis", ""),
+        "cache": data.get("cache", ""),
+        "latency_ms": data.get("latency_ms", ""),
+        **{f"{stage}_ms": round(timings[stage], 1) if stage in timings else "" for stage in STAGES},
+        "llm_calls": usage.get("llm_calls", ""),
+        "prompt_tokens": usage.get("prompt_tokens", ""),
+        "completion_tokens": usage.get("completion_tokens", ""),
+    }
+
+
+def usage_summary(rows) -> list[str]:
+    """Summary lines on latency and LLM cost of the answers that were
+    generated (answer cache hits and failed requests are left out), from
+    rows of usage_columns(), e.g. as read back from a results CSV."""
+    n = calls = prompt_tokens = completion_tokens = 0
+    synthesis, latencies = set(), []
+    stage_totals, stage_counts = Counter(), Counter()
+    for row in rows:
+        if row.get("llm_calls") in ("", None) or row.get("cache") in ("exact", "semantic"):
+            continue
+        n += 1
+        calls += int(row["llm_calls"])
+        prompt_tokens += int(row["prompt_tokens"])
+        completion_tokens += int(row["completion_tokens"])
+        synthesis.add(row.get("synthesis") or "?")
+        if row.get("latency_ms") not in ("", None):
+            latencies.append(int(row["latency_ms"]))
+        for stage in STAGES:
+            if row.get(f"{stage}_ms") not in ("", None):
+                stage_totals[stage] += float(row[f"{stage}_ms"])
+                stage_counts[stage] += 1
+    if not n:
+        return ["Cost               : n/a (no usage reported, or all answers cached)"]
+    lines = [
+        f"Synthesis          : {', '.join(sorted(synthesis))}",
+        f"LLM calls/question : {calls / n:.2f}",
+        f"Tokens/question    : {prompt_tokens / n:.0f} prompt + {completion_tokens / n:.0f} completion",
+        f"Tokens total       : {prompt_tokens + completion_tokens} ({n} answers)",
+    ]
+    if latencies:
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        lines.append(f"Latency            : p50 {p50} ms, p95 {p95} ms")
+    stage_means = [f"{stage} {stage_totals[stage] / stage_counts[stage]:.0f}" for stage in STAGES if stage_counts[stage]]
+    if stage_means:
+        lines.append(f"Stages (mean ms)   : {', '.join(stage_means)}")
+    return lines
@@ -0,0 +1,196 @@
+"""
+CloudBase RAG — Reranking
+
+Optional stage between retrieval and synthesis: the retriever fetches
+RAG_RERANK_CANDIDATES chunks instead of the usual top-k, the reranker
+orders them and only the best RAG_RERANK_TOP_N go to the LLM, so answers
+are built from fewer, better chunks (fewer synthesis tokens and calls).
+
+RAG_RERANK selects the method:
+
+  off            no reranking (default)
+  cross-encoder  scores every (question, chunk) pair with a local
+                 sentence-transformers cross-encoder (RAG_RERANK_MODEL).
+                 Scores are cached by (question, chunk), so repeated and
+                 batched questions don't pay for the model twice.
+  mmr            maximal marginal relevance over the chunk embeddings
+                 already in the vector store (nothing is re-embedded):
+                 relevance to the question minus similarity to the chunks
+                 picked so far, weighted by RAG_MMR_LAMBDA.
+  threshold      keeps the best chunks by retrieval score.
+
+With RAG_RERANK_THRESHOLD set, chunks scoring below it are dropped in
+every mode (cross-encoder logits, MMR relevance or retrieval scores).
+
+Settings:
+    RAG_RERANK              off (default), cross-encoder, mmr or threshold
+    RAG_RERANK_CANDIDATES   chunks retrieved for reranking (default 10)
+    RAG_RERANK_TOP_N        chunks passed on to synthesis (default 2)
+    RAG_RERANK_THRESHOLD    minimum score (default: none)
+    RAG_RERANK_MODEL        cross-encoder (default cross-encoder/ms-marco-MiniLM-L-6-v2)
+    RAG_RERANK_CACHE_SIZE   cached (question, chunk) scores (default 10000)
+    RAG_MMR_LAMBDA          relevance vs. diversity in mmr mode (default 0.7)
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from pydantic import PrivateAttr
+
+RERANK = os.getenv("RAG_RERANK", "off")
+RERANK_MODES = ("off", "cross-encoder", "mmr", "threshold")
+RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "10"))
+RERANK_TOP_N = int(os.getenv("RAG_RERANK_TOP_N", "2"))
+RERANK_THRESHOLD = float(os.getenv("RAG_RERANK_THRESHOLD")) if os.getenv("RAG_RERANK_THRESHOLD") else None
+RERANK_MODEL = os.getenv("RAG_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CACHE_SIZE = int(os.getenv("RAG_RERANK_CACHE_SIZE", "10000"))
+MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+
+
+class ScoreCache:
+    """LRU cache of cross-encoder scores by (question, node id). Node ids
+    change when a chunk's text does, so entries never go stale."""
+
+    def __init__(self, max_size: int = RERANK_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, query: str, node_ids: list[str]) -> list[float | None]:
+        with self._lock:
+            scores = []
+            for node_id in node_ids:
+                key = (query, node_id)
+                score = self._scores.get(key)
+                if score is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    self._scores.move_to_end(key)
+                scores.append(score)
+            return scores
+
+    def put_many(self, query: str, scores: dict[str, float]):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            for node_id, score in scores.items():
+                self._scores[(query, node_id)] = score
+                self._scores.move_to_end((query, node_id))
+            while len(self._scores) > self.max_size:
+                self._scores.popitem(last=False)
+
+
+score_cache = ScoreCache()
+_models = {}
+_models_lock = threading.Lock()
+
+
+def load_cross_encoder(model_name: str = RERANK_MODEL):
+    """The cross-encoder, loaded once per process (on first use or by the warm-up)."""
+    with _models_lock:
+        if model_name not in _models:
+            # Imported here: sentence-transformers pulls in torch
+            from sentence_transformers import CrossEncoder
+
+            _models[model_name] = CrossEncoder(model_name)
+        return _models[model_name]
+
+
+def chunk_embeddings(index, node_ids: list[str]) -> dict[str, np.ndarray]:
+    """Stored embeddings of the given chunks, from the index's vector store."""
+    vector_store = index.storage_context.vector_store
+    if hasattr(vector_store, "get_embeddings"):
+        return vector_store.get_embeddings(node_ids)
+    embeddings = {}
+    for node_id in node_ids:
+        try:
+            embeddings[node_id] = np.asarray(vector_store.get(node_id), dtype=np.float32)
+        except KeyError:
+            pass
+    return embeddings
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class Reranker(BaseNodePostprocessor):
+    """Node postprocessor reordering and cutting the retrieved candidates of
+    one index (mmr reads the chunk embeddings from its vector store)."""
+
+    mode: str = RERANK
+    top_n: int = RERANK_TOP_N
+    threshold: float | None = RERANK_THRESHOLD
+    model_name: str = RERANK_MODEL
+    mmr_lambda: float = MMR_LAMBDA
+    _index = PrivateAttr(default=None)
+
+    def __init__(self, index=None, **kwargs):
+        super().__init__(**kwargs)
+        if self.mode not in RERANK_MODES:
+            raise ValueError(f"Unknown RAG_RERANK '{self.mode}' (expected one of {', '.join(RERANK_MODES)})")
+        self._index = index
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "Reranker"
+
+    def _cross_encoder_scores(self, query: str, nodes: list[NodeWithScore]) -> list[float]:
+        node_ids = [n.node.node_id for n in nodes]
+        cache_key = f"{self.model_name}\x00{query}"
+        scores = score_cache.get_many(cache_key, node_ids)
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            pairs = [(query, nodes[i].node.get_content(metadata_mode=MetadataMode.EMBED)) for i in missing]
+            predicted = load_cross_encoder(self.model_name).predict(pairs)
+            for i, score in zip(missing, predicted):
+                scores[i] = float(score)
+            score_cache.put_many(cache_key, {node_ids[i]: scores[i] for i in missing})
+        return scores
+
+    def _mmr(self, query_bundle: QueryBundle, nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+        stored = chunk_embeddings(self._index, [n.node.node_id for n in nodes])
+        nodes = [n for n in nodes if n.node.node_id in stored]
+        if not nodes:
+            return []
+        query_embedding = query_bundle.embedding
+        if query_embedding is None:
+            query_embedding = Settings.embed_model.get_query_embedding(query_bundle.query_str)
+        vectors = _unit(np.stack([stored[n.node.node_id] for n in nodes]))
+        relevance = vectors @ _unit(np.asarray(query_embedding, dtype=np.float32))
+        similarity = vectors @ vectors.T
+
+        picked, remaining = [], list(range(len(nodes)))
+        while remaining and len(picked) < self.top_n:
+            redundancy = similarity[np.ix_(remaining, picked)].max(axis=1) if picked else 0.0
+            mmr = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            best = remaining[int(np.argmax(mmr))]
+            picked.append(best)
+            remaining.remove(best)
+        return [NodeWithScore(node=nodes[i].node, score=float(relevance[i])) for i in picked]
+
+    def _postprocess_nodes(
+        self, nodes: list[NodeWithScore], query_bundle: QueryBundle | None = None
+    ) -> list[NodeWithScore]:
+        if self.mode == "off" or not nodes:
+            return nodes
+        if self.mode == "cross-encoder":
+            scores = self._cross_encoder_scores(query_bundle.query_str, nodes)
+            ranked = [NodeWithScore(node=n.node, score=s) for n, s in zip(nodes, scores)]
+            ranked.sort(key=lambda n: n.score, reverse=True)
+        elif self.mode == "mmr":
+            ranked = self._mmr(query_bundle, nodes)
+        else:
+            ranked = sorted(nodes, key=lambda n: n.score or 0.0, reverse=True)
+        if self.threshold is not None:
+            ranked = [n for n in ranked if (n.score or 0.0) >= self.threshold]
+        return ranked[:self.top_n]
@@ -5,28 +5,80 @@ Queries the RAG backend and assesses each answer using:
 1. Retrieval accuracy — Was the correct source document retrieved?
 2. Keyword match    — What % of expected keywords appear in the answer?
 
+The summary also reports the latency and LLM cost (calls and tokens per
+question) of the answers, so synthesis modes can be compared:
+    python run_evaluation.py --synthesis tree_summarize --refresh
+    python run_evaluation.py --synthesis compact --refresh
+
+Questions are sent concurrently (--concurrency) through a shared HTTP
+session, rate-limited by a token bucket (--rate) and retried with backoff;
+results are appended to the CSV in the original row order as they are
+scored. An interrupted run continues with --resume (see eval_run.py).
+
+--retrieval-only skips the answers: questions go to POST /retrieve in
+batches (no LLM calls), and hit@k, recall@k, MRR and nDCG@k against
+erwartetes_dokument are reported for every k of --k (see scoring.py).
+
 Usage:
-    python run_evaluation.py
+    python run_evaluation.py [--concurrency 8] [--batch-size 16] [--rate 5] [--prompt improved] [--synthesis compact]
+    python run_evaluation.py --resume
+    python run_evaluation.py --retrieval-only [--k 1,3,5,10] [--batch-size 128]
 
 Prerequisites:
     uvicorn main:app --host 127.0.0.1 --port 8000
 """
 
+import argparse
 import csv
 import os
 import sys
 import time
-import requests
 
-BASE_URL = "http://localhost:8000"
+import pandas as pd
+
+from eval_run import CHECKPOINT_EVERY, EvalRun
+from output_cache import OutputCache
+from rag_client import BASE_URL, RagClient, fetch_answers, resolve_cache_scope, run_ordered, usage_columns, usage_summary
+from scoring import (
+    expected_documents,
+    keyword_coverage,
+    mean_metrics,
+    retrieval_hits,
+    retrieval_metrics,
+    split_keywords,
+    summarize,
+)
+
 INPUT_CSV = "cloudbase-testfragen.csv"
+PROMPT_ID = os.getenv("RAG_PROMPT", "")  # empty = server default
+SYNTHESIS = os.getenv("RAG_SYNTHESIS", "")  # empty = server default
 OUTPUT_CSV = "evaluation_results.csv"
-
-
-def query_rag(question: str) -> dict:
-    resp = requests.get(f"{BASE_URL}/query_with_context", params={"query": question}, timeout=60)
-    resp.raise_for_status()
-    return resp.json()
+RETRIEVAL_CSV = "evaluation_results_retrieval.csv"
+RETRIEVAL_BATCH_SIZE = 64
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="CloudBase RAG — Keyword Assessment")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel RAG requests")
+    parser.add_argument("--rate", type=float, default=0, help="max requests/sec (0 = unlimited)")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60, help="per-request timeout in seconds")
+    parser.add_argument("--prompt", default=PROMPT_ID, help="prompt id (default: server default)")
+    parser.add_argument("--synthesis", default=SYNTHESIS,
+                        help="synthesis mode, e.g. compact (default: server default)")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="questions per POST /query_batch request (0 = one request each)")
+    parser.add_argument("--refresh", action="store_true", help="ignore cached outputs and re-query")
+    parser.add_argument("--offline", action="store_true", help="score cached outputs only, no server")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the last run (see its .run.json), skipping finished questions")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY,
+                        help="questions fetched per chunk between checkpoints")
+    parser.add_argument("--retrieval-only", action="store_true",
+                        help="score retrieval only via /retrieve, without answers (no LLM calls)")
+    parser.add_argument("--k", default="1,3,5,10",
+                        help="comma-separated cutoffs for --retrieval-only (the largest is retrieved)")
+    return parser.parse_args()
 
 
 def format_chunks(sources: list) -> str:
@@ -49,128 +101,205 @@ def get_retrieved_filenames(sources: list) -> list:
     return filenames
 
 
-def check_retrieval(expected_doc: str, retrieved_filenames: list) -> bool:
-    """Check if at least one expected document was retrieved.
-    Expected can be pipe-separated (e.g. 'integrationen.md|produkt-professional.md').
-    'KEINE' means no specific document is expected (unanswerable question).
+def score_answers(rows: list, answers: list) -> list[dict]:
+    """Result rows of a chunk of answers, scored in one batch (see scoring.py):
+    1. Retrieval — was an expected document retrieved?
+    2. Keywords  — which expected keywords does the answer contain?
     """
-    expected_doc = expected_doc.strip()
-    if expected_doc.upper() == "KEINE":
-        return True
-    expected_docs = [d.strip() for d in expected_doc.split("|")]
-    return any(doc in retrieved_filenames for doc in expected_docs)
+    retrieved = [get_retrieved_filenames(data.get("sources", [])) for data in answers]
+    hits = retrieval_hits([row.get("erwartetes_dokument", "") for row in rows], retrieved)
+    found, missing, ratios = keyword_coverage(
+        [data.get("answer", "") for data in answers], [row.get("erwartete_keywords", "") for row in rows]
+    )
+    return [
+        {
+            **row,
+            "rag_answer": data.get("answer", ""),
+            "retrieved_chunks": format_chunks(data.get("sources", [])),
+            "retrieval_hit": "TRUE" if hit else "FALSE",
+            "retrieved_files": ", ".join(filenames),
+            "keyword_found": ", ".join(found_kw),
+            "keyword_missing": ", ".join(missing_kw),
+            "keyword_score": f"{kw_ratio:.2f}",
+            **usage_columns(data),
+        }
+        for row, data, filenames, hit, found_kw, missing_kw, kw_ratio
+        in zip(rows, answers, retrieved, hits, found, missing, ratios)
+    ]
+
+
+def print_result(result: dict):
+    if result["rag_answer"].startswith("ERROR:"):
+        print(f"  {result['rag_answer']}")
+    retrieval_hit = result["retrieval_hit"] == "TRUE"
+    kw_ratio = float(result["keyword_score"])
+    found_kw, missing_kw = split_keywords(result["keyword_found"]), split_keywords(result["keyword_missing"])
+    if retrieval_hit and kw_ratio == 1.0:
+        status = "OK"
+    elif retrieval_hit or kw_ratio > 0:
+        status = "PARTIAL"
+    else:
+        status = "FAIL"
+    print(
+        f"  Retrieval: {'HIT' if retrieval_hit else 'MISS'} | "
+        f"Keywords: {len(found_kw)}/{len(found_kw)+len(missing_kw)} | {status}"
+    )
+    if missing_kw:
+        print(f"  Missing keywords: {', '.join(missing_kw)}")
+
+
+def evaluate_retrieval(client: RagClient, rows: list, args):
+    """--retrieval-only: retrieve for all questions in batches and score the rankings."""
+    ks = sorted({int(k) for k in args.k.split(",") if k.strip()})
+    questions = [row["frage"].strip() for row in rows]
+    batch_size = args.batch_size or RETRIEVAL_BATCH_SIZE
+    groups = [list(range(j, min(j + batch_size, len(questions)))) for j in range(0, len(questions), batch_size)]
+    print(f"Retrieving top {ks[-1]} for {len(questions)} questions ({len(groups)} batches)\n")
+
+    start = time.perf_counter()
+    retrieved = run_ordered(
+        lambda group: client.retrieve([questions[i] for i in group], ks[-1]),
+        groups,
+        args.concurrency,
+        on_done=lambda g, _: print(f"[{min((g + 1) * batch_size, len(questions))}/{len(questions)}] batch done"),
+    )
+    seconds = time.perf_counter() - start
+    retrieved = [result for group in retrieved for result in group]
+
+    results, scores, top_scores, unanswerable = [], [], [], []
+    for row, result in zip(rows, retrieved):
+        ranked = get_retrieved_filenames(result["sources"])
+        expected = expected_documents(row.get("erwartetes_dokument", ""))
+        metrics = retrieval_metrics(expected, ranked, ks) if expected else {}
+        scores.append(metrics)
+        top_score = result["sources"][0]["score"] if result["sources"] else None
+        if top_score is not None:
+            (top_scores if expected else unanswerable).append(top_score)
+        results.append({
+            **row,
+            "retrieved_files": ", ".join(ranked),
+            "top_score": f"{top_score:.4f}" if top_score is not None else "",
+            **{name: f"{value:.4f}" for name, value in metrics.items()},
+        })
 
+    metric_names = [f"{name}@{k}" for k in ks for name in ("hit", "recall", "ndcg")] + ["mrr"]
+    fieldnames = list(rows[0].keys()) + ["retrieved_files", "top_score"] + metric_names
+    with open(RETRIEVAL_CSV, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=";", restval="")
+        writer.writeheader()
+        writer.writerows(results)
 
-def check_keywords(expected_keywords: str, answer: str) -> tuple:
-    """Check which expected keywords appear in the answer (case-insensitive).
-    Returns (found_keywords, missing_keywords, ratio).
-    """
-    if not expected_keywords.strip():
-        return [], [], 1.0
-    keywords = [kw.strip() for kw in expected_keywords.split(",") if kw.strip()]
-    answer_lower = answer.lower()
-    found = [kw for kw in keywords if kw.lower() in answer_lower]
-    missing = [kw for kw in keywords if kw.lower() not in answer_lower]
-    ratio = len(found) / len(keywords) if keywords else 1.0
-    return found, missing, ratio
+    means = mean_metrics(scores)
+    scored = sum(1 for metrics in scores if metrics)
+    print(f"\n{'='*60}")
+    print(f"  RETRIEVAL SUMMARY ({len(rows)} questions, {scored} with expected documents)")
+    print(f"{'='*60}")
+    if means:
+        print(f"  {'k':>4}  {'hit@k':>7}  {'recall@k':>8}  {'nDCG@k':>7}")
+        for k in ks:
+            print(f"  {k:>4}  {means[f'hit@{k}']:>7.3f}  {means[f'recall@{k}']:>8.3f}  {means[f'ndcg@{k}']:>7.3f}")
+        print(f"  MRR                : {means['mrr']:.3f}")
+    if top_scores and unanswerable:
+        print(f"  Mean top score     : {sum(top_scores) / len(top_scores):.4f} with expected document, "
+              f"{sum(unanswerable) / len(unanswerable):.4f} without (KEINE)")
+    print(f"  Retrieval time     : {seconds:.2f}s ({len(rows) / seconds:.0f} questions/s, no LLM calls)")
+    print(f"{'='*60}")
+    print(f"  Results saved to {RETRIEVAL_CSV}")
 
 
 def main():
+    args = parse_args()
+    client = RagClient(
+        BASE_URL,
+        prompt_id=args.prompt,
+        synthesis=args.synthesis,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        retries=args.retries,
+        timeout=args.timeout,
+    )
+
+    if args.retrieval_only and args.offline:
+        print("ERROR: --retrieval-only needs the server (retrievals are not cached).")
+        sys.exit(1)
+
     # Pre-flight: check server is running
-    try:
-        requests.get(f"{BASE_URL}/query?query=ping", timeout=5)
-    except requests.exceptions.RequestException:
+    if not args.offline and not client.is_up():
         print("ERROR: RAG server is not running!")
         print("Start it with: uvicorn main:app --host 127.0.0.1 --port 8000")
         sys.exit(1)
+    outputs = OutputCache()
+    client.prompt_id, client.synthesis, fingerprint = resolve_cache_scope(client, outputs, args.offline)
 
     with open(INPUT_CSV, encoding="utf-8") as f:
         reader = csv.DictReader(f, delimiter=";")
         rows = list(reader)
 
-    print(f"Loaded {len(rows)} questions from {INPUT_CSV}\n")
-
-    results = []
-    retrieval_scores = []
-    keyword_scores = []
-
-    for i, row in enumerate(rows, 1):
-        question = row.get("frage", "").strip()
-        if not question:
-            continue
-
-        print(f"[{i}/{len(rows)}] {question[:80]}...")
-
-        try:
-            data = query_rag(question)
-            answer = data.get("answer", "")
-            sources = data.get("sources", [])
-            chunks = format_chunks(sources)
-        except (requests.exceptions.RequestException, ValueError) as e:
-            print(f"  ERROR: {e}")
-            answer = f"ERROR: {e}"
-            sources = []
-            chunks = ""
-
-        # Retrieval scoring
-        retrieved_filenames = get_retrieved_filenames(sources)
-        expected_doc = row.get("erwartetes_dokument", "")
-        retrieval_hit = check_retrieval(expected_doc, retrieved_filenames)
-        retrieval_scores.append(retrieval_hit)
-
-        # Keyword scoring
-        expected_keywords = row.get("erwartete_keywords", "")
-        found_kw, missing_kw, kw_ratio = check_keywords(expected_keywords, answer)
-        keyword_scores.append(kw_ratio)
-
-        if retrieval_hit and kw_ratio == 1.0:
-            status = "OK"
-        elif retrieval_hit or kw_ratio > 0:
-            status = "PARTIAL"
-        else:
-            status = "FAIL"
-        print(
-            f"  Retrieval: {'HIT' if retrieval_hit else 'MISS'} | "
-            f"Keywords: {len(found_kw)}/{len(found_kw)+len(missing_kw)} | {status}"
-        )
-        if missing_kw:
-            print(f"  Missing keywords: {', '.join(missing_kw)}")
-
-        results.append({
-            **row,
-            "rag_answer": answer,
-            "retrieved_chunks": chunks,
-            "retrieval_hit": "TRUE" if retrieval_hit else "FALSE",
-            "retrieved_files": ", ".join(retrieved_filenames),
-            "keyword_found": ", ".join(found_kw) if found_kw else "",
-            "keyword_missing": ", ".join(missing_kw) if missing_kw else "",
-            "keyword_score": f"{kw_ratio:.2f}",
-        })
+    print(f"Loaded {len(rows)} questions from {INPUT_CSV}")
+    print(f"Concurrency: {args.concurrency}\n")
 
-        time.sleep(0.5)
+    rows = [row for row in rows if row.get("frage", "").strip()]
+    if args.retrieval_only:
+        evaluate_retrieval(client, rows, args)
+        return
+    try:
+        run = EvalRun(OUTPUT_CSV, "run_evaluation.py", {
+            "input": INPUT_CSV,
+            "prompt": client.prompt_id,
+            "synthesis": client.synthesis,
+            "fingerprint": fingerprint,
+        }, resume=args.resume)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    if args.resume:
+        print(f"Resuming run {run.run_id}: {run.completed}/{len(rows)} questions done\n")
+    else:
+        print(f"Run {run.run_id}\n")
 
-    if not results:
+    try:
+        for chunk in run.chunks(rows, args.checkpoint_every):
+            answers = fetch_answers(
+                client,
+                [row["frage"].strip() for _, row in chunk],
+                args.concurrency,
+                cache=outputs,
+                fingerprint=fingerprint,
+                refresh=args.refresh,
+                offline=args.offline,
+                batch_size=args.batch_size,
+                on_done=lambda i, data: None,
+            )
+            for (i, row), result in zip(chunk, score_answers([row for _, row in chunk], answers)):
+                print(f"[{i}/{len(rows)}] {row['frage'].strip()[:80]}...")
+                print_result(result)
+                run.append(result)
+            run.checkpoint()
+    except KeyboardInterrupt:
+        run.finish("interrupted")
+        print(f"\nInterrupted after {run.completed}/{len(rows)} questions; "
+              f"continue with: python run_evaluation.py --resume")
+        sys.exit(130)
+    run.finish()
+    print(f"\nCached outputs used: {outputs.hits} (prompt {client.prompt_id}, synthesis {client.synthesis or '?'}, index {fingerprint or '?'})")
+
+    # Summary, from all rows of the run (including those of earlier sessions)
+    if not run.completed:
         print("No results to write.")
         sys.exit(1)
-
-    fieldnames = list(results[0].keys())
-    with open(OUTPUT_CSV, "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=";")
-        writer.writeheader()
-        writer.writerows(results)
-
-    # Summary
-    total = len(results)
-    retrieval_hits = sum(retrieval_scores)
-    avg_keyword = sum(keyword_scores) / total if total else 0
-    perfect = sum(1 for r, k in zip(retrieval_scores, keyword_scores) if r and k == 1.0)
+    summary = summarize(pd.read_csv(
+        OUTPUT_CSV, sep=";", usecols=["retrieval_hit", "keyword_found", "keyword_missing", "keyword_score"], dtype=str, keep_default_na=False
+    ))
+    total, hits, perfect = summary["total"], summary["retrieval_hits"], summary["perfect"]
 
     print(f"\n{'='*60}")
-    print(f"  RESULTS SUMMARY ({total} questions)")
+    print(f"  RESULTS SUMMARY ({total} questions, run {run.run_id})")
     print(f"{'='*60}")
-    print(f"  Retrieval accuracy : {retrieval_hits}/{total} ({retrieval_hits/total*100:.1f}%)")
-    print(f"  Avg keyword score  : {avg_keyword*100:.1f}%")
+    print(f"  Retrieval accuracy : {hits}/{total} ({hits/total*100:.1f}%)")
+    print(f"  Avg keyword score  : {summary['keyword_score']*100:.1f}%")
     print(f"  Perfect answers    : {perfect}/{total} ({perfect/total*100:.1f}%)")
+    for line in usage_summary(run.rows()):
+        print(f"  {line}")
     print(f"{'='*60}")
     print(f"  Results saved to {OUTPUT_CSV}")
     print(f"  Open eval_review.html to review results visually.")
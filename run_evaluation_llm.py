@@ -4,36 +4,57 @@ CloudBase RAG — LLM-as-Judge
 Queries the RAG backend and uses an LLM judge to determine whether
 each answer is semantically correct compared to the expected answer.
 
+RAG answers and judge calls both run concurrently. Verdicts are cached in
+cache/judge_verdicts.sqlite, keyed by a hash of the judge model, the system
+prompt and the formatted user message, so re-runs only judge changed answers.
+Results are appended to the CSV chunk by chunk; an interrupted run
+continues with --resume (see eval_run.py).
+
+The judge LLM comes from providers.py like the server's: with
+RAG_LLM_PROVIDER=mock it is a local stand-in that says YES when the
+actual answer contains at least half of the expected answer's words, so
+the whole pipeline runs offline and reproducibly.
+
 Usage:
-    python run_evaluation_llm.py
+    python run_evaluation_llm.py [--concurrency 8] [--batch-size 16] [--judge-workers 8] [--no-judge-cache]
+    python run_evaluation_llm.py --synthesis compact   # latency and token cost are in the summary
+    python run_evaluation_llm.py --resume              # after a crash or Ctrl-C
 
 Prerequisites:
     uvicorn main:app --host 127.0.0.1 --port 8000
 """
 
+import argparse
 import csv
+import hashlib
 import json
 import os
+import re
+import sqlite3
 import sys
+import threading
 import time
-import requests
 
+import pandas as pd
 from dotenv import load_dotenv
-from openai import APIError, OpenAI
+from llama_index.core.llms import ChatMessage
+from openai import APIError
+
+from eval_run import CHECKPOINT_EVERY, EvalRun
+from output_cache import OutputCache
+from providers import LLM_PROVIDER, create_llm
+from rag_client import BASE_URL, RagClient, fetch_answers, resolve_cache_scope, run_ordered, usage_columns, usage_summary
+from scoring import retrieval_hits, summarize
 
-BASE_URL = "http://localhost:8000"
 INPUT_CSV = "cloudbase-testfragen.csv"
+PROMPT_ID = os.getenv("RAG_PROMPT", "")  # empty = server default
+SYNTHESIS = os.getenv("RAG_SYNTHESIS", "")  # empty = server default
 OUTPUT_CSV = "evaluation_results_llm.csv"
 JUDGE_MODEL = "gpt-4o-mini"
+JUDGE_CACHE_PATH = "./cache/judge_verdicts.sqlite"
 
 # Load API key the same way as main.py
 load_dotenv(dotenv_path="./openai_key.env")
-_api_key = os.getenv("OPENAI_API_KEY")
-if not _api_key or _api_key == "your_api_key_here":
-    print("ERROR: OPENAI_API_KEY is not set or still the placeholder.")
-    print("Please set your key in openai_key.env")
-    sys.exit(1)
-client = OpenAI(api_key=_api_key)
 
 JUDGE_SYSTEM_PROMPT = """\
 Du bist ein strenger Evaluator fuer ein RAG-System ueber das Produkt "CloudBase".
@@ -64,10 +85,72 @@ Testgrund: {why}\
 """
 
 
-def query_rag(question: str) -> dict:
-    resp = requests.get(f"{BASE_URL}/query_with_context", params={"query": question}, timeout=60)
-    resp.raise_for_status()
-    return resp.json()
+class VerdictCache:
+    """Persistent judge verdicts. Only well-formed YES/NO verdicts are stored,
+    so API failures and invalid JSON are retried on the next run."""
+
+    def __init__(self, path: str = JUDGE_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, verdict TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(user_msg: str) -> str:
+        model = JUDGE_MODEL if LLM_PROVIDER == "openai" else f"{LLM_PROVIDER}:{JUDGE_MODEL}"
+        payload = "\x00".join([model, JUDGE_SYSTEM_PROMPT, user_msg])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT verdict FROM verdicts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, verdict: dict):
+        if str(verdict.get("verdict", "")).upper() not in ("YES", "NO"):
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO verdicts (key, verdict) VALUES (?, ?)",
+                (key, json.dumps(verdict, ensure_ascii=False)),
+            )
+            self._conn.commit()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="CloudBase RAG — LLM-as-Judge")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel RAG requests")
+    parser.add_argument("--judge-workers", type=int, default=4, help="parallel judge calls")
+    parser.add_argument("--rate", type=float, default=0, help="max RAG requests/sec (0 = unlimited)")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60, help="per-request timeout in seconds")
+    parser.add_argument("--prompt", default=PROMPT_ID, help="prompt id (default: server default)")
+    parser.add_argument("--synthesis", default=SYNTHESIS,
+                        help="synthesis mode, e.g. compact (default: server default)")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="questions per POST /query_batch request (0 = one request each)")
+    parser.add_argument("--refresh", action="store_true", help="ignore cached outputs and re-query")
+    parser.add_argument("--offline", action="store_true", help="score cached outputs only, no server")
+    parser.add_argument("--no-judge-cache", action="store_true", help="always call the judge")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the last run (see its .run.json), skipping finished questions")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY,
+                        help="questions answered and judged per chunk between checkpoints")
+    return parser.parse_args()
 
 
 def format_chunks(sources: list) -> str:
@@ -90,33 +173,51 @@ def get_retrieved_filenames(sources: list) -> list:
     return filenames
 
 
-def check_retrieval(expected_doc: str, retrieved_filenames: list) -> bool:
-    expected_doc = expected_doc.strip()
-    if expected_doc.upper() == "KEINE":
-        return True
-    expected_docs = [d.strip() for d in expected_doc.split("|")]
-    return any(doc in retrieved_filenames for doc in expected_docs)
+def mock_verdict(prompt: str) -> str:
+    """Verdict of the stand-in judge: YES if the actual answer contains at
+    least half of the (longer) words of the expected answer."""
+    match = re.search(r"Erwartete Antwort: (.*?)\nTatsaechliche Antwort: (.*?)\nTestgrund:", prompt, re.S)
+    expected, actual = match.groups() if match else ("", "")
+    expected_words = {w for w in re.findall(r"\w+", expected.lower()) if len(w) > 3}
+    found = expected_words & set(re.findall(r"\w+", actual.lower()))
+    ratio = len(found) / len(expected_words) if expected_words else 0.0
+    return json.dumps({
+        "verdict": "YES" if ratio >= 0.5 else "NO",
+        "reason": f"Mock-Judge: {ratio:.0%} der erwarteten Begriffe enthalten",
+    })
+
 
+def create_judge():
+    return create_llm(JUDGE_MODEL, mock_response=mock_verdict, temperature=0)
 
-def judge_answer(question: str, expected: str, actual: str, why: str) -> dict:
+
+def judge_answer(
+    question: str, expected: str, actual: str, why: str, llm, cache: VerdictCache | None = None
+) -> dict:
     """Ask the LLM judge whether the actual answer is semantically correct."""
     user_msg = JUDGE_USER_TEMPLATE.format(
         question=question, expected=expected, actual=actual, why=why,
     )
 
+    if cache is not None:
+        key = cache.make_key(user_msg)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
     try:
-        response = client.chat.completions.create(
-            model=JUDGE_MODEL,
-            temperature=0,
-            messages=[
-                {"role": "system", "content": JUDGE_SYSTEM_PROMPT},
-                {"role": "user", "content": user_msg},
-            ],
-        )
+        response = llm.chat([
+            ChatMessage(role="system", content=JUDGE_SYSTEM_PROMPT),
+            ChatMessage(role="user", content=user_msg),
+        ])
+        raw = (response.message.content or "").strip()
     except APIError as e:
         return {"verdict": "ERROR", "reason": f"Judge API failed: {e}"}
-
-    raw = response.choices[0].message.content.strip()
+    except Exception as e:
+        # Timeouts, transport errors, unexpected response shapes: one failed
+        # verdict must not abort the parallel run (and lose the others)
+        print(f"  Judge failed: {type(e).__name__}: {e}")
+        return {"verdict": "ERROR", "reason": f"Judge failed: {type(e).__name__}: {e}"}
 
     # Strip markdown code fences if the model wraps the JSON
     if raw.startswith("```"):
@@ -129,109 +230,165 @@ def judge_answer(question: str, expected: str, actual: str, why: str) -> dict:
         result = json.loads(raw)
     except json.JSONDecodeError:
         result = {"verdict": "ERROR", "reason": f"Judge returned invalid JSON: {raw}"}
+    if not isinstance(result, dict):
+        result = {"verdict": "ERROR", "reason": f"Judge returned unexpected JSON: {raw}"}
 
+    if cache is not None:
+        cache.put(key, result)
     return result
 
 
+def score_answer(row: dict, data: dict, verdict: dict, retrieval_hit: bool) -> dict:
+    """Print the verdict on one answer and return its result row."""
+    answer = data.get("answer", "")
+    sources = data.get("sources", [])
+    retrieved_filenames = get_retrieved_filenames(sources)
+    if answer.startswith("ERROR:"):
+        print(f"  RAG {answer}")
+
+    is_correct = verdict.get("verdict", "").upper() == "YES"
+    status = "PASS" if retrieval_hit and is_correct else "FAIL"
+    print(
+        f"  Retrieval: {'HIT' if retrieval_hit else 'MISS'} | "
+        f"Judge: {verdict.get('verdict', '?')} | {status}"
+    )
+    if not is_correct:
+        print(f"  Reason: {verdict.get('reason', '')}")
+
+    return {
+        **row,
+        "rag_answer": answer,
+        "retrieved_chunks": format_chunks(sources),
+        "retrieval_hit": "TRUE" if retrieval_hit else "FALSE",
+        "retrieved_files": ", ".join(retrieved_filenames),
+        "judge_verdict": verdict.get("verdict", "ERROR"),
+        "judge_reason": verdict.get("reason", ""),
+        **usage_columns(data),
+    }
+
+
 def main():
-    # Pre-flight: check server is running
+    args = parse_args()
+    rag = RagClient(
+        BASE_URL,
+        prompt_id=args.prompt,
+        synthesis=args.synthesis,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        retries=args.retries,
+        timeout=args.timeout,
+    )
+    cache = None if args.no_judge_cache else VerdictCache()
     try:
-        requests.get(f"{BASE_URL}/query?query=ping", timeout=5)
-    except requests.exceptions.RequestException:
+        judge_llm = create_judge()
+    except RuntimeError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    # Pre-flight: check server is running
+    if not args.offline and not rag.is_up():
         print("ERROR: RAG server is not running!")
         print("Start it with: uvicorn main:app --host 127.0.0.1 --port 8000")
         sys.exit(1)
+    outputs = OutputCache()
+    rag.prompt_id, rag.synthesis, fingerprint = resolve_cache_scope(rag, outputs, args.offline)
 
     with open(INPUT_CSV, encoding="utf-8") as f:
         reader = csv.DictReader(f, delimiter=";")
         rows = list(reader)
 
     print(f"Loaded {len(rows)} questions from {INPUT_CSV}")
-    print(f"Judge model: {JUDGE_MODEL}\n")
-
-    results = []
-    retrieval_scores = []
-    judge_scores = []
-
-    for i, row in enumerate(rows, 1):
-        question = row.get("frage", "").strip()
-        if not question:
-            continue
-
-        print(f"[{i}/{len(rows)}] {question[:80]}...")
-
-        # Query the RAG system
-        try:
-            data = query_rag(question)
-            answer = data.get("answer", "")
-            sources = data.get("sources", [])
-            chunks = format_chunks(sources)
-        except (requests.exceptions.RequestException, ValueError) as e:
-            print(f"  RAG ERROR: {e}")
-            answer = f"ERROR: {e}"
-            sources = []
-            chunks = ""
-
-        # Retrieval scoring
-        retrieved_filenames = get_retrieved_filenames(sources)
-        expected_doc = row.get("erwartetes_dokument", "")
-        retrieval_hit = check_retrieval(expected_doc, retrieved_filenames)
-        retrieval_scores.append(retrieval_hit)
-
-        # LLM Judge scoring
-        expected_answer = row.get("erwartete_antwort", "")
-        why = row.get("warum", "")
+    print(f"Judge model: {JUDGE_MODEL} ({LLM_PROVIDER})\n")
 
+    rows = [row for row in rows if row.get("frage", "").strip()]
+    try:
+        run = EvalRun(OUTPUT_CSV, "run_evaluation_llm.py", {
+            "input": INPUT_CSV,
+            "prompt": rag.prompt_id,
+            "synthesis": rag.synthesis,
+            "fingerprint": fingerprint,
+            "judge": f"{LLM_PROVIDER}:{JUDGE_MODEL}",
+        }, resume=args.resume)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    if args.resume:
+        print(f"Resuming run {run.run_id}: {run.completed}/{len(rows)} questions done\n")
+    else:
+        print(f"Run {run.run_id}\n")
+
+    # LLM Judge scoring — in parallel, cached verdicts are reused
+    def judge(item: tuple) -> dict:
+        row, data = item
+        answer = data.get("answer", "")
         if answer.startswith("ERROR:"):
-            verdict = {"verdict": "NO", "reason": "RAG query failed"}
-        else:
-            verdict = judge_answer(question, expected_answer, answer, why)
-
-        is_correct = verdict.get("verdict", "").upper() == "YES"
-        judge_scores.append(is_correct)
-
-        status = "PASS" if retrieval_hit and is_correct else "FAIL"
-        print(
-            f"  Retrieval: {'HIT' if retrieval_hit else 'MISS'} | "
-            f"Judge: {verdict.get('verdict', '?')} | {status}"
+            return {"verdict": "NO", "reason": "RAG query failed"}
+        return judge_answer(
+            row["frage"].strip(),
+            row.get("erwartete_antwort", ""),
+            answer,
+            row.get("warum", ""),
+            judge_llm,
+            cache=cache,
         )
-        if not is_correct:
-            print(f"  Reason: {verdict.get('reason', '')}")
-
-        results.append({
-            **row,
-            "rag_answer": answer,
-            "retrieved_chunks": chunks,
-            "retrieval_hit": "TRUE" if retrieval_hit else "FALSE",
-            "retrieved_files": ", ".join(retrieved_filenames),
-            "judge_verdict": verdict.get("verdict", "ERROR"),
-            "judge_reason": verdict.get("reason", ""),
-        })
-
-        time.sleep(0.5)
-
-    if not results:
+
+    judge_wall = 0.0
+    try:
+        for chunk in run.chunks(rows, args.checkpoint_every):
+            # Query the RAG system
+            answers = fetch_answers(
+                rag,
+                [row["frage"].strip() for _, row in chunk],
+                args.concurrency,
+                cache=outputs,
+                fingerprint=fingerprint,
+                refresh=args.refresh,
+                offline=args.offline,
+                batch_size=args.batch_size,
+                on_done=lambda i, data: None,
+            )
+            judge_start = time.perf_counter()
+            verdicts = run_ordered(judge, [(row, data) for (_, row), data in zip(chunk, answers)], args.judge_workers)
+            judge_wall += time.perf_counter() - judge_start
+            # Retrieval scoring, for the whole chunk at once (scoring.py)
+            hits = retrieval_hits(
+                [row.get("erwartetes_dokument", "") for _, row in chunk],
+                [get_retrieved_filenames(data.get("sources", [])) for data in answers],
+            )
+            for (i, row), data, verdict, hit in zip(chunk, answers, verdicts, hits):
+                print(f"[{i}/{len(rows)}] {row['frage'].strip()[:80]}...")
+                run.append(score_answer(row, data, verdict, hit))
+            run.checkpoint()
+    except KeyboardInterrupt:
+        run.finish("interrupted")
+        print(f"\nInterrupted after {run.completed}/{len(rows)} questions; "
+              f"continue with: python run_evaluation_llm.py --resume")
+        sys.exit(130)
+    run.finish()
+    print(f"\nCached outputs used: {outputs.hits} (prompt {rag.prompt_id}, synthesis {rag.synthesis or '?'}, index {fingerprint or '?'})")
+
+    # Summary, from all rows of the run (including those of earlier sessions)
+    if not run.completed:
         print("No results to write.")
         sys.exit(1)
-
-    fieldnames = list(results[0].keys())
-    with open(OUTPUT_CSV, "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=";")
-        writer.writeheader()
-        writer.writerows(results)
-
-    # Summary
-    total = len(results)
-    retrieval_hits = sum(retrieval_scores)
-    judge_passes = sum(judge_scores)
-    perfect = sum(1 for r, j in zip(retrieval_scores, judge_scores) if r and j)
+    summary = summarize(pd.read_csv(
+        OUTPUT_CSV, sep=";", usecols=["retrieval_hit", "judge_verdict"], dtype=str, keep_default_na=False
+    ))
+    total, hits, judge_passes, perfect = (
+        summary["total"], summary["retrieval_hits"], summary["judge_passes"], summary["perfect"]
+    )
 
     print(f"\n{'='*60}")
-    print(f"  RESULTS SUMMARY ({total} questions)")
+    print(f"  RESULTS SUMMARY ({total} questions, run {run.run_id})")
     print(f"{'='*60}")
-    print(f"  Retrieval accuracy : {retrieval_hits}/{total} ({retrieval_hits/total*100:.1f}%)")
+    print(f"  Retrieval accuracy : {hits}/{total} ({hits/total*100:.1f}%)")
     print(f"  Judge pass rate    : {judge_passes}/{total} ({judge_passes/total*100:.1f}%)")
     print(f"  Perfect (both)     : {perfect}/{total} ({perfect/total*100:.1f}%)")
+    for line in usage_summary(run.rows()):
+        print(f"  {line}")
+    if cache is not None:
+        print(f"  Judge cache hits   : {cache.hits}/{cache.hits + cache.misses} ({cache.hit_rate*100:.1f}%)")
+    print(f"  Judge wall time    : {judge_wall:.1f}s ({args.judge_workers} workers)")
     print(f"{'='*60}")
     print(f"  Results saved to {OUTPUT_CSV}")
 
@@ -0,0 +1,169 @@
+"""
+CloudBase RAG — Scoring
+
+Scoring shared by run_evaluation.py, run_evaluation_llm.py and collect.py,
+batched over a whole results table instead of row by row:
+
+  keyword_coverage()  which expected keywords (erwartete_keywords) each
+                      answer contains, case-insensitive substrings. Answers
+                      are lowercased once, the (row, keyword) pairs of the
+                      whole table grouped by keyword, and each keyword looked
+                      up only in the answers that expect it (a C substring
+                      search; one regex alternation of all keywords over all
+                      answers measured several times slower in CPython).
+  retrieval_hits()    whether an expected document (erwartetes_dokument)
+                      was retrieved, as one hash join of the expected and
+                      retrieved filenames of all rows.
+  score_table()       both as columns of a results DataFrame, and
+  summarize()         the aggregate statistics of the evaluation summaries.
+
+bench_scoring.py measures rows/sec against the row-by-row scoring.
+
+Retrieval metrics (--retrieval-only). A question's ranking is the
+list of filenames of its retrieved chunks, best first; the expected
+documents come from erwartetes_dokument (pipe-separated if several,
+KEINE for questions no document answers). Ranks count chunks, so k is the
+number of chunks an answer is built from:
+
+  hit@k     1 if an expected document is among the first k chunks
+  recall@k  share of the expected documents among the first k chunks
+  MRR       1 / rank of the first chunk of an expected document (0 if none)
+  nDCG@k    binary relevance, each expected document counted at its first
+            chunk, against the ideal ranking of all expected documents
+
+KEINE questions have no relevant documents and are left out of the means.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+NO_DOCUMENT = "KEINE"
+
+
+def expected_documents(expected: str) -> list[str]:
+    """The expected filenames of erwartetes_dokument; empty for KEINE."""
+    expected = expected.strip()
+    if not expected or expected.upper() == NO_DOCUMENT:
+        return []
+    return [doc.strip() for doc in expected.split("|") if doc.strip()]
+
+
+def retrieval_metrics(expected: list[str], ranked: list[str], ks: list[int]) -> dict:
+    """hit@k, recall@k and nDCG@k for every k in ks, and the reciprocal rank."""
+    first_rank = {}
+    for rank, filename in enumerate(ranked, 1):
+        if filename in expected:
+            first_rank.setdefault(filename, rank)
+    metrics = {}
+    for k in ks:
+        found = [rank for rank in first_rank.values() if rank <= k]
+        ideal = sum(1 / math.log2(i + 1) for i in range(1, min(len(expected), k) + 1))
+        metrics[f"hit@{k}"] = 1.0 if found else 0.0
+        metrics[f"recall@{k}"] = len(found) / len(expected)
+        metrics[f"ndcg@{k}"] = sum(1 / math.log2(rank + 1) for rank in found) / ideal
+    metrics["mrr"] = 1 / min(first_rank.values()) if first_rank else 0.0
+    return metrics
+
+
+def mean_metrics(rows: list[dict]) -> dict:
+    """Mean of every metric over the scored questions (rows without metrics are skipped)."""
+    scored = [row for row in rows if row]
+    if not scored:
+        return {}
+    return {name: sum(row[name] for row in scored) / len(scored) for name in scored[0]}
+
+
+# ---------------------------------------------------------------------------
+# Batched keyword and retrieval scoring
+# ---------------------------------------------------------------------------
+
+def split_keywords(expected_keywords: str) -> list[str]:
+    return [kw.strip() for kw in (expected_keywords or "").split(",") if kw.strip()]
+
+
+def keyword_coverage(answers: list[str], expected_keywords: list[str]) -> tuple[list, list, np.ndarray]:
+    """(found keywords, missing keywords, ratio found) per answer; rows
+    without expected keywords score 1.0."""
+    keyword_lists = [split_keywords(keywords) for keywords in expected_keywords]
+    counts = np.array([len(keywords) for keywords in keyword_lists], dtype=np.int64)
+    # One (row, keyword) pair per expected keyword; each distinct keyword is
+    # searched for in the answers of its rows only
+    rows = np.repeat(np.arange(len(keyword_lists)), counts)
+    pairs = pd.DataFrame({"keyword": [kw.lower() for keywords in keyword_lists for kw in keywords]})
+    lowered = [(answer or "").lower() for answer in answers]
+    present = np.zeros(len(pairs), dtype=bool)
+    for keyword, index in pairs.groupby("keyword").indices.items():
+        present[index] = [keyword in lowered[row] for row in rows[index]]
+
+    found, missing = [], []
+    for keywords, flags in zip(keyword_lists, np.split(present, np.cumsum(counts)[:-1])):
+        found.append([kw for kw, flag in zip(keywords, flags) if flag])
+        missing.append([kw for kw, flag in zip(keywords, flags) if not flag])
+    ratios = np.array([len(f) for f in found], dtype=np.float64) / np.maximum(counts, 1)
+    return found, missing, np.where(counts > 0, ratios, 1.0)
+
+
+def retrieval_hits(expected: list[str], retrieved: list[list[str]]) -> np.ndarray:
+    """Whether at least one expected document of each row was retrieved
+    (always true for KEINE)."""
+    expected = pd.Series(expected, dtype="object").fillna("").str.strip()
+    hits = np.array(expected.str.upper() == NO_DOCUMENT, dtype=bool)
+    expected_docs = expected.str.split("|").explode().str.strip()
+    retrieved_docs = pd.Series(retrieved, dtype="object").explode().dropna()
+    pairs = pd.DataFrame({"row": expected_docs.index, "doc": expected_docs.to_numpy()}).merge(
+        pd.DataFrame({"row": retrieved_docs.index, "doc": retrieved_docs.to_numpy()})
+    )
+    hits[pairs["row"].unique()] = True
+    return hits
+
+
+def split_files(retrieved_files: str) -> list[str]:
+    """The filenames of a retrieved_files column value ("a.md, b.md")."""
+    return [f.strip() for f in (retrieved_files or "").split(",") if f.strip()]
+
+
+def score_table(df: pd.DataFrame, answer_column: str = "rag_answer") -> pd.DataFrame:
+    """df with retrieval_hit, keyword_found, keyword_missing and keyword_score
+    columns (strings, as in the result CSVs), from its erwartetes_dokument,
+    retrieved_files, erwartete_keywords and answer columns."""
+    df = df.copy()
+    text = lambda column: df[column].fillna("").astype(str).tolist() if column in df else [""] * len(df)
+    hits = retrieval_hits(text("erwartetes_dokument"), [split_files(f) for f in text("retrieved_files")])
+    found, missing, ratios = keyword_coverage(text(answer_column), text("erwartete_keywords"))
+    df["retrieval_hit"] = np.where(hits, "TRUE", "FALSE")
+    df["keyword_found"] = [", ".join(kws) for kws in found]
+    df["keyword_missing"] = [", ".join(kws) for kws in missing]
+    df["keyword_score"] = [f"{ratio:.2f}" for ratio in ratios]
+    return df
+
+
+def keyword_ratios(df: pd.DataFrame) -> pd.Series:
+    """Exact keyword score of every row, recounted from keyword_found and
+    keyword_missing (keyword_score is rounded to two decimals), or read from
+    keyword_score in tables without them."""
+    if "keyword_found" not in df or "keyword_missing" not in df:
+        return pd.to_numeric(df["keyword_score"], errors="coerce").fillna(0.0)
+    count = lambda column: np.array([len(split_keywords(v)) for v in df[column].fillna("").astype(str)])
+    found, missing = count("keyword_found"), count("keyword_missing")
+    ratios = np.where(found + missing > 0, found / np.maximum(found + missing, 1), 1.0)
+    return pd.Series(ratios, index=df.index, dtype=np.float64)
+
+
+def summarize(df: pd.DataFrame) -> dict:
+    """Aggregates of a scored results table: questions, retrieval hits, mean
+    keyword score and perfect answers (where there are keyword scores), and
+    judge passes (where there are verdicts)."""
+    total = len(df)
+    hits = df["retrieval_hit"].astype(str).str.upper().eq("TRUE") if total else pd.Series(dtype=bool)
+    summary = {"total": total, "retrieval_hits": int(hits.sum())}
+    if "keyword_score" in df:
+        scores = keyword_ratios(df)
+        summary["keyword_score"] = float(scores.mean()) if total else 0.0
+        summary["perfect"] = int((hits & scores.eq(1.0)).sum())
+    if "judge_verdict" in df:
+        passes = df["judge_verdict"].astype(str).str.upper().eq("YES")
+        summary["judge_passes"] = int(passes.sum())
+        summary["perfect"] = int((hits & passes).sum())
+    return summary
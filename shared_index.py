@@ -0,0 +1,69 @@
+"""
+CloudBase RAG — Shared index
+
+Lets several server processes (`uvicorn main:app --workers N`) serve one
+on-disk index. Everything that writes storage/ (the cold build, backend
+conversion, /ingest) holds an exclusive file lock, so there is a single
+writer at a time across all workers, and bumps a version counter stored
+with the index when it commits. Readers load the index under a shared
+lock and compare the counter on each request; when it changed they load
+the new version and swap it in, while requests in flight finish on the
+old one.
+
+Files:
+    storage.lock                  flock(2) target, next to storage/
+    storage/index_version.json    {"version": N}, replaced atomically
+"""
+
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+
+VERSION_FNAME = "index_version.json"
+
+
+class IndexLock:
+    """Reader/writer lock on a persist directory, shared between processes."""
+
+    def __init__(self, persist_dir: str):
+        # Outside the directory: it has to exist before the cold build creates storage/
+        self.path = os.path.normpath(persist_dir) + ".lock"
+
+    @contextmanager
+    def _locked(self, operation: int):
+        with open(self.path, "a") as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def shared(self):
+        """Held while loading the index; any number of readers at once."""
+        return self._locked(fcntl.LOCK_SH)
+
+    def exclusive(self):
+        """Held while writing the index; excludes readers and other writers."""
+        return self._locked(fcntl.LOCK_EX)
+
+
+def read_version(persist_dir: str) -> int:
+    """Version of the index on disk (0 before the first versioned write)."""
+    try:
+        with open(os.path.join(persist_dir, VERSION_FNAME), encoding="utf-8") as f:
+            return json.load(f)["version"]
+    except FileNotFoundError:
+        return 0
+
+
+def bump_version(persist_dir: str) -> int:
+    """Publish a committed write to the readers. Call with the exclusive lock held."""
+    version = read_version(persist_dir) + 1
+    path = os.path.join(persist_dir, VERSION_FNAME)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"version": version}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{path}.tmp", path)
+    return version
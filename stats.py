@@ -0,0 +1,15 @@
+"""
+CloudBase RAG — Latency statistics
+
+Percentiles of raw latency samples, shared by the benchmarks (bench_load.py,
+bench_ann.py) and the configuration sweep (sweep.py). The /metrics endpoint
+aggregates into histogram buckets instead (metrics.py).
+"""
+
+
+def percentile(values: list, pct: float) -> float:
+    """pct-th percentile of values, linearly interpolated between the closest ranks."""
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
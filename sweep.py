@@ -0,0 +1,391 @@
+"""
+CloudBase RAG — Configuration sweep
+
+Runs the golden dataset against a grid of configurations in-process (no
+server, no `make reset`, no restart per cell) and prints one comparison
+table of quality, latency and token cost per variant:
+
+  --chunk-size / --chunk-overlap   chunking of the variant index
+  --top-k                          chunks the answer is built from
+  --synthesis                      response mode (tree_summarize, compact)
+  --prompt                         prompt id (baseline, improved, prompts/*.txt)
+
+Each axis takes a comma-separated list; every combination is one variant.
+Work is shared wherever the variants agree:
+
+  - the documents are read and parsed once for all variants;
+  - each chunking is built once, and a chunk text two chunkings have in
+    common is embedded only once (embeddings depend on the text alone);
+    the persistent embedding cache of the server (embedding_cache.py)
+    serves chunks an earlier run already embedded;
+  - the questions are embedded once, in one batch;
+  - per chunking and top-k, retrieval (and reranking, with RAG_RERANK)
+    runs once and its chunks are reused by every prompt and synthesis mode.
+
+The (chunking, top-k) groups run in parallel worker processes (--workers,
+default one per CPU core), which load only the LLM and reranker: chunks and
+questions arrive embedded. Within a worker, the questions of a variant are
+answered concurrently (--concurrency). Retriever, reranker, vector search
+and models follow the same RAG_* settings as the server. Latency is per
+question: embedding (batched, averaged), retrieval, reranking and synthesis.
+With several workers on a busy machine it includes CPU contention; use
+--workers 1 for latencies comparable to the server's.
+
+Quality is scored as in run_evaluation.py (scoring.py): retrieval hit,
+keyword coverage and perfect answers (both). Cost is LLM calls and tokens
+per question, and USD per 1000 questions at --price-prompt and
+--price-completion (per million tokens, default gpt-4o-mini's).
+
+Usage:
+    python sweep.py --chunk-size 256,512,1024 --chunk-overlap 50 --top-k 2,4 \\
+                    --synthesis tree_summarize,compact --prompt baseline,improved
+    RAG_LLM_PROVIDER=mock RAG_EMBED_PROVIDER=hashing python sweep.py --chunk-size 256,512 --top-k 2,4
+"""
+
+import argparse
+import asyncio
+import csv
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from llama_index.core import QueryBundle, Settings, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
+
+from ingestion import chunk_documents, embed_nodes
+from keyword_index import RETRIEVER, KeywordIndex, make_retriever
+from main import (
+    DEFAULT_PROMPT,
+    MAX_CONCURRENT_QUERIES,
+    PROMPTS,
+    QUERY_TIMEOUT_SECONDS,
+    create_query_engine,
+    embed_queries,
+    embedding_cache,
+    init_answer_models,
+    init_models,
+    load_documents,
+)
+from rerank import RERANK, RERANK_CANDIDATES, Reranker
+from scoring import score_table, summarize
+from stats import percentile
+from synthesis import CONTEXT_TOKENS, SYNTHESIS, SYNTHESIS_MODES, pack_nodes, track_llm_usage
+
+INPUT_CSV = "cloudbase-testfragen.csv"
+OUTPUT_CSV = "sweep_results.csv"
+
+# gpt-4o-mini list prices, USD per million tokens
+PRICE_PROMPT = 0.15
+PRICE_COMPLETION = 0.60
+
+
+def int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def str_list(value: str) -> list[str]:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int_list, default=[512], help="comma-separated (default 512)")
+    parser.add_argument("--chunk-overlap", type=int_list, default=[50], help="comma-separated (default 50)")
+    parser.add_argument("--top-k", type=int_list, default=[2], help="comma-separated (default 2)")
+    parser.add_argument("--synthesis", type=str_list, default=[SYNTHESIS],
+                        help=f"comma-separated, of {', '.join(SYNTHESIS_MODES)} (default {SYNTHESIS})")
+    parser.add_argument("--prompt", type=str_list, default=[DEFAULT_PROMPT],
+                        help=f"comma-separated prompt ids (default {DEFAULT_PROMPT})")
+    parser.add_argument("--input", default=INPUT_CSV)
+    parser.add_argument("--output", default=OUTPUT_CSV)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: one per CPU core)")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_QUERIES,
+                        help=f"questions answered at once per worker (default {MAX_CONCURRENT_QUERIES})")
+    parser.add_argument("--price-prompt", type=float, default=PRICE_PROMPT, help="USD per 1M prompt tokens")
+    parser.add_argument("--price-completion", type=float, default=PRICE_COMPLETION,
+                        help="USD per 1M completion tokens")
+    return parser.parse_args()
+
+
+def check_grid(args) -> list[str]:
+    """Errors in the grid, if any."""
+    errors = [f"unknown prompt '{p}'" for p in args.prompt if p not in PROMPTS]
+    errors += [f"unknown synthesis mode '{s}'" for s in args.synthesis if s not in SYNTHESIS_MODES]
+    errors += [f"top-k must be at least 1 (got {k})" for k in args.top_k if k < 1]
+    chunkings = [(size, overlap) for size in args.chunk_size for overlap in args.chunk_overlap]
+    if not any(overlap < size for size, overlap in chunkings):
+        errors.append("no chunking with an overlap smaller than the chunk size")
+    return errors
+
+
+# ---------------------------------------------------------------------------
+# Shared preparation (main process)
+# ---------------------------------------------------------------------------
+
+def prepare_chunkings(documents: list, chunkings: list[tuple[int, int]]) -> tuple[dict, dict]:
+    """Embedded nodes per (chunk size, overlap), and counts of how the chunk
+    embeddings were obtained (shared between chunkings, cached, embedded)."""
+    embedded = {}  # chunk text as embedded -> embedding, across all chunkings
+    nodes_by_chunking = {}
+    stats = {"chunks": 0, "shared": 0, "cached": 0, "embedded": 0}
+    for chunk_size, chunk_overlap in chunkings:
+        nodes = chunk_documents(documents, SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap))
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        for node, text in zip(nodes, texts):
+            node.embedding = embedded.get(text)
+        pending = sum(1 for node in nodes if node.embedding is None)
+        hits = embedding_cache.hits if embedding_cache is not None else 0
+        embed_nodes(nodes, cache=embedding_cache, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        cached = embedding_cache.hits - hits if embedding_cache is not None else 0
+        for node, text in zip(nodes, texts):
+            embedded.setdefault(text, node.embedding)
+
+        stats["chunks"] += len(nodes)
+        stats["shared"] += len(nodes) - pending
+        stats["cached"] += cached
+        stats["embedded"] += pending - cached
+        nodes_by_chunking[(chunk_size, chunk_overlap)] = nodes
+        print(f"  chunking {chunk_size}/{chunk_overlap}: {len(nodes)} chunks, "
+              f"{len(nodes) - pending} shared, {cached} cached, {pending - cached} embedded")
+    return nodes_by_chunking, stats
+
+
+# ---------------------------------------------------------------------------
+# One (chunking, top-k) group of variants (worker process)
+# ---------------------------------------------------------------------------
+
+def retrieved_files(nodes: list) -> str:
+    return ", ".join(
+        os.path.basename(n.node.metadata.get("filename", "")) for n in nodes if n.node.metadata.get("filename")
+    )
+
+
+async def answer_variant(engine, synthesis: str, bundles: list, retrieved: list, concurrency: int) -> list[dict]:
+    """Synthesize an answer for every question from its retrieved chunks."""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def answer(bundle: QueryBundle, nodes: list) -> dict:
+        async with semaphore:
+            usage = track_llm_usage()
+            start = time.perf_counter()
+            if synthesis == "compact":
+                # asynthesize() skips the engine's node postprocessors, as in main.synthesize()
+                nodes = pack_nodes(nodes, CONTEXT_TOKENS)
+            try:
+                response = await asyncio.wait_for(engine.asynthesize(bundle, nodes), timeout=QUERY_TIMEOUT_SECONDS)
+                text, sources = str(response), response.source_nodes
+            except asyncio.TimeoutError:
+                text, sources = f"ERROR: timed out after {QUERY_TIMEOUT_SECONDS:.0f}s", nodes
+            except Exception as e:
+                text, sources = f"ERROR: {e}", nodes
+            return {
+                "answer": text,
+                "retrieved_files": retrieved_files(sources),
+                "synthesize_ms": (time.perf_counter() - start) * 1000,
+                **usage.to_dict(),
+            }
+
+    return await asyncio.gather(*(answer(b, nodes) for b, nodes in zip(bundles, retrieved)))
+
+
+class PrecomputedEmbedding(BaseEmbedding):
+    """Embedding model of the worker processes. The parent embeds every chunk
+    and question, so the workers never load the real model; a call is a bug."""
+
+    def _fail(self, *args):
+        raise RuntimeError("sweep workers get precomputed embeddings; nothing may be embedded here")
+
+    _get_query_embedding = _get_text_embedding = _fail
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        self._fail()
+
+
+def init_worker():
+    Settings.embed_model = PrecomputedEmbedding(model_name="precomputed")
+    init_answer_models()
+
+
+def run_group(job: dict) -> list[dict]:
+    """Build the index of one chunking, retrieve top_k chunks for every
+    question once, and answer them with every (prompt, synthesis) variant.
+    Returns one summary row per variant."""
+    nodes, top_k, rows = job["nodes"], job["top_k"], job["rows"]
+    # The nodes are already embedded, so building the index makes no embedding calls
+    index = VectorStoreIndex(nodes=nodes)
+    keywords = KeywordIndex.from_nodes(nodes) if RETRIEVER != "vector" else None
+    retriever = make_retriever(index, keywords, max(RERANK_CANDIDATES, top_k) if RERANK != "off" else top_k)
+    reranker = Reranker(index=index, top_n=top_k) if RERANK != "off" else None
+
+    bundles = [QueryBundle(row["frage"], embedding=e) for row, e in zip(rows, job["query_embeddings"])]
+    retrieved, retrieve_ms = [], []
+    for bundle in bundles:
+        start = time.perf_counter()
+        found = retriever.retrieve(bundle)
+        if reranker is not None:
+            found = reranker.postprocess_nodes(found, bundle)
+        retrieved.append(found)
+        retrieve_ms.append((time.perf_counter() - start) * 1000)
+
+    results = []
+    for prompt_id, synthesis in job["variants"]:
+        engine = create_query_engine(retriever, prompt_id, synthesis)
+        answers = asyncio.run(answer_variant(engine, synthesis, bundles, retrieved, job["concurrency"]))
+        table = pd.DataFrame({
+            "erwartetes_dokument": [row.get("erwartetes_dokument", "") for row in rows],
+            "erwartete_keywords": [row.get("erwartete_keywords", "") for row in rows],
+            "rag_answer": [a["answer"] for a in answers],
+            "retrieved_files": [a["retrieved_files"] for a in answers],
+        })
+        summary = summarize(score_table(table))
+        latencies = [job["embed_ms"] + r + a["synthesize_ms"] for r, a in zip(retrieve_ms, answers)]
+        n = len(rows)
+        results.append({
+            "chunk_size": job["chunk_size"],
+            "chunk_overlap": job["chunk_overlap"],
+            "chunks": len(nodes),
+            "top_k": top_k,
+            "synthesis": synthesis,
+            "prompt": prompt_id,
+            "questions": n,
+            "errors": sum(a["answer"].startswith("ERROR:") for a in answers),
+            "retrieval_hit": summary["retrieval_hits"] / n,
+            "keyword_score": summary["keyword_score"],
+            "perfect": summary["perfect"] / n,
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "llm_calls": sum(a["llm_calls"] for a in answers) / n,
+            "prompt_tokens": sum(a["prompt_tokens"] for a in answers) / n,
+            "completion_tokens": sum(a["completion_tokens"] for a in answers) / n,
+        })
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Sweep
+# ---------------------------------------------------------------------------
+
+def print_table(results: list[dict], title: str):
+    width = 118
+    print(f"\n{'='*width}")
+    print(f"  {title}")
+    print(f"{'='*width}")
+    print(f"  {'chunking':>9} {'top-k':>5}  {'synthesis':<14} {'prompt':<12} {'hit':>6} {'keywords':>8} "
+          f"{'perfect':>7} {'p50 ms':>7} {'p95 ms':>7} {'calls':>5} {'tok/q':>7} {'$/1k q':>7} {'err':>4}")
+    for r in results:
+        chunking = f"{r['chunk_size']}/{r['chunk_overlap']}"
+        tokens = r["prompt_tokens"] + r["completion_tokens"]
+        print(f"  {chunking:>9} {r['top_k']:>5}  {r['synthesis']:<14} {r['prompt']:<12} {r['retrieval_hit']:>6.1%} "
+              f"{r['keyword_score']:>8.1%} {r['perfect']:>7.1%} {r['p50_ms']:>7.0f} {r['p95_ms']:>7.0f} "
+              f"{r['llm_calls']:>5.2f} {tokens:>7.0f} {r['usd_per_1k']:>7.3f} {r['errors']:>4}")
+    print(f"{'='*width}")
+
+
+def main():
+    args = parse_args()
+    errors = check_grid(args)
+    if errors:
+        print(f"ERROR: {'; '.join(errors)}")
+        sys.exit(1)
+    chunkings = [(s, o) for s in args.chunk_size for o in args.chunk_overlap if o < s]
+    skipped = [(s, o) for s in args.chunk_size for o in args.chunk_overlap if o >= s]
+    variants = list(itertools.product(args.prompt, args.synthesis))
+    for size, overlap in skipped:
+        print(f"Skipping chunking {size}/{overlap}: overlap must be smaller than the chunk size")
+
+    try:
+        init_models()
+    except (RuntimeError, ValueError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    with open(args.input, encoding="utf-8") as f:
+        rows = list(csv.DictReader(f, delimiter=";"))
+    questions = [row["frage"] for row in rows]
+    total = len(chunkings) * len(args.top_k) * len(variants)
+    print(f"Loaded {len(rows)} questions from {args.input}")
+    print(f"Grid: {len(chunkings)} chunkings x {len(args.top_k)} top-k x {len(variants)} prompt/synthesis = "
+          f"{total} variants (retriever {RETRIEVER}, rerank {RERANK})\n")
+
+    start = time.perf_counter()
+    documents = load_documents()
+    print(f"Parsed {len(documents)} documents once; preparing chunkings...")
+    nodes_by_chunking, stats = prepare_chunkings(documents, chunkings)
+    embed_start = time.perf_counter()
+    query_embeddings = embed_queries(questions)
+    embed_ms = (time.perf_counter() - embed_start) * 1000 / max(1, len(questions))
+    prepare_seconds = time.perf_counter() - start
+
+    jobs = [
+        {
+            "chunk_size": size,
+            "chunk_overlap": overlap,
+            "nodes": nodes_by_chunking[(size, overlap)],
+            "top_k": top_k,
+            "variants": variants,
+            "rows": rows,
+            "query_embeddings": query_embeddings,
+            "embed_ms": embed_ms,
+            "concurrency": args.concurrency,
+        }
+        for (size, overlap), top_k in itertools.product(chunkings, args.top_k)
+    ]
+    workers = max(1, min(args.workers, len(jobs)))
+    print(f"\nRunning {len(jobs)} groups of {len(variants)} variants on {workers} worker(s)...")
+
+    run_start = time.perf_counter()
+    results = {}
+    if workers == 1:
+        for i, job in enumerate(jobs):
+            results[i] = run_group(job)
+            print(f"  [{len(results)}/{len(jobs)}] chunking {job['chunk_size']}/{job['chunk_overlap']}, "
+                  f"top-k {job['top_k']} done")
+    else:
+        # spawn: fresh workers, which create their own LLM and reranker (init_worker;
+        # the embeddings come with the jobs), rather than forks of a process that
+        # already runs torch and sqlite threads
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker) as pool:
+            futures = {pool.submit(run_group, job): i for i, job in enumerate(jobs)}
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                print(f"  [{len(results)}/{len(jobs)}] chunking {jobs[i]['chunk_size']}/{jobs[i]['chunk_overlap']}, "
+                      f"top-k {jobs[i]['top_k']} done")
+    run_seconds = time.perf_counter() - run_start
+
+    table = [row for i in range(len(jobs)) for row in results[i]]
+    for row in table:
+        row["usd_per_1k"] = (
+            row["prompt_tokens"] * args.price_prompt + row["completion_tokens"] * args.price_completion
+        ) / 1000
+    with open(args.output, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(table[0].keys()), delimiter=";")
+        writer.writeheader()
+        writer.writerows(
+            {k: f"{v:.4f}" if isinstance(v, float) else v for k, v in row.items()} for row in table
+        )
+
+    print_table(table, f"CONFIGURATION SWEEP ({len(table)} variants, {len(rows)} questions each)")
+    best = max(table, key=lambda r: (r["perfect"], r["keyword_score"], -r["usd_per_1k"]))
+    cheapest = min(table, key=lambda r: (r["usd_per_1k"], -r["perfect"]))
+    for label, r in (("Best quality", best), ("Cheapest", cheapest)):
+        print(f"  {label:<18} : chunking {r['chunk_size']}/{r['chunk_overlap']}, top-k {r['top_k']}, "
+              f"{r['synthesis']}, {r['prompt']} ({r['perfect']:.1%} perfect, ${r['usd_per_1k']:.3f}/1k questions)")
+    print(f"  Chunk embeddings   : {stats['chunks']} chunks, {stats['shared']} shared between chunkings, "
+          f"{stats['cached']} cached, {stats['embedded']} embedded")
+    print(f"  Time               : {prepare_seconds:.1f}s preparing, {run_seconds:.1f}s answering "
+          f"({workers} worker(s))")
+    print(f"{'='*118}")
+    print(f"  Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
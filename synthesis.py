@@ -0,0 +1,179 @@
+"""
+CloudBase RAG — Synthesis strategies and LLM usage
+
+tree_summarize (LlamaIndex's default for the query engines here) answers
+from the retrieved chunks bottom-up and issues several LLM calls when
+they don't fit into one window. compact packs the chunks into a single
+prompt under an explicit token budget instead, so every question costs
+exactly one LLM call:
+
+  1. chunks are taken best score first;
+  2. text a better chunk of the same document already covers (the 50
+     token overlap of the 512/50 chunking, or the same chunk retrieved
+     twice by hybrid retrieval) is cut from the chunk;
+  3. chunks that no longer fit into RAG_CONTEXT_TOKENS are dropped, so
+     the lowest-scoring ones go first.
+
+Every LLM call is also counted per request: track_llm_usage() starts a
+tally in a context variable, and an instrumentation handler adds calls
+and prompt/completion tokens to it (the provider's usage figures, or the
+tokenizer's count where a response has none, e.g. when streaming). The
+same handler keeps the process-wide totals in /metrics
+(rag_llm_calls_total, rag_llm_tokens_total).
+
+Settings:
+    RAG_SYNTHESIS       default strategy: tree_summarize (default) or compact
+    RAG_CONTEXT_TOKENS  context token budget of compact (default 1500)
+"""
+
+import os
+from contextvars import ContextVar
+
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.llm import LLMChatEndEvent, LLMCompletionEndEvent
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.utils import get_tokenizer
+
+import metrics
+
+SYNTHESIS_MODES = ("tree_summarize", "compact")
+SYNTHESIS = os.getenv("RAG_SYNTHESIS") or "tree_summarize"
+CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+
+
+def count_tokens(text: str) -> int:
+    return len(get_tokenizer()(text))
+
+
+# ---------------------------------------------------------------------------
+# Context packing
+# ---------------------------------------------------------------------------
+
+def _uncovered(node, covered: list[tuple[int, int]]) -> str | None:
+    """node's text without the parts covered already; None if nothing is left."""
+    start, end = node.start_char_idx, node.end_char_idx
+    text = node.get_content(metadata_mode=MetadataMode.NONE)
+    if start is None or end is None:
+        return text
+    cut_start, cut_end = start, end
+    for c_start, c_end in covered:
+        if c_start <= cut_start and cut_end <= c_end:
+            return None
+        if c_start <= cut_start < c_end:
+            cut_start = c_end
+        if c_start < cut_end <= c_end:
+            cut_end = c_start
+    if cut_start >= cut_end:
+        return None
+    return text[cut_start - start:len(text) - (end - cut_end)]
+
+
+def pack_nodes(nodes: list[NodeWithScore], budget: int = CONTEXT_TOKENS) -> list[NodeWithScore]:
+    """Best chunks first, overlaps removed, within budget tokens of context.
+    The best chunk is always kept, even if it alone exceeds the budget."""
+    packed, seen_texts, used = [], set(), 0
+    covered = {}  # ref_doc_id -> [(start, end)] of the packed chunks
+    for result in sorted(nodes, key=lambda n: n.score or 0.0, reverse=True):
+        node = result.node
+        spans = covered.setdefault(node.ref_doc_id, [])
+        text = _uncovered(node, spans)
+        if text is None or text.strip() in seen_texts:
+            continue
+        if text != node.get_content(metadata_mode=MetadataMode.NONE):
+            node = node.model_copy(update={"text": text})
+        tokens = count_tokens(node.get_content(metadata_mode=MetadataMode.LLM))
+        if packed and used + tokens > budget:
+            break
+        packed.append(NodeWithScore(node=node, score=result.score))
+        seen_texts.add(text.strip())
+        used += tokens
+        if node.start_char_idx is not None and node.end_char_idx is not None:
+            spans.append((node.start_char_idx, node.end_char_idx))
+    return packed
+
+
+class ContextBudget(BaseNodePostprocessor):
+    """Node postprocessor applying pack_nodes() before synthesis."""
+
+    budget: int = CONTEXT_TOKENS
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextBudget"
+
+    def _postprocess_nodes(
+        self, nodes: list[NodeWithScore], query_bundle: QueryBundle | None = None
+    ) -> list[NodeWithScore]:
+        return pack_nodes(nodes, self.budget)
+
+
+# ---------------------------------------------------------------------------
+# LLM usage per request
+# ---------------------------------------------------------------------------
+
+LLM_CALLS = metrics.counter("rag_llm_calls_total", "LLM calls (synthesis and judge)")
+LLM_TOKENS = metrics.counter("rag_llm_tokens_total", "LLM tokens by kind (prompt, completion)", labelnames=("kind",))
+
+
+class LLMUsage:
+    def __init__(self):
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, prompt_tokens: int, completion_tokens: int):
+        self.llm_calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+    def to_dict(self) -> dict:
+        return {
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
+
+
+_usage: ContextVar[LLMUsage | None] = ContextVar("rag_llm_usage", default=None)
+
+
+def track_llm_usage() -> LLMUsage:
+    """Count the LLM calls of the current task (and the tasks it starts) from now on."""
+    usage = LLMUsage()
+    _usage.set(usage)
+    return usage
+
+
+def _response_text(response) -> str:
+    message = getattr(response, "message", None)
+    if message is not None:
+        return message.content or ""
+    return response.text or ""
+
+
+class _UsageHandler(BaseEventHandler):
+    @classmethod
+    def class_name(cls) -> str:
+        return "LLMUsageHandler"
+
+    def handle(self, event, **kwargs):
+        if not isinstance(event, (LLMChatEndEvent, LLMCompletionEndEvent)) or event.response is None:
+            return
+        if isinstance(event, LLMChatEndEvent):
+            prompt = "\n".join(m.content or "" for m in event.messages)
+        else:
+            prompt = event.prompt
+        counts = event.response.additional_kwargs or {}
+        prompt_tokens = counts.get("prompt_tokens") or count_tokens(prompt)
+        completion_tokens = counts.get("completion_tokens") or count_tokens(_response_text(event.response))
+        LLM_CALLS.inc()
+        LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, kind="completion")
+        usage = _usage.get()
+        if usage is not None:
+            usage.add(prompt_tokens, completion_tokens)
+
+
+get_dispatcher().add_event_handler(_UsageHandler())
@@ -0,0 +1,153 @@
+import csv
+import json
+
+import pytest
+
+from eval_run import EvalRun, drop_partial_row, manifest_path
+
+SETTINGS = {"input": "fragen.csv", "prompt": "v1", "synthesis": "compact", "fingerprint": "abc"}
+QUESTIONS = [{"frage": f"Frage {i}?"} for i in range(1, 6)]
+
+
+def run_questions(run: EvalRun, rows: list, limit: int | None = None, size: int = 2) -> int:
+    """Answer the pending questions (stopping after limit rows, as a crash would)."""
+    written = 0
+    for chunk in run.chunks(rows, size):
+        for position, row in chunk:
+            if limit is not None and written == limit:
+                return written
+            run.append({"frage": row["frage"], "antwort": f"Antwort {position}"})
+            written += 1
+        run.checkpoint()
+    return written
+
+
+def read_rows(path) -> list:
+    with open(path, encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f, delimiter=";"))
+
+
+def test_resume_skips_written_questions(tmp_path):
+    output = str(tmp_path / "results.csv")
+    run = EvalRun(output, "run_evaluation.py", SETTINGS)
+    run_questions(run, QUESTIONS, limit=3)
+    run.finish("interrupted")
+
+    resumed = EvalRun(output, "run_evaluation.py", SETTINGS, resume=True)
+
+    assert resumed.run_id == run.run_id
+    assert resumed.completed == 3
+    assert [position for position, _ in resumed.pending(QUESTIONS)] == [4, 5]
+    run_questions(resumed, QUESTIONS)
+    resumed.finish()
+    assert [row["frage"] for row in read_rows(output)] == [q["frage"] for q in QUESTIONS]
+    with open(manifest_path(output), encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert (manifest["status"], manifest["completed"], manifest["resumed"]) == ("finished", 5, 1)
+
+
+def test_resume_after_truncated_csv(tmp_path):
+    output = tmp_path / "results.csv"
+    run = EvalRun(str(output), "run_evaluation.py", SETTINGS)
+    run_questions(run, QUESTIONS, limit=4)
+    run.finish("interrupted")
+    # A crash mid-write: only the question of the last row made it to disk
+    data = output.read_bytes()
+    output.write_bytes(data[:data.rindex(b"Antwort 4")])
+
+    resumed = EvalRun(str(output), "run_evaluation.py", SETTINGS, resume=True)
+
+    assert resumed.completed == 3
+    assert [position for position, _ in resumed.pending(QUESTIONS)] == [4, 5]
+    run_questions(resumed, QUESTIONS)
+    resumed.finish()
+    rows = read_rows(output)
+    assert [row["frage"] for row in rows] == [q["frage"] for q in QUESTIONS]
+    assert [row["antwort"] for row in rows[-2:]] == ["Antwort 4", "Antwort 5"]
+
+
+def test_drop_partial_row_keeps_complete_rows(tmp_path):
+    output = tmp_path / "results.csv"
+    complete = b"frage;antwort\r\n" + b"".join(b"F%d;" % i + b"x" * 70000 + b"\r\n" for i in range(2))
+
+    output.write_bytes(complete)
+    assert not drop_partial_row(str(output))
+    output.write_bytes(complete + b"F2;" + b"y" * 70000)
+    assert drop_partial_row(str(output))
+    assert output.read_bytes() == complete
+    output.write_bytes(b"frage;ant")
+    assert drop_partial_row(str(output))
+    assert output.read_bytes() == b""
+
+
+def test_resume_after_row_cut_inside_multiline_answer(tmp_path):
+    output = tmp_path / "results.csv"
+    rows = [{"frage": "Frage 1?", "antwort": "Zeile 1\r\nZeile 2"}, {"frage": "Frage 2?", "antwort": "A\r\nB\r\nC"}]
+    run = EvalRun(str(output), "run_evaluation.py", SETTINGS)
+    for row in rows:
+        run.append(row)
+    run.finish("interrupted")
+    # Cut right after a line break inside the quoted answer of the last row
+    data = output.read_bytes()
+    output.write_bytes(data[:data.rindex(b"B\r\n") + 3])
+
+    resumed = EvalRun(str(output), "run_evaluation.py", SETTINGS, resume=True)
+
+    assert resumed.completed == 1
+    assert [position for position, _ in resumed.pending(rows)] == [2]
+    resumed.append(rows[1])
+    resumed.finish()
+    assert read_rows(output) == rows
+
+
+def test_resume_without_any_rows(tmp_path):
+    output = tmp_path / "results.csv"
+    EvalRun(str(output), "run_evaluation.py", SETTINGS).finish("interrupted")
+
+    resumed = EvalRun(str(output), "run_evaluation.py", SETTINGS, resume=True)
+    run_questions(resumed, QUESTIONS)
+    resumed.finish()
+
+    assert len(read_rows(output)) == len(QUESTIONS)
+    assert output.read_text(encoding="utf-8").count("frage;antwort") == 1
+
+
+def test_resume_counts_repeated_questions(tmp_path):
+    output = str(tmp_path / "results.csv")
+    rows = [{"frage": "Gleich?"}, {"frage": "Anders?"}, {"frage": "Gleich?"}]
+    run = EvalRun(output, "run_evaluation.py", SETTINGS)
+    run_questions(run, rows, limit=1)
+    run.finish("interrupted")
+
+    resumed = EvalRun(output, "run_evaluation.py", SETTINGS, resume=True)
+
+    assert [position for position, _ in resumed.pending(rows)] == [2, 3]
+
+
+def test_new_run_replaces_old_results(tmp_path):
+    output = str(tmp_path / "results.csv")
+    first = EvalRun(output, "run_evaluation.py", SETTINGS)
+    run_questions(first, QUESTIONS)
+    first.finish()
+
+    second = EvalRun(output, "run_evaluation.py", SETTINGS)
+
+    assert second.run_id != first.run_id
+    assert second.completed == 0
+    assert len(second.pending(QUESTIONS)) == len(QUESTIONS)
+    assert list(second.rows()) == []
+
+
+def test_resume_refuses_changed_settings(tmp_path):
+    output = str(tmp_path / "results.csv")
+    EvalRun(output, "run_evaluation.py", SETTINGS).finish("interrupted")
+
+    with pytest.raises(ValueError, match="prompt"):
+        EvalRun(output, "run_evaluation.py", {**SETTINGS, "prompt": "v2"}, resume=True)
+    with pytest.raises(ValueError, match="script"):
+        EvalRun(output, "run_evaluation_llm.py", SETTINGS, resume=True)
+
+
+def test_resume_without_manifest(tmp_path):
+    with pytest.raises(ValueError, match="No run to resume"):
+        EvalRun(str(tmp_path / "results.csv"), "run_evaluation.py", SETTINGS, resume=True)
@@ -0,0 +1,114 @@
+import pytest
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeRelationship, NodeWithScore, RelatedNodeInfo, TextNode
+
+from keyword_index import HybridRetriever, KeywordIndex, tokenize
+
+
+def make_node(node_id: str, doc_id: str, text: str) -> TextNode:
+    node = TextNode(id_=node_id, text=text)
+    node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=doc_id)
+    return node
+
+
+NODES = [
+    make_node("login", "login.md", "Die Anmeldung erfolgt unter app.cloudbase.de/login mit Ihrer E-Mail."),
+    make_node("billing", "billing.md", "Rechnungen stehen im Bereich Abrechnung bereit. Die Anmeldung ist nötig."),
+    make_node("team", "team.md", "Ihre Ansprechpartnerin ist Sabine Meier aus dem Support-Team."),
+    make_node("plans", "plans.md", "Der Business-Plan enthält Support, der Enterprise-Plan Support rund um die Uhr."),
+]
+
+
+class FixedRetriever(BaseRetriever):
+    """Returns the same ranking for every query."""
+
+    def __init__(self, node_ids: list[str]):
+        super().__init__()
+        self._nodes = [NodeWithScore(node=TextNode(id_=node_id, text=node_id), score=1.0) for node_id in node_ids]
+
+    def _retrieve(self, query_bundle):
+        return list(self._nodes)
+
+
+def test_tokenize_keeps_compounds_whole():
+    tokens = tokenize("Login: app.cloudbase.de/login")
+
+    assert "app.cloudbase.de/login" in tokens
+    assert {"app", "cloudbase", "de", "login"} <= set(tokens)
+
+
+def test_exact_string_ranks_first():
+    keywords = KeywordIndex.from_nodes(NODES)
+
+    hits = keywords.search("Wo ist app.cloudbase.de/login?", 4)
+
+    assert hits[0][0] == "login"
+    assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+
+
+def test_rare_term_outweighs_common_term():
+    keywords = KeywordIndex.from_nodes(NODES)
+
+    # "anmeldung" is in two chunks, "abrechnung" in one
+    hits = keywords.search("Anmeldung Abrechnung", 4)
+
+    assert [node_id for node_id, _ in hits] == ["billing", "login"]
+
+
+def test_repeated_term_scores_higher():
+    keywords = KeywordIndex.from_nodes(NODES)
+
+    hits = dict(keywords.search("Support", 4))
+
+    assert hits["plans"] > hits["team"]
+    assert "login" not in hits
+
+
+def test_no_shared_term_returns_nothing():
+    assert KeywordIndex.from_nodes(NODES).search("Kündigungsfrist", 4) == []
+
+
+def test_deleted_document_is_not_found():
+    keywords = KeywordIndex.from_nodes(NODES)
+
+    keywords.delete("team.md")
+
+    assert len(keywords) == 3
+    assert keywords.search("Sabine Meier", 4) == []
+    assert [node_id for node_id, _ in keywords.search("Support", 4)] == ["plans"]
+
+
+def test_compaction_on_persist_keeps_results(tmp_path):
+    keywords = KeywordIndex.from_nodes(NODES)
+    keywords.delete("team.md")
+    keywords.delete("plans.md")
+    keywords.delete("billing.md")
+    keywords.add([make_node("team2", "team.md", "Neue Ansprechpartnerin ist Sabine Meier.")])
+
+    keywords.persist(str(tmp_path))
+    loaded = KeywordIndex.load(str(tmp_path))
+
+    assert loaded.node_ids == ["login", "team2"]
+    assert loaded.deleted == set()
+    assert [node_id for node_id, _ in loaded.search("Sabine Meier", 4)] == ["team2"]
+    assert keywords.search("Anmeldung", 4) == loaded.search("Anmeldung", 4)
+
+
+def test_load_without_index_returns_none(tmp_path):
+    assert KeywordIndex.load(str(tmp_path)) is None
+
+
+def test_rrf_prefers_chunks_ranked_by_both():
+    hybrid = HybridRetriever([FixedRetriever(["a", "b", "c"]), FixedRetriever(["c", "d", "b"])], 3, rrf_k=60)
+
+    results = hybrid.retrieve("frage")
+
+    # b: 1/62 + 1/63 and c: 1/63 + 1/61 beat a: 1/61 alone
+    assert [r.node.node_id for r in results] == ["c", "b", "a"]
+    assert results[0].score == pytest.approx(1 / 63 + 1 / 61)
+
+
+def test_rrf_breaks_ties_by_first_seen():
+    hybrid = HybridRetriever([FixedRetriever(["a", "b"]), FixedRetriever(["b", "a"])], 2, rrf_k=60)
+
+    assert [r.node.node_id for r in hybrid.retrieve("frage")] == ["a", "b"]
@@ -0,0 +1,115 @@
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+REPO = Path(__file__).resolve().parents[1]
+OFFLINE = {
+    "RAG_LLM_PROVIDER": "mock",
+    "RAG_EMBED_PROVIDER": "hashing",
+    "RAG_MOCK_LATENCY_MS": "0",
+    "RAG_EMBED_CACHE": "",
+    "RAG_WARMUP": "lazy",
+}
+
+
+@pytest.fixture(scope="module")
+def main(tmp_path_factory):
+    """main.py imported in a fresh working directory (storage/, data/,
+    uploads/ are relative paths) with the offline providers."""
+    workdir = tmp_path_factory.mktemp("server")
+    shutil.copytree(REPO / "data", workdir / "data")
+    cwd = os.getcwd()
+    with pytest.MonkeyPatch.context() as mp:
+        for name, value in OFFLINE.items():
+            mp.setenv(name, value)
+        os.chdir(workdir)
+        try:
+            module = importlib.import_module("main")
+            if module.LLM_PROVIDER != "mock" or module.EMBED_PROVIDER != "hashing":
+                pytest.skip("providers.py was imported with other settings")
+            yield module
+        finally:
+            os.chdir(cwd)
+
+
+@pytest.fixture
+def cold(main, monkeypatch):
+    """main as right after import: no warm-up started."""
+    monkeypatch.setattr(main, "_warmup_task", None)
+    monkeypatch.setattr(main, "startup_timings", {})
+    return main
+
+
+def test_import_loads_no_models(tmp_path):
+    script = (
+        "import json, sys, main\n"
+        "from llama_index.core import Settings\n"
+        "heavy = ['torch', 'sentence_transformers', 'llama_index.embeddings.huggingface', 'llama_index.llms.openai']\n"
+        "print(json.dumps({'modules': [m for m in heavy if m in sys.modules],\n"
+        "                  'models': [Settings._llm is not None, Settings._embed_model is not None],\n"
+        "                  'index': main.index is not None}))\n"
+    )
+    env = {**os.environ, **OFFLINE, "RAG_LLM_PROVIDER": "openai", "RAG_EMBED_PROVIDER": "huggingface",
+           "PYTHONPATH": str(REPO)}
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=tmp_path, env=env, capture_output=True, text=True, check=True
+    )
+
+    state = json.loads(result.stdout.strip().splitlines()[-1])
+    assert state == {"modules": [], "models": [False, False], "index": False}
+    assert not (tmp_path / "storage").exists()
+
+
+def test_ready_is_503_before_warmup(cold):
+    with TestClient(cold.app) as client:  # RAG_WARMUP=lazy: the lifespan starts nothing
+        response = client.get("/ready")
+
+    assert response.status_code == 503
+    assert response.json()["status"] == "idle"
+    assert cold._warmup_task is None
+
+
+def test_first_request_warms_up_lazily(cold):
+    client = TestClient(cold.app)
+
+    info = client.get("/index_info")
+    ready = client.get("/ready")
+
+    assert info.status_code == 200
+    assert info.json()["embed_provider"] == "hashing"
+    assert cold.index is not None
+    assert ready.status_code == 200
+    assert ready.json()["status"] == "ready"
+    assert {"models", "index", "query_engine", "first_retrieval"} <= set(ready.json()["timings"])
+
+
+def test_blocking_warmup_is_ready_before_serving(cold, monkeypatch):
+    monkeypatch.setattr(cold, "WARMUP_MODE", "blocking")
+
+    with TestClient(cold.app) as client:
+        response = client.get("/ready")
+
+    assert response.status_code == 200
+
+
+def test_failed_warmup_is_reported(cold, monkeypatch):
+    def fail():
+        raise RuntimeError("OPENAI_API_KEY is not set")
+
+    monkeypatch.setattr(cold, "init_models", fail)
+    client = TestClient(cold.app)
+
+    query = client.get("/query", params={"query": "Was kostet Professional?"})
+    ready = client.get("/ready")
+
+    assert query.status_code == 503
+    assert query.json()["message"] == "Startup failed: OPENAI_API_KEY is not set"
+    assert ready.status_code == 503
+    assert ready.json()["status"] == "failed"
@@ -0,0 +1,127 @@
+import math
+import random
+
+import pandas as pd
+import pytest
+
+from scoring import expected_documents, mean_metrics, retrieval_metrics, score_table, summarize
+
+COLUMNS = ["retrieval_hit", "keyword_found", "keyword_missing", "keyword_score"]
+
+
+# Reference: the row-by-row scoring of run_evaluation.py before scoring.py
+def check_retrieval(expected_doc: str, retrieved_filenames: list) -> bool:
+    expected_doc = expected_doc.strip()
+    if expected_doc.upper() == "KEINE":
+        return True
+    expected_docs = [d.strip() for d in expected_doc.split("|")]
+    return any(doc in retrieved_filenames for doc in expected_docs)
+
+
+def check_keywords(expected_keywords: str, answer: str) -> tuple:
+    if not expected_keywords.strip():
+        return [], [], 1.0
+    keywords = [kw.strip() for kw in expected_keywords.split(",") if kw.strip()]
+    answer_lower = answer.lower()
+    found = [kw for kw in keywords if kw.lower() in answer_lower]
+    missing = [kw for kw in keywords if kw.lower() not in answer_lower]
+    ratio = len(found) / len(keywords) if keywords else 1.0
+    return found, missing, ratio
+
+
+def score_rows(df: pd.DataFrame) -> pd.DataFrame:
+    results = []
+    for _, row in df.iterrows():
+        retrieved = [f.strip() for f in row["retrieved_files"].split(",") if f.strip()]
+        hit = check_retrieval(row["erwartetes_dokument"], retrieved)
+        found, missing, ratio = check_keywords(row["erwartete_keywords"], row["rag_answer"])
+        results.append({
+            "retrieval_hit": "TRUE" if hit else "FALSE",
+            "keyword_found": ", ".join(found),
+            "keyword_missing": ", ".join(missing),
+            "keyword_score": f"{ratio:.2f}",
+        })
+    return pd.DataFrame(results, columns=COLUMNS)
+
+
+def results(*rows) -> pd.DataFrame:
+    return pd.DataFrame(
+        [dict(zip(("erwartetes_dokument", "erwartete_keywords", "rag_answer", "retrieved_files"), row)) for row in rows]
+    )
+
+
+def assert_same_as_row_by_row(df: pd.DataFrame):
+    expected = score_rows(df)[COLUMNS].reset_index(drop=True)
+    actual = score_table(df)[COLUMNS].reset_index(drop=True)
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_edge_cases_match_row_by_row():
+    assert_same_as_row_by_row(results(
+        ("login.md", "Passwort, E-Mail", "Setzen Sie Ihr PASSWORT zurück.", "login.md, billing.md"),
+        ("KEINE", "", "Dazu habe ich keine Informationen.", ""),
+        (" keine ", "Support", "", "team.md"),
+        ("plans.md | billing.md", "Business, Enterprise", "Der Enterprise-Plan.", "billing.md"),
+        ("plans.md|team.md", "Ärger, ÄNDERUNG", "Eine änderung", "login.md,  billing.md"),
+        ("team.md", " , ,", "Sabine Meier", "team.md"),
+        ("team.md", "Meier, Meier, meier", "Sabine Meier", "teams.md, team.md.bak"),
+        ("", "x", "x", "login.md"),
+    ))
+
+
+def test_random_table_matches_row_by_row():
+    rng = random.Random(7)
+    files = [f"doc{i}.md" for i in range(6)]
+    words = ["Preis", "Login", "Support", "Team", "Rechnung", "Plan", "SSO", "API-Key"]
+    rows = []
+    for _ in range(500):
+        keywords = rng.sample(words, rng.randint(0, 4))
+        expected = "KEINE" if rng.random() < 0.1 else " | ".join(rng.sample(files, rng.randint(1, 2)))
+        answer = " ".join(rng.choice([w.upper(), w.lower(), w]) for w in rng.sample(words, rng.randint(0, 5)))
+        rows.append((expected, ", ".join(keywords), answer, ", ".join(rng.sample(files, rng.randint(0, 3)))))
+
+    assert_same_as_row_by_row(results(*rows))
+
+
+def test_score_table_columns():
+    scored = score_table(results(("a.md", "eins, zwei, drei", "Eins und zwei", "b.md, a.md")))
+
+    row = scored.iloc[0]
+    assert row["retrieval_hit"] == "TRUE"
+    assert row["keyword_found"] == "eins, zwei"
+    assert row["keyword_missing"] == "drei"
+    assert row["keyword_score"] == "0.67"
+
+
+def test_summarize_means_unrounded_scores():
+    scored = score_table(results(
+        ("a.md", "eins, zwei, drei", "eins", "a.md"),
+        ("a.md", "eins", "eins", "a.md"),
+        ("a.md", "eins", "zwei", "b.md"),
+    ))
+
+    summary = summarize(scored)
+
+    assert summary == {"total": 3, "retrieval_hits": 2, "keyword_score": pytest.approx(4 / 9), "perfect": 1}
+
+
+def test_expected_documents():
+    assert expected_documents(" a.md | b.md ") == ["a.md", "b.md"]
+    assert expected_documents("keine") == []
+    assert expected_documents("") == []
+
+
+def test_retrieval_metrics():
+    metrics = retrieval_metrics(["a.md", "b.md"], ["c.md", "a.md", "a.md", "b.md"], [1, 3])
+
+    assert metrics["hit@1"] == 0.0
+    assert metrics["hit@3"] == 1.0
+    assert metrics["recall@3"] == 0.5
+    assert metrics["mrr"] == 0.5
+    # a.md counted once, at its first chunk (rank 2), against the ideal ranks 1 and 2
+    assert metrics["ndcg@3"] == pytest.approx((1 / math.log2(3)) / (1 + 1 / math.log2(3)))
+
+
+def test_mean_metrics_skips_unscored_rows():
+    assert mean_metrics([{"mrr": 1.0}, {}, {"mrr": 0.5}]) == {"mrr": 0.75}
+    assert mean_metrics([{}]) == {}
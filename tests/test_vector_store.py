@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+import vector_store
+from vector_store import AnnVectorStore
+
+BACKENDS = ["flat", pytest.param("hnsw", marks=pytest.mark.skipif(
+    vector_store.hnswlib is None, reason="hnswlib not installed"))]
+
+
+def make_node(node_id: str, doc_id: str, embedding: list) -> TextNode:
+    node = TextNode(id_=node_id, text=f"text of {node_id}", embedding=embedding)
+    node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=doc_id)
+    return node
+
+
+def basis(i: int, dim: int = 8) -> list:
+    vector = np.full(dim, 0.01)
+    vector[i] = 1.0
+    return vector.tolist()
+
+
+def query_ids(store: AnnVectorStore, embedding: list, k: int) -> list:
+    return store.query(VectorStoreQuery(query_embedding=embedding, similarity_top_k=k)).ids
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_query_returns_nearest_first(tmp_path, backend):
+    store = AnnVectorStore(persist_dir=str(tmp_path), backend=backend)
+    store.add([make_node(f"n{i}", f"doc{i}", basis(i)) for i in range(4)])
+
+    result = store.query(VectorStoreQuery(query_embedding=basis(2), similarity_top_k=2))
+
+    assert result.ids[0] == "n2"
+    assert result.nodes[0].get_content() == "text of n2"
+    assert result.similarities[0] == pytest.approx(1.0, abs=1e-3)
+    assert len(result.ids) == 2
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_deleted_document_is_tombstoned(tmp_path, backend):
+    store = AnnVectorStore(persist_dir=str(tmp_path), backend=backend)
+    store.add([make_node("a1", "a", basis(0)), make_node("a2", "a", basis(1)), make_node("b1", "b", basis(2))])
+    store.add([make_node(f"c{i}", "c", basis(3 + i)) for i in range(3)])
+    store.persist()
+
+    store.delete("a")
+
+    assert store.num_vectors == 4
+    assert "a1" not in query_ids(store, basis(0), 6)
+    assert store.get_nodes(["a1", "b1"])[0].node_id == "b1"
+    assert store.get_embeddings(["a2"]) == {}
+    store.persist()
+    meta = vector_store._read_meta(str(tmp_path))
+    assert meta["rows"] == 6
+    assert meta["deleted"] == [0, 1]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_persist_compacts_when_most_rows_are_dead(tmp_path, backend):
+    store = AnnVectorStore(persist_dir=str(tmp_path), backend=backend)
+    store.add([make_node(f"a{i}", "a", basis(i)) for i in range(3)])
+    store.add([make_node("b1", "b", basis(3)), make_node("c1", "c", basis(4))])
+    store.delete("a")
+    store.persist()
+
+    meta = vector_store._read_meta(str(tmp_path))
+    assert meta["rows"] == 2
+    assert meta["deleted"] == []
+    assert query_ids(store, basis(4), 5) == ["c1", "b1"]
+    # Rows added after a compaction keep the renumbered row labels consistent
+    store.add([make_node("d1", "d", basis(5))])
+    assert query_ids(store, basis(5), 1) == ["d1"]
+    store.delete("b")
+    assert sorted(n.node_id for n in store.get_nodes()) == ["c1", "d1"]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_reload_sees_only_committed_rows(tmp_path, backend):
+    store = AnnVectorStore(persist_dir=str(tmp_path), backend=backend)
+    store.add([make_node("a1", "a", basis(0)), make_node("b1", "b", basis(1))])
+    store.delete("a")
+    store.persist()
+    store.add([make_node("c1", "c", basis(2))])  # never committed
+    store.close()
+
+    reloaded = AnnVectorStore(persist_dir=str(tmp_path), backend=backend)
+
+    assert reloaded.num_vectors == 1
+    assert [n.node_id for n in reloaded.get_nodes()] == ["b1"]
+    assert query_ids(reloaded, basis(2), 3) == ["b1"]
+    np.testing.assert_allclose(
+        reloaded.get_embeddings(["b1"])["b1"], np.array(basis(1)) / np.linalg.norm(basis(1)), rtol=1e-6
+    )
+
+
+def test_read_only_store_does_not_write(tmp_path):
+    store = AnnVectorStore(persist_dir=str(tmp_path), backend="flat")
+    store.add([make_node("a1", "a", basis(0))])
+    store.persist()
+
+    reader = AnnVectorStore(persist_dir=str(tmp_path), backend="flat", read_only=True)
+
+    assert query_ids(reader, basis(0), 1) == ["a1"]
+    with pytest.raises(RuntimeError):
+        reader.delete("a")
+
+
+def test_filters_restrict_exact_search(tmp_path):
+    store = AnnVectorStore(persist_dir=str(tmp_path), backend="flat")
+    store.add([make_node(f"n{i}", f"doc{i % 2}", basis(i)) for i in range(4)])
+
+    result = store.query(VectorStoreQuery(query_embedding=basis(0), similarity_top_k=4, doc_ids=["doc1"]))
+
+    assert sorted(result.ids) == ["n1", "n3"]
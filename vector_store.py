@@ -0,0 +1,676 @@
+"""
+CloudBase RAG — ANN vector store
+
+Vector store backend for large corpora. SimpleVectorStore keeps every
+embedding as a Python list in one JSON file (and the node texts in
+docstore.json) and compares the query against all of them. This store
+keeps both in binary, append-only files in storage/:
+
+    ann_vectors.bin   embedding matrix, float32 or float16, one row per node
+    ann_offsets.bin   int64 (offset, length) of each row's node record
+    ann_nodes.seg     node records (JSON: text, metadata, relationships)
+    ann_ids.jsonl     [node id, ref doc id] per row, only read for deletes
+    ann_hnsw.N.bin    HNSW graph (hnsw backend), N counts the saved versions
+    ann_meta.json     committed row count, tombstones and settings
+
+Startup memory-maps the matrix and the offset table instead of parsing
+JSON, so it takes the same time for any corpus size; node records are read
+only for the top k results. /ingest appends rows and commits them by
+replacing the small meta file. Deleted rows stay as tombstones until more
+than half of the rows are dead, then the files are compacted.
+
+Several processes can read one store while a single writer appends to it
+(main.py serializes writers with a file lock). Readers open the store
+with read_only=True and see the rows committed when they opened it:
+appends land beyond their mapped range, and compaction and graph saves
+write new files instead of changing the ones readers have open.
+
+Queries go through an HNSW graph (hnswlib, optional dependency, loaded or
+built on the first query) or, with the "flat" backend, one exact
+matrix-vector product over the mapped matrix.
+
+Settings:
+    RAG_VECTOR_STORE          simple (LlamaIndex default), flat or hnsw
+    RAG_VECTOR_DTYPE          float32 or float16 storage of the matrix
+    RAG_HNSW_M                graph links per node (default 16)
+    RAG_HNSW_EF_CONSTRUCTION  candidate list while building (default 200)
+    RAG_HNSW_EF_SEARCH        candidate list per query (default 64)
+
+Switching backends needs no rebuild: load_vector_store() converts an
+existing storage/ between the JSON and the binary format on startup.
+"""
+
+import json
+import os
+import threading
+from typing import Any
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.docstore.types import DEFAULT_PERSIST_FNAME as DOCSTORE_FNAME
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+from llama_index.core.storage.index_store import SimpleIndexStore
+from llama_index.core.storage.index_store.types import DEFAULT_PERSIST_FNAME as INDEX_STORE_FNAME
+from llama_index.core.vector_stores.simple import SimpleVectorStore, SimpleVectorStoreData
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+VECTOR_STORE = os.getenv("RAG_VECTOR_STORE", "simple")
+VECTOR_DTYPE = os.getenv("RAG_VECTOR_DTYPE", "float32")
+HNSW_M = int(os.getenv("RAG_HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+
+BACKENDS = ("simple", "flat", "hnsw")
+FORMAT_VERSION = 2
+SIMPLE_FNAME = "default__vector_store.json"
+META_FNAME = "ann_meta.json"
+VECTORS_FNAME = "ann_vectors.bin"
+OFFSETS_FNAME = "ann_offsets.bin"
+SEGMENT_FNAME = "ann_nodes.seg"
+IDS_FNAME = "ann_ids.jsonl"
+GRAPH_FNAME = "ann_hnsw.bin"  # graph file name before versioned graph files
+DATA_FNAMES = (VECTORS_FNAME, OFFSETS_FNAME, SEGMENT_FNAME, IDS_FNAME)
+LEGACY_VECTORS_FNAME = "ann_vectors.npy"  # single-file format before FORMAT_VERSION 2
+
+
+def _unit_rows(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def _graph_files(persist_dir: str) -> list[str]:
+    return [
+        name for name in os.listdir(persist_dir)
+        if name.startswith("ann_hnsw.") and name.endswith(".bin")
+    ]
+
+
+def _read_meta(persist_dir: str) -> dict | None:
+    path = os.path.join(persist_dir, META_FNAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class AnnVectorStore(BasePydanticVectorStore):
+    """Cosine-similarity store over a memory-mapped embedding matrix.
+
+    Rows are appended in insertion order and row i is label i in the HNSW
+    graph. Rows added since the last persist() are visible in this process
+    but only become part of the store on disk once persist() commits them.
+    A read_only store never writes to persist_dir.
+    """
+
+    stores_text: bool = True
+    persist_dir: str
+    backend: str = "hnsw"
+    dtype: str = "float32"
+    m: int = HNSW_M
+    ef_construction: int = HNSW_EF_CONSTRUCTION
+    ef_search: int = HNSW_EF_SEARCH
+    read_only: bool = False
+
+    _dim: int = PrivateAttr(default=0)
+    _rows: int = PrivateAttr(default=0)
+    _committed_rows: int = PrivateAttr(default=0)
+    _segment_bytes: int = PrivateAttr(default=0)
+    _ids_bytes: int = PrivateAttr(default=0)
+    _deleted: set = PrivateAttr(default_factory=set)
+    _vectors: Any = PrivateAttr(default=None)
+    _offsets: Any = PrivateAttr(default=None)
+    _readers: dict = PrivateAttr(default_factory=dict)
+    _writers: dict = PrivateAttr(default_factory=dict)
+    _ref_rows: Any = PrivateAttr(default=None)
+    _id_rows: Any = PrivateAttr(default=None)
+    _graph: Any = PrivateAttr(default=None)
+    _graph_meta: dict = PrivateAttr(default_factory=dict)
+    _graph_dirty: bool = PrivateAttr(default=False)
+    _lock: Any = PrivateAttr(default_factory=threading.RLock)
+
+    def __init__(self, persist_dir: str, backend: str = "hnsw", dtype: str = VECTOR_DTYPE, **kwargs: Any):
+        if backend not in ("flat", "hnsw"):
+            raise ValueError(f"Unknown ANN backend '{backend}' (expected flat or hnsw)")
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported vector dtype '{dtype}' (expected float32 or float16)")
+        if backend == "hnsw" and hnswlib is None:
+            raise ImportError("RAG_VECTOR_STORE=hnsw needs hnswlib: pip install hnswlib")
+        super().__init__(persist_dir=persist_dir, backend=backend, dtype=dtype, **kwargs)
+        os.makedirs(persist_dir, exist_ok=True)
+        self._open()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "AnnVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return self._graph
+
+    @property
+    def num_vectors(self) -> int:
+        """Live rows; not __len__, since StorageContext tests stores for truthiness."""
+        return self._rows - len(self._deleted)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.persist_dir, name)
+
+    # -- files --------------------------------------------------------------
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError(f"Vector store in {self.persist_dir} was opened read-only")
+
+    def _open(self):
+        """Map the committed rows; bytes of an interrupted, uncommitted append are cut off."""
+        meta = _read_meta(self.persist_dir)
+        if meta is None:
+            self._check_writable()
+            for name in DATA_FNAMES:
+                open(self._path(name), "wb").close()
+            self._write_meta()
+            return
+
+        stored_dtype = meta["dtype"]
+        self._dim = meta["dim"]
+        self._rows = self._committed_rows = meta["rows"]
+        self._segment_bytes = meta["segment_bytes"]
+        self._ids_bytes = meta["ids_bytes"]
+        self._deleted = set(meta["deleted"])
+        self._graph_meta = meta.get("graph", {})
+        if self.read_only:
+            # Bytes past the committed sizes belong to a writer; leave them alone
+            self.dtype = stored_dtype
+            self._open_readers()
+            self._map()
+            return
+        itemsize = np.dtype(stored_dtype).itemsize
+        for name, size in (
+            (VECTORS_FNAME, self._rows * self._dim * itemsize),
+            (OFFSETS_FNAME, self._rows * 16),
+            (SEGMENT_FNAME, self._segment_bytes),
+            (IDS_FNAME, self._ids_bytes),
+        ):
+            if os.path.getsize(self._path(name)) > size:
+                os.truncate(self._path(name), size)
+        self._open_readers()
+        if stored_dtype != self.dtype:
+            # RAG_VECTOR_DTYPE changed: rewrite the matrix once in the new dtype
+            self._map(stored_dtype)
+            self._rewrite()
+            self._write_meta()
+            self._remove_stale_graphs()
+        else:
+            self._map()
+
+    def _map(self, dtype: str | None = None):
+        if self._rows == 0:
+            self._vectors = self._offsets = None
+            return
+        self._vectors = np.memmap(
+            self._path(VECTORS_FNAME), dtype=dtype or self.dtype, mode="r", shape=(self._rows, self._dim)
+        )
+        self._offsets = np.memmap(self._path(OFFSETS_FNAME), dtype=np.int64, mode="r", shape=(self._rows, 2))
+
+    def _open_readers(self):
+        # Held open (not reopened by path) so a compaction by another process
+        # can't swap the files under this store
+        self._readers = {name: open(self._path(name), "rb") for name in (SEGMENT_FNAME, IDS_FNAME)}
+
+    def _pread(self, name: str, length: int, offset: int) -> bytes:
+        return os.pread(self._readers[name].fileno(), length, offset)
+
+    def _read_ids(self) -> list:
+        """[node id, ref doc id] of every row."""
+        lines = self._pread(IDS_FNAME, self._ids_bytes, 0).decode("utf-8").splitlines()
+        return [json.loads(line) for line in lines]
+
+    def _writer(self, name: str):
+        if name not in self._writers:
+            self._writers[name] = open(self._path(name), "ab")
+        return self._writers[name]
+
+    def _close_files(self):
+        for f in (*self._writers.values(), *self._readers.values()):
+            f.close()
+        self._writers, self._readers = {}, {}
+        self._vectors = self._offsets = None
+
+    def _write_meta(self):
+        meta = {
+            "format": FORMAT_VERSION,
+            "dtype": self.dtype,
+            "dim": self._dim,
+            "rows": self._rows,
+            "segment_bytes": self._segment_bytes,
+            "ids_bytes": self._ids_bytes,
+            "deleted": sorted(self._deleted),
+            "graph": self._graph_meta,
+        }
+        tmp_path = self._path(f"{META_FNAME}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._path(META_FNAME))
+        self._committed_rows = self._rows
+
+    # -- writes -------------------------------------------------------------
+
+    def _append(self, records: list, vectors: np.ndarray):
+        """Append rows; records are (node id, ref doc id, serialized node) tuples."""
+        rows = _unit_rows(vectors)
+        n, self._dim = len(rows), rows.shape[1]
+        offsets = np.empty((n, 2), dtype=np.int64)
+        segment = self._writer(SEGMENT_FNAME)
+        for i, (_, _, data) in enumerate(records):
+            offsets[i] = (self._segment_bytes, len(data))
+            segment.write(data)
+            self._segment_bytes += len(data)
+        ids = "".join(json.dumps([node_id, ref_doc_id]) + "\n" for node_id, ref_doc_id, _ in records)
+        ids = ids.encode("utf-8")
+        self._writer(IDS_FNAME).write(ids)
+        self._ids_bytes += len(ids)
+        self._writer(VECTORS_FNAME).write(rows.astype(self.dtype).tobytes())
+        self._writer(OFFSETS_FNAME).write(offsets.tobytes())
+        for f in self._writers.values():
+            f.flush()
+        if not self._readers:
+            self._open_readers()
+
+        start = self._rows
+        self._rows += n
+        self._map()
+        if self._ref_rows is not None:
+            for i, (_, ref_doc_id, _) in enumerate(records):
+                self._ref_rows.setdefault(ref_doc_id, []).append(start + i)
+        if self._id_rows is not None:
+            for i, (node_id, _, _) in enumerate(records):
+                self._id_rows[node_id] = start + i
+        if self._graph is not None:
+            self._graph_add(rows, np.arange(start, start + n))
+
+    def add(self, nodes: list, **add_kwargs: Any) -> list[str]:
+        if not nodes:
+            return []
+        records = []
+        for node in nodes:
+            stored = node.model_copy()
+            stored.embedding = None
+            data = json.dumps(doc_to_json(stored), ensure_ascii=False).encode("utf-8")
+            records.append((node.node_id, node.ref_doc_id, data))
+        with self._lock:
+            self._check_writable()
+            self._append(records, [node.get_embedding() for node in nodes])
+        return [node.node_id for node in nodes]
+
+    def _load_ref_rows(self) -> dict:
+        if self._ref_rows is None:
+            ref_rows = {}
+            for row, (_, ref_doc_id) in enumerate(self._read_ids()):
+                ref_rows.setdefault(ref_doc_id, []).append(row)
+            self._ref_rows = ref_rows
+        return self._ref_rows
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        with self._lock:
+            self._check_writable()
+            for row in self._load_ref_rows().pop(ref_doc_id, []):
+                if row not in self._deleted:
+                    self._deleted.add(row)
+                    if self._graph is not None:
+                        self._graph.mark_deleted(row)
+                        self._graph_dirty = True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._check_writable()
+            self._close_files()
+            for name in DATA_FNAMES:
+                # Unlink first: readers in other processes keep the old inode
+                os.remove(self._path(name))
+                open(self._path(name), "wb").close()
+            self._rows = self._segment_bytes = self._ids_bytes = 0
+            self._deleted, self._ref_rows, self._id_rows = set(), {}, {}
+            self._graph, self._graph_meta = None, self._graph_generation()
+            self._write_meta()
+            self._remove_stale_graphs()
+
+    # -- reads --------------------------------------------------------------
+
+    def get_nodes(self, node_ids: list[str] | None = None, filters: Any = None) -> list:
+        """Live nodes by id (all live nodes without node_ids), in the given order."""
+        if filters is not None:
+            raise ValueError("Metadata filters are not supported by the ANN store")
+        with self._lock:
+            if node_ids is None:
+                return [node for node, _ in self.iter_nodes()]
+            if self._id_rows is None:
+                self._id_rows = {node_id: row for row, (node_id, _) in enumerate(self._read_ids())}
+            rows = [self._id_rows.get(node_id) for node_id in node_ids]
+            return [self._read_node(row) for row in rows if row is not None and row not in self._deleted]
+
+    def get_embeddings(self, node_ids: list[str]) -> dict:
+        """Stored vectors of the given live nodes, by node id."""
+        with self._lock:
+            if self._id_rows is None:
+                self._id_rows = {node_id: row for row, (node_id, _) in enumerate(self._read_ids())}
+            embeddings = {}
+            for node_id in node_ids:
+                row = self._id_rows.get(node_id)
+                if row is not None and row not in self._deleted:
+                    embeddings[node_id] = np.array(self._vectors[row], dtype=np.float32)
+            return embeddings
+
+    def _read_node(self, row: int):
+        offset, length = self._offsets[row]
+        return json_to_doc(json.loads(self._pread(SEGMENT_FNAME, int(length), int(offset))))
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"Query mode {query.mode} is not supported by the ANN store")
+        if query.filters is not None:
+            raise ValueError("Metadata filters are not supported by the ANN store")
+        k = min(query.similarity_top_k, self.num_vectors)
+        if k <= 0 or query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        # VectorIndexRetriever passes the (empty) index struct node list for
+        # stores that keep their own text, so an empty list means "no filter"
+        node_ids, doc_ids = query.node_ids or None, query.doc_ids or None
+        q = _unit_rows(query.query_embedding)[0]
+        with self._lock:
+            if self.backend == "hnsw" and node_ids is None and doc_ids is None:
+                graph = self._ensure_graph()
+                if self._graph_dirty and self._rows == self._committed_rows and not self.read_only:
+                    self.persist()  # save the graph now so the next start doesn't rebuild it
+                graph.set_ef(max(self.ef_search, k))
+                labels, distances = graph.knn_query(q, k=k)
+                rows, scores = labels[0], 1.0 - distances[0]
+            else:
+                rows, scores = self._exact_top_k(q, k, node_ids, doc_ids)
+            nodes = [self._read_node(int(r)) for r in rows]
+
+        return VectorStoreQueryResult(
+            nodes=nodes, similarities=[float(s) for s in scores], ids=[n.node_id for n in nodes]
+        )
+
+    def _exact_top_k(self, q: np.ndarray, k: int, node_ids=None, doc_ids=None) -> tuple:
+        """Brute-force top k over the live rows (optionally restricted to some ids)."""
+        # Blocks keep float16 upcasts small; numpy has no half-precision BLAS
+        scores = np.concatenate([
+            np.asarray(self._vectors[i:i + 1024], dtype=np.float32) @ q
+            for i in range(0, self._rows, 1024)
+        ])
+        candidates = np.ones(self._rows, dtype=bool)
+        if self._deleted:
+            candidates[list(self._deleted)] = False
+        if doc_ids is not None:
+            ref_rows = self._load_ref_rows()
+            wanted = np.zeros(self._rows, dtype=bool)
+            for doc_id in doc_ids:
+                wanted[ref_rows.get(doc_id, [])] = True
+            candidates &= wanted
+        if node_ids is not None:
+            wanted = set(node_ids)
+            candidates &= np.array([node_id in wanted for node_id, _ in self._read_ids()], dtype=bool)
+        rows = np.flatnonzero(candidates)
+        if not len(rows):
+            return rows, np.empty(0, dtype=np.float32)
+        scores = scores[rows]
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return rows[top], scores[top]
+
+    # -- HNSW graph ---------------------------------------------------------
+
+    def _graph_add(self, vectors: np.ndarray, labels: np.ndarray):
+        needed = int(labels.max()) + 1
+        if needed > self._graph.get_max_elements():
+            self._graph.resize_index(max(needed, 2 * self._graph.get_max_elements()))
+        self._graph.add_items(vectors, labels)
+        self._graph_dirty = True
+
+    def _ensure_graph(self):
+        """Load the persisted graph (adding rows appended since) or build it from the matrix."""
+        if self._graph is not None:
+            return self._graph
+        params = {"m": self.m, "ef_construction": self.ef_construction}
+        saved = self._graph_meta
+        graph = hnswlib.Index(space="ip", dim=self._dim)
+        start, known_deleted = 0, set()
+        if saved.get("params") == params and saved.get("rows", 0) <= self._rows:
+            try:
+                # The writer may have saved a newer graph and removed this one since
+                graph.load_index(self._path(saved.get("file", GRAPH_FNAME)), max_elements=max(self._rows, 1))
+                start, known_deleted = saved["rows"], set(saved["deleted"])
+            except RuntimeError:
+                graph = hnswlib.Index(space="ip", dim=self._dim)
+        if start == 0:
+            graph.init_index(max_elements=max(self._rows, 1024), M=self.m, ef_construction=self.ef_construction)
+        self._graph = graph
+        self._graph_meta = {**saved, "params": params, "rows": start, "deleted": []}
+        for i in range(start, self._rows, 8192):
+            labels = np.arange(i, min(i + 8192, self._rows))
+            self._graph_add(np.asarray(self._vectors[labels], dtype=np.float32), labels)
+        for row in self._deleted - known_deleted:
+            graph.mark_deleted(row)
+            self._graph_dirty = True
+        return graph
+
+    # -- persistence --------------------------------------------------------
+
+    def persist(self, persist_path: str | None = None, fs: Any = None) -> None:
+        """Commit appended rows and tombstones.
+
+        StorageContext passes the path it would use for the JSON store; the
+        files always go to self.persist_dir.
+        """
+        with self._lock:
+            self._check_writable()
+            for f in self._writers.values():
+                f.flush()
+                os.fsync(f.fileno())
+            if self._deleted and len(self._deleted) * 2 > self._rows:
+                self._rewrite()
+            if self.backend == "hnsw" and self._rows:
+                # Readers load the saved graph; keep it in step with the rows
+                self._ensure_graph()
+            if self._graph is not None and self._graph_dirty:
+                # Under a new name: readers may still be about to load the old one
+                generation = self._graph_meta.get("generation", 0) + 1
+                name = f"ann_hnsw.{generation}.bin"
+                self._graph.save_index(self._path(name))
+                self._graph_meta = {
+                    **self._graph_meta, "file": name, "generation": generation,
+                    "rows": self._rows, "deleted": sorted(self._deleted),
+                }
+                self._graph_dirty = False
+            self._write_meta()
+            self._remove_stale_graphs()
+
+    def _graph_generation(self) -> dict:
+        # Graph file names are never reused, even after the graph is dropped
+        return {"generation": self._graph_meta.get("generation", 0)}
+
+    def _remove_stale_graphs(self):
+        current = self._graph_meta.get("file", GRAPH_FNAME if "params" in self._graph_meta else None)
+        for name in _graph_files(self.persist_dir):
+            if name != current:
+                os.remove(self._path(name))
+
+    def _rewrite(self):
+        """Copy the live rows into fresh files (compaction or dtype change).
+
+        The new files are renamed over the old ones, so readers in other
+        processes keep the files they mapped.
+        """
+        ids = self._read_ids()
+        live = [row for row in range(self._rows) if row not in self._deleted]
+        tmp = {name: self._path(f"{name}.tmp") for name in DATA_FNAMES}
+        offsets = np.empty((len(live), 2), dtype=np.int64)
+        segment_bytes = ids_bytes = 0
+        with (
+            open(tmp[VECTORS_FNAME], "wb") as vectors,
+            open(tmp[SEGMENT_FNAME], "wb") as segment,
+            open(tmp[IDS_FNAME], "wb") as id_lines,
+        ):
+            for i in range(0, len(live), 8192):
+                block = live[i:i + 8192]
+                for j, row in enumerate(block):
+                    offset, length = self._offsets[row]
+                    data = self._pread(SEGMENT_FNAME, int(length), int(offset))
+                    offsets[i + j] = (segment_bytes, len(data))
+                    segment.write(data)
+                    segment_bytes += len(data)
+                    line = (json.dumps(ids[row]) + "\n").encode("utf-8")
+                    id_lines.write(line)
+                    ids_bytes += len(line)
+                vectors.write(np.asarray(self._vectors[block], dtype=np.float32).astype(self.dtype).tobytes())
+            with open(tmp[OFFSETS_FNAME], "wb") as f:
+                f.write(offsets.tobytes())
+                os.fsync(f.fileno())
+            for f in (vectors, segment, id_lines):
+                f.flush()
+                os.fsync(f.fileno())
+
+        self._close_files()
+        for name in DATA_FNAMES:
+            os.replace(tmp[name], self._path(name))
+        self._rows, self._segment_bytes, self._ids_bytes = len(live), segment_bytes, ids_bytes
+        self._deleted, self._ref_rows, self._id_rows = set(), None, None
+        self._graph, self._graph_meta, self._graph_dirty = None, self._graph_generation(), False
+        self._open_readers()
+        self._map()
+
+    def iter_nodes(self):
+        """Yield (node, embedding) for every live row."""
+        for row in range(self._rows):
+            if row not in self._deleted:
+                yield self._read_node(row), np.array(self._vectors[row], dtype=np.float32)
+
+    def close(self):
+        with self._lock:
+            self._close_files()
+
+
+# ---------------------------------------------------------------------------
+# Conversion between the JSON stores and the binary format
+# ---------------------------------------------------------------------------
+
+def _json_to_binary(persist_dir: str, backend: str, legacy_meta: dict | None) -> AnnVectorStore:
+    docstore = SimpleDocumentStore.from_persist_dir(persist_dir)
+    if legacy_meta is not None:
+        # Matrix + id list written by the first version of this store
+        node_ids = legacy_meta["node_ids"]
+        vectors = np.load(os.path.join(persist_dir, LEGACY_VECTORS_FNAME)).astype(np.float32)
+        for name in (LEGACY_VECTORS_FNAME, META_FNAME, *_graph_files(persist_dir)):
+            if os.path.exists(os.path.join(persist_dir, name)):
+                os.remove(os.path.join(persist_dir, name))
+    else:
+        # Plain json.load: SimpleVectorStore's dataclass decoding is far slower
+        with open(os.path.join(persist_dir, SIMPLE_FNAME), encoding="utf-8") as f:
+            embedding_dict = json.load(f)["embedding_dict"]
+        node_ids = list(embedding_dict)
+        vectors = np.array([embedding_dict[n] for n in node_ids], dtype=np.float32)
+        del embedding_dict
+
+    store = AnnVectorStore(persist_dir=persist_dir, backend=backend)
+    doc_hashes = {}
+    for i in range(0, len(node_ids), 1024):
+        nodes = docstore.get_nodes(node_ids[i:i + 1024])
+        for node, vector in zip(nodes, vectors[i:i + 1024]):
+            node.embedding = vector.tolist()
+            doc_hashes[node.ref_doc_id] = docstore.get_document_hash(node.ref_doc_id)
+        store.add(nodes)
+    store.persist()
+
+    # Node texts now live in the segment file; keep only the document hashes
+    slim = SimpleDocumentStore()
+    slim.set_document_hashes({doc_id: h for doc_id, h in doc_hashes.items() if h})
+    slim.persist(os.path.join(persist_dir, DOCSTORE_FNAME))
+    index_store = SimpleIndexStore.from_persist_dir(persist_dir)
+    for struct in index_store.index_structs():
+        struct.nodes_dict = {}
+        index_store.add_index_struct(struct)
+    index_store.persist(os.path.join(persist_dir, INDEX_STORE_FNAME))
+    if os.path.exists(os.path.join(persist_dir, SIMPLE_FNAME)):
+        os.remove(os.path.join(persist_dir, SIMPLE_FNAME))
+    return store
+
+
+def _binary_to_json(persist_dir: str):
+    store = AnnVectorStore(persist_dir=persist_dir, backend="flat")
+    docstore = SimpleDocumentStore.from_persist_dir(persist_dir)
+    index_store = SimpleIndexStore.from_persist_dir(persist_dir)
+    structs = index_store.index_structs()
+    data = SimpleVectorStoreData()
+    for node, vector in store.iter_nodes():
+        docstore.add_documents([node], allow_update=True)
+        for struct in structs:
+            struct.add_node(node, text_id=node.node_id)
+        data.embedding_dict[node.node_id] = vector.tolist()
+        data.text_id_to_ref_doc_id[node.node_id] = node.ref_doc_id
+    store.close()
+
+    SimpleVectorStore(data=data).persist(os.path.join(persist_dir, SIMPLE_FNAME))
+    docstore.persist(os.path.join(persist_dir, DOCSTORE_FNAME))
+    for struct in structs:
+        index_store.add_index_struct(struct)
+    index_store.persist(os.path.join(persist_dir, INDEX_STORE_FNAME))
+    for name in (META_FNAME, *DATA_FNAMES, *_graph_files(persist_dir)):
+        if os.path.exists(os.path.join(persist_dir, name)):
+            os.remove(os.path.join(persist_dir, name))
+
+
+def convert_storage(persist_dir: str, backend: str = VECTOR_STORE):
+    """Convert an existing storage/ written in the other format to the
+    backend's format (parsing the JSON files one last time). A no-op when
+    it is already in that format."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown RAG_VECTOR_STORE '{backend}' (expected one of {', '.join(BACKENDS)})")
+    meta = _read_meta(persist_dir)
+    if backend == "simple":
+        if meta is not None and meta.get("format") == FORMAT_VERSION:
+            print("Converting binary vector store back to JSON...")
+            _binary_to_json(persist_dir)
+    elif meta is None or meta.get("format") != FORMAT_VERSION:
+        print(f"Migrating {persist_dir} to the binary {backend} vector store...")
+        _json_to_binary(persist_dir, backend, legacy_meta=meta).close()
+
+
+def load_vector_store(
+    persist_dir: str, backend: str = VECTOR_STORE, read_only: bool = False
+) -> BasePydanticVectorStore | None:
+    """Vector store for an existing storage/ directory in the configured backend.
+
+    Converts the directory first unless read_only, in which case it must
+    already be in the backend's format. Returns None when the plain JSON
+    stores can be loaded as usual.
+    """
+    if not read_only:
+        convert_storage(persist_dir, backend)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown RAG_VECTOR_STORE '{backend}' (expected one of {', '.join(BACKENDS)})")
+    if backend == "simple":
+        return None
+    return AnnVectorStore(persist_dir=persist_dir, backend=backend, read_only=read_only)
+
+
+def create_vector_store(persist_dir: str, backend: str = VECTOR_STORE) -> BasePydanticVectorStore | None:
+    """Empty store for a cold build; None means LlamaIndex's default."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown RAG_VECTOR_STORE '{backend}' (expected one of {', '.join(BACKENDS)})")
+    return None if backend == "simple" else AnnVectorStore(persist_dir=persist_dir, backend=backend)